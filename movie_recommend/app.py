@@ -1,35 +1,89 @@
-import json
+import time
+import threading
 
 import pandas as pd
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, g, jsonify, render_template, request
 
 from movie_recommend.movie_recommendations import MovieRecommend
+from movie_recommend.utils.api_payloads import (
+    InvalidRequest,
+    batch_response,
+    parse_batch_request,
+    parse_form_request,
+    parse_profile_request,
+    parse_single_request,
+    profile_response,
+    request_data,
+    single_response
+)
+from movie_recommend.utils.metrics import CONTENT_TYPE, HTTP_REQUEST_SECONDS, metrics
+from movie_recommend.utils.model_registry import MODEL_TYPES, registry
 
 # Select the size of the movie database
 #dataset_size = "small"
 dataset_size = "full"
 
+# Load all models at startup (in the background, see /ready) instead of on the first request
+warm_up_models = True
+
+# Maximum number of titles in one request to /recommend_batch or /recommend_profile
+max_batch_titles = 1000
+
 app = Flask(__name__)
 
 
+def create_app(warm_up: bool = warm_up_models) -> Flask:
+    """Return the app, loading the models in a background thread if 'warm_up' (importing the module loads nothing).
+    The /ready route reports 503 until all models are loaded."""
+    if warm_up:
+        threading.Thread(target=registry.warm_up, args=(MODEL_TYPES, (dataset_size,)), name="warm-up",
+                         daemon=True).start()
+    return app
+
+
+@app.before_request
+def start_timer():
+    g.start_time = time.perf_counter()
+
+
+@app.after_request
+def record_latency(response):
+    """Records the latency of the request by route (the URL rule, so that paths don't multiply the label values)."""
+    if "start_time" in g:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - g.start_time, route=route, method=request.method,
+                                     status=response.status_code)
+    return response
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Latency histograms and artifact sizes in the Prometheus text format."""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+
 @app.route("/")
 def home():
     """Renders the home page."""
     return render_template("home.html")
 
 
+@app.route("/ready")
+def ready():
+    """Readiness check: OK once all models for the selected dataset are loaded."""
+    if registry.is_ready(MODEL_TYPES, (dataset_size,)):
+        return jsonify({"status": "ready"})
+    return jsonify({"status": "loading"}), 503
+
+
 # for testing API with Postman
 @app.route("/recommend_api", methods=["POST"])
 def recommend_api():
     """Recommends movies and returns a JSON response."""
-
-    input_data = request.json["data"]
-
-    if not input_data:
-        return jsonify({"message": "Invalid request"}), 400
-
-    movie_to_compare, n_recommend, model_type = list(input_data.values())
-    n_recommend = int(n_recommend)
+    try:
+        movie_to_compare, n_recommend, model_type = parse_single_request(request_data(request.get_json(silent=True)))
+    except InvalidRequest as e:
+        return jsonify({"message": str(e)}), 400
 
     # Create an instance of MovieRecommend and get the movie recommendations
     first_line, final_table = MovieRecommend(model_type=model_type, db_size=dataset_size, n_recommend=n_recommend).launch(movie_to_compare)
@@ -43,22 +97,54 @@ def recommend_api():
     print(first_line)
     print(final_table)
 
-    return jsonify(
-        {
-            "json_string": json.dumps({"message": first_line}),
-            "json_table": final_table.to_json(orient="table"),
-        }
+    return jsonify(single_response(first_line, final_table))
+
+
+@app.route("/recommend_batch", methods=["POST"])
+def recommend_batch():
+    """Recommends movies for a list of titles and returns one JSON response with a result per title."""
+    try:
+        movies_to_compare, n_recommend, model_type = parse_batch_request(
+            request_data(request.get_json(silent=True)), max_batch_titles
+        )
+    except InvalidRequest as e:
+        return jsonify({"message": str(e)}), 400
+
+    # All titles are processed in one batch
+    results = MovieRecommend(model_type=model_type, db_size=dataset_size, n_recommend=n_recommend).launch_many(
+        movies_to_compare
     )
 
+    return jsonify(batch_response(movies_to_compare, results))
+
+
+@app.route("/recommend_profile", methods=["POST"])
+def recommend_profile():
+    """Recommends movies for a taste profile (liked and disliked titles) and returns a JSON response."""
+    try:
+        liked, disliked, n_recommend, model_type = parse_profile_request(
+            request_data(request.get_json(silent=True)), max_batch_titles
+        )
+    except InvalidRequest as e:
+        return jsonify({"message": str(e)}), 400
+
+    # All movies are scored against the whole profile at once
+    status, first_line, final_table = MovieRecommend(
+        model_type=model_type, db_size=dataset_size, n_recommend=n_recommend
+    ).launch_profile(liked, disliked)
+
+    return jsonify(profile_response(status, first_line, final_table))
+
 
 # for HTML version
 @app.route("/recommend", methods=["POST"])
 def recommend():
     """HTTP endpoint to get movie recommendations using Flask API."""
     # Extract input values from the HTML form
-    input_values = request.form.values()
-    movie_to_compare, n_recommend, model_type = list(input_values)
-    n_recommend = int(n_recommend)
+    try:
+        movie_to_compare, n_recommend, model_type = parse_form_request(list(request.form.values()))
+    except InvalidRequest as e:
+        return jsonify({"message": str(e)}), 400
 
     # Create an instance of MovieRecommend and get the movie recommendations
     first_line, final_table = MovieRecommend(model_type=model_type, db_size=dataset_size, n_recommend=n_recommend).launch(movie_to_compare)
@@ -69,4 +155,4 @@ def recommend():
 
 # Running the app
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=True)
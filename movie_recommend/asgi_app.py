@@ -0,0 +1,337 @@
+"""
+ASGI version of the app, with the recommendation computations offloaded to a bounded worker pool.
+
+In the Flask app run by sync gunicorn workers, one slow request (a correlation computed on the fly, or a fuzzy search
+of an unknown title) blocks a whole worker, and cheap requests served from the response cache queue behind it. Here,
+request parsing, cache lookups and response rendering run on the event loop, and only the responses missing from the
+cache are computed in a pool of 'compute_workers' threads (or processes, with 'compute_pool = "process"'). At most
+'compute_workers' computations run at once; up to 'max_waiting' more wait for a free worker on the event loop, and
+further computations get a 503 response, so that the latency of cache hits doesn't depend on the load.
+
+Threads share the models of the process-wide registry, and numpy/scipy release the GIL in their heavy loops. Processes
+load their own copy of the models at startup (memory-mapped artifacts share their pages), and avoid the GIL entirely;
+the stage latencies measured in worker processes are not in the metrics of the app.
+
+The app serves the same routes as app.py. It is a plain ASGI callable, run with any ASGI server, e.g.:
+    uvicorn --app-dir movie_recommend asgi_app:app --workers 2
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import pandas as pd
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from movie_recommend.movie_recommendations import OUTCOMES, MovieRecommend
+from movie_recommend.utils.api_payloads import (
+    InvalidRequest,
+    batch_response,
+    parse_batch_request,
+    parse_form_request,
+    parse_profile_request,
+    parse_single_request,
+    profile_response,
+    request_data,
+    single_response
+)
+from movie_recommend.utils.metrics import CONTENT_TYPE, HTTP_REQUEST_SECONDS, LAUNCH_SECONDS, metrics
+from movie_recommend.utils.model_registry import MODEL_TYPES, registry
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Select the size of the movie database
+#dataset_size = "small"
+dataset_size = "full"
+
+# Load all models at startup instead of on the first request
+warm_up_models = True
+
+# Maximum number of titles in one request to /recommend_batch or /recommend_profile
+max_batch_titles = 1000
+
+# Pool computing the recommendations missing from the cache: "thread" or "process", and its number of workers
+compute_pool = "thread"
+compute_workers = 4
+
+# Computations waiting for a free worker before new ones are rejected with a 503 response
+max_waiting = 64
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+ROUTE_URLS = {"home": "/", "recommend": "/recommend", "recommend_api": "/recommend_api"}
+
+
+class ServerBusy(Exception):
+    """Too many computations are waiting for a worker."""
+
+
+def compute_recommendations(
+    model_type: str, db_size: str, n_recommend: int, movies_to_compare: List[str]
+) -> List[Tuple[str, str, pd.DataFrame]]:
+    """Recommendations computed by a pool worker, with the models of the worker's registry."""
+    artifact = registry.get(model_type, db_size)
+    return MovieRecommend(model_type, db_size, n_recommend, cache=None).compute(artifact, movies_to_compare)
+
+
+def compute_profile_recommendations(
+    model_type: str, db_size: str, n_recommend: int, liked: List[str], disliked: List[str]
+) -> Tuple[str, str, pd.DataFrame]:
+    """Recommendations for a taste profile computed by a pool worker, with the models of the worker's registry."""
+    artifact = registry.get(model_type, db_size)
+    return MovieRecommend(model_type, db_size, n_recommend, cache=None).compute_profile(artifact, liked, disliked)
+
+
+def warm_up_worker(db_size: str) -> None:
+    """Load the models in a worker process."""
+    registry.warm_up(MODEL_TYPES, (db_size,))
+
+
+class RecommendApp:
+    """ASGI application serving recommendations, with cache lookups on the event loop and computations in a pool."""
+
+    def __init__(self, db_size: str = dataset_size, pool: str = compute_pool, workers: int = compute_workers,
+                 waiting: int = max_waiting, warm_up: bool = warm_up_models, max_titles: int = max_batch_titles):
+        self.db_size = db_size
+        self.pool = pool
+        self.workers = workers
+        self.waiting = waiting
+        self.warm_up = warm_up
+        self.max_titles = max_titles
+        self.executor: Optional[Executor] = None
+        # The semaphore is bound to the event loop it is created in
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop = None
+        self._n_waiting = 0
+        self.templates = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape(["html"]))
+        self.templates.globals["url_for"] = lambda endpoint: ROUTE_URLS[endpoint]
+        self.routes = {
+            ("GET", "/"): self.home,
+            ("GET", "/ready"): self.ready,
+            ("GET", "/metrics"): self.metrics_endpoint,
+            ("POST", "/recommend_api"): self.recommend_api,
+            ("POST", "/recommend_batch"): self.recommend_batch,
+            ("POST", "/recommend_profile"): self.recommend_profile,
+            ("POST", "/recommend"): self.recommend,
+        }
+
+    def start(self) -> None:
+        """Start the worker pool and load the models, if 'warm_up'."""
+        self.start_pool()
+        if self.warm_up:
+            registry.warm_up(MODEL_TYPES, (self.db_size,))
+
+    def start_pool(self) -> None:
+        if self.executor is not None:
+            return
+        if self.pool == "process":
+            initializer, initargs = (warm_up_worker, (self.db_size,)) if self.warm_up else (None, ())
+            self.executor = ProcessPoolExecutor(self.workers, initializer=initializer, initargs=initargs)
+        else:
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="recommend")
+
+    def stop(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots, self._slots_loop = asyncio.Semaphore(self.workers), loop
+        return self._slots
+
+    async def run_in_pool(self, function, *args):
+        """Run 'function' (compute_recommendations() or compute_profile_recommendations()) in the pool, waiting for a
+        free worker. Raises ServerBusy if 'waiting' computations are already waiting."""
+        self.start_pool()
+        slots = self.slots()
+        if slots.locked() and self._n_waiting >= self.waiting:
+            raise ServerBusy()
+        self._n_waiting += 1
+        try:
+            await slots.acquire()
+        finally:
+            self._n_waiting -= 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            slots.release()
+
+    async def recommendations(
+        self, model_type: str, n_recommend: int, movies_to_compare: List[str]
+    ) -> List[Tuple[str, str, pd.DataFrame]]:
+        """Responses from the cache, with the missing ones computed in the pool in one batch."""
+        artifact = await self.artifact(model_type)
+        movie_recommend = MovieRecommend(model_type, self.db_size, n_recommend)
+        results = movie_recommend.cached_responses(artifact, movies_to_compare)
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            missing_movies = [movies_to_compare[i] for i in missing]
+            computed = await self.run_in_pool(
+                compute_recommendations, model_type, self.db_size, n_recommend, missing_movies
+            )
+            movie_recommend.store(artifact, missing_movies, computed)
+            for i, result in zip(missing, computed):
+                results[i] = result
+        movie_recommend.record_outcomes(results)
+        return results
+
+    async def artifact(self, model_type: str):
+        """Artifact of a model type, got in a thread: the registry loads it on first use and reloads it when it
+        changed on disk, which must not block the event loop."""
+        return await asyncio.to_thread(registry.get, model_type, self.db_size)
+
+    async def profile_recommendations(
+        self, model_type: str, n_recommend: int, liked: List[str], disliked: List[str]
+    ) -> Tuple[str, str, pd.DataFrame]:
+        """Response for a taste profile from the cache, or computed in the pool."""
+        artifact = await self.artifact(model_type)
+        movie_recommend = MovieRecommend(model_type, self.db_size, n_recommend)
+        result = movie_recommend.cached_profile(artifact, liked, disliked)
+        if result is None:
+            result = await self.run_in_pool(
+                compute_profile_recommendations, model_type, self.db_size, n_recommend, liked, disliked
+            )
+            movie_recommend.store_profile(artifact, liked, disliked, result)
+        movie_recommend.record_outcomes([result])
+        return result
+
+    async def launch(self, model_type: str, n_recommend: int, movie_to_compare: str) -> Tuple[str, pd.DataFrame]:
+        """Recommendations for one movie, as MovieRecommend.launch()."""
+        start_time = time.perf_counter()
+        status, first_line, final_table = (await self.recommendations(model_type, n_recommend, [movie_to_compare]))[0]
+        LAUNCH_SECONDS.observe(time.perf_counter() - start_time, model_type=model_type, db_size=self.db_size,
+                               outcome=OUTCOMES[status])
+        return first_line, final_table
+
+    # Routes: each returns a status code, a content type and a body
+
+    async def home(self, body: bytes) -> Tuple[int, str, bytes]:
+        """Renders the home page."""
+        return html_response(self.templates.get_template("home.html").render())
+
+    async def ready(self, body: bytes) -> Tuple[int, str, bytes]:
+        """Readiness check: OK once all models for the selected dataset are loaded."""
+        if registry.is_ready(MODEL_TYPES, (self.db_size,)):
+            return json_response({"status": "ready"})
+        return json_response({"status": "loading"}, 503)
+
+    async def metrics_endpoint(self, body: bytes) -> Tuple[int, str, bytes]:
+        """Latency histograms and artifact sizes in the Prometheus text format."""
+        return 200, CONTENT_TYPE, metrics.render().encode()
+
+    async def recommend_api(self, body: bytes) -> Tuple[int, str, bytes]:
+        """Recommends movies and returns a JSON response."""
+        movie_to_compare, n_recommend, model_type = parse_single_request(request_body_data(body))
+        first_line, final_table = await self.launch(model_type, n_recommend, movie_to_compare)
+        return json_response(single_response(first_line, final_table))
+
+    async def recommend_batch(self, body: bytes) -> Tuple[int, str, bytes]:
+        """Recommends movies for a list of titles and returns one JSON response with a result per title."""
+        movies_to_compare, n_recommend, model_type = parse_batch_request(request_body_data(body), self.max_titles)
+        results = await self.recommendations(model_type, n_recommend, movies_to_compare)
+        return json_response(batch_response(movies_to_compare, results))
+
+    async def recommend_profile(self, body: bytes) -> Tuple[int, str, bytes]:
+        """Recommends movies for a taste profile (liked and disliked titles) and returns a JSON response."""
+        liked, disliked, n_recommend, model_type = parse_profile_request(request_body_data(body), self.max_titles)
+        result = await self.profile_recommendations(model_type, n_recommend, liked, disliked)
+        return json_response(profile_response(*result))
+
+    async def recommend(self, body: bytes) -> Tuple[int, str, bytes]:
+        """Recommendations for the HTML form."""
+        try:
+            values = [value for _, value in parse_qsl(body.decode(), keep_blank_values=True)]
+        except UnicodeDecodeError:
+            raise InvalidRequest("Invalid request")
+        movie_to_compare, n_recommend, model_type = parse_form_request(values)
+        first_line, final_table = await self.launch(model_type, n_recommend, movie_to_compare)
+        return html_response(self.templates.get_template("home.html").render(
+            first_line=first_line, final_table=final_table.to_html()
+        ))
+
+    async def handle(self, method: str, path: str, body: bytes) -> Tuple[int, str, bytes]:
+        """Response of a request: 404/405 for unknown routes, 400 for invalid requests, 503 if the pool is busy."""
+        handler = self.routes.get((method, path))
+        if handler is None:
+            if any(route_path == path for _, route_path in self.routes):
+                return json_response({"message": "Method not allowed"}, 405)
+            return json_response({"message": "Not found"}, 404)
+        try:
+            return await handler(body)
+        except InvalidRequest as e:
+            return json_response({"message": str(e)}, 400)
+        except ServerBusy:
+            return json_response({"message": "Server busy, try again later"}, 503)
+
+    async def __call__(self, scope: dict, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        start_time = time.perf_counter()
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        method, path = scope["method"], scope["path"]
+        try:
+            status, content_type, content = await self.handle(method, path, body)
+        except Exception as e:
+            logging.exception("Error serving %s %s: %s", method, path, e)
+            status, content_type, content = json_response({"message": "Internal server error"}, 500)
+
+        await send({"type": "http.response.start", "status": status, "headers": [
+            (b"content-type", content_type.encode()), (b"content-length", str(len(content)).encode())
+        ]})
+        await send({"type": "http.response.body", "body": content})
+        route = path if (method, path) in self.routes else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start_time, route=route, method=method, status=status)
+
+    async def lifespan(self, receive, send) -> None:
+        """Start the pool (and load the models) at server startup, stop it at shutdown."""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await asyncio.to_thread(self.start)
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await asyncio.to_thread(self.stop)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def request_body_data(body: bytes) -> dict:
+    """'data' field of a JSON request body (see request_data()). Raises InvalidRequest if the body is not a JSON
+    object."""
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise InvalidRequest("Invalid request")
+    return request_data(payload)
+
+
+def json_response(data: dict, status: int = 200) -> Tuple[int, str, bytes]:
+    return status, "application/json", json.dumps(data).encode()
+
+
+def html_response(html: str, status: int = 200) -> Tuple[int, str, bytes]:
+    return status, "text/html; charset=utf-8", html.encode()
+
+
+app = RecommendApp()
@@ -0,0 +1,259 @@
+"""
+This script benchmarks the data pipeline and the recommendation engines on synthetic MovieLens-shaped data (see
+utils/synthetic_data.py).
+
+For every data scale, it times the pipeline stages (merged_table, mean_rating_table, filter_movies_by_rating_count,
+pivot_ratings, sparse_pivot_ratings, knn_train), the recommendation functions (recommendation_knn, recommendation_corr,
+recommendation_rename_movie) on a sample of movies, and the end-to-end MovieRecommend.launch() of both models, served
+from artifacts written to a temporary folder. Each measurement records latency percentiles over its repeats and the
+peak memory allocated during one extra traced run (tracemalloc, which also sees numpy arrays). Dense stages are skipped
+at scales where the dense pivot table wouldn't fit in memory.
+
+The results are written to a JSON file and compared with a stored baseline: a median latency or a peak memory higher
+than the baseline by more than the tolerance is a regression, and the script exits with status 1. A missing baseline
+is an error too (status 2), unless the run stores a new one: baselines depend on the machine, so none is committed.
+
+Usage:
+    python -m movie_recommend.benchmark --scales xs s --output bench.json --baseline benchmarks/baseline.json
+    python -m movie_recommend.benchmark --save-baseline    # store the results as the new baseline
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import datetime
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import movie_recommend.constants as c
+from movie_recommend.movie_recommendations import MovieRecommend
+from movie_recommend.utils.artifact_store import write_artifact
+from movie_recommend.utils.get_databases import read_tables
+from movie_recommend.utils.model_registry import ModelRegistry
+from movie_recommend.utils.neighbor_table import corr_neighbor_table, knn_neighbor_table
+from movie_recommend.utils.recommendation_algorithms import (
+    CosineNeighbors,
+    corr_min_periods,
+    knn_train,
+    recommendation_corr,
+    recommendation_knn,
+    recommendation_rename_movie
+)
+from movie_recommend.utils.table_formatting import (
+    filter_movies_by_rating_count,
+    mean_rating_table,
+    merged_table,
+    pivot_ratings,
+    sparse_pivot_ratings
+)
+from movie_recommend.utils.synthetic_data import generate_dataset
+from movie_recommend.utils.title_search import TitleSearchIndex
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Data scales: number of movies, users and ratings, and minimum number of ratings per movie
+SCALES = {
+    "xs": {"n_movies": 500, "n_users": 2000, "n_ratings": 50_000, "rating_threshold": 10},
+    "s": {"n_movies": 2000, "n_users": 10_000, "n_ratings": 300_000, "rating_threshold": 20},
+    "m": {"n_movies": 10_000, "n_users": 50_000, "n_ratings": 2_000_000, "rating_threshold": 50},
+}
+# Dense stages (pivot_ratings, knn_train) are skipped above this number of cells of the pivot table
+DENSE_MAX_CELLS = 50_000_000
+BASELINE_FILE = os.path.join(c.REPO_DIR, "benchmarks", "baseline.json")
+# Relative regression tolerance, and absolute slack in milliseconds for very fast measurements
+TOLERANCE = 0.25
+MIN_SLACK_MS = 1.0
+
+
+def measure(fn: Callable, args_list: List[tuple], trace_memory: bool = True) -> dict:
+    """Latency percentiles of 'fn' called with each arguments tuple of 'args_list', and the peak memory allocated
+    during one more call with the first arguments (traced separately, as tracing slows the calls down)."""
+    latencies = []
+    for args in args_list:
+        start_time = time.perf_counter()
+        fn(*args)
+        latencies.append(1000 * (time.perf_counter() - start_time))
+
+    peak_mb = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            fn(*args_list[0])
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        finally:
+            tracemalloc.stop()
+
+    latencies = np.asarray(latencies)
+    return {
+        "n": len(latencies),
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "peak_mb": peak_mb,
+    }
+
+
+def benchmark_scale(scale: str, params: dict, repeats: int = 3, n_queries: int = 50, seed: int = 0) -> Dict[str, dict]:
+    """Measurements of all stages at one data scale, keyed by stage name."""
+    results = {}
+    with tempfile.TemporaryDirectory() as dir_path:
+        csv_files = generate_dataset(dir_path, params["n_movies"], params["n_users"], params["n_ratings"], seed)
+        movies_df, rating_df = read_tables(*csv_files, compact=True)
+    rating_threshold = params["rating_threshold"]
+    logging.info("Scale '%s': %d movies, %d ratings", scale, len(movies_df.index), len(rating_df.index))
+
+    # Pipeline stages
+    results["merged_table"] = measure(merged_table, [(movies_df, rating_df)] * repeats)
+    movie_rating_df = merged_table(movies_df, rating_df)
+    results["mean_rating_table"] = measure(mean_rating_table, [(movie_rating_df,)] * repeats)
+    all_ratings = mean_rating_table(movie_rating_df)
+    results["filter_movies_by_rating_count"] = measure(
+        filter_movies_by_rating_count, [(movie_rating_df, rating_threshold)] * repeats
+    )
+    rating_movie_per_user = filter_movies_by_rating_count(movie_rating_df, rating_threshold)
+    results["sparse_pivot_ratings"] = measure(sparse_pivot_ratings, [(rating_movie_per_user,)] * repeats)
+    features = sparse_pivot_ratings(rating_movie_per_user)
+
+    if features.shape[0] * features.shape[1] <= DENSE_MAX_CELLS:
+        results["pivot_ratings"] = measure(
+            lambda df: pivot_ratings(df.copy(), c.TITLE, c.USER_ID), [(rating_movie_per_user,)] * repeats
+        )
+        features_df = pivot_ratings(rating_movie_per_user.copy(), c.TITLE, c.USER_ID).fillna(0)
+        results["knn_train"] = measure(knn_train, [(features_df,)] * repeats)
+        del features_df
+    else:
+        logging.info("Dense stages skipped at scale '%s' (%d x %d pivot table)", scale, *features.shape)
+
+    # Recommendation functions, on a sample of movies
+    rng = random.Random(seed)
+    queries = rng.sample(list(features.titles), min(n_queries, len(features)))
+    model = CosineNeighbors(features.values())
+    results["recommendation_knn"] = measure(
+        recommendation_knn, [(features, model, movie, 20, all_ratings) for movie in queries]
+    )
+    results["recommendation_corr"] = measure(
+        recommendation_corr, [(features, movie, 20, all_ratings) for movie in queries]
+    )
+    total_movie_array = movies_df[c.TITLE].to_numpy(dtype=object)
+    search_index = TitleSearchIndex.build(total_movie_array)
+    # Misspelled titles: the first letter of each query is dropped
+    results["recommendation_rename_movie"] = measure(
+        recommendation_rename_movie,
+        [(movie[1:], total_movie_array, 20, all_ratings, search_index) for movie in queries]
+    )
+
+    # End-to-end requests, served from artifacts with precomputed neighbor tables
+    with tempfile.TemporaryDirectory() as pkl_dir:
+        write_artifact(os.path.join(pkl_dir, f"knn_model_{scale}"), "knn", scale, features, all_ratings,
+                       total_movie_array, rating_threshold, knn_neighbor_table(features, 50))
+        write_artifact(os.path.join(pkl_dir, f"corr_model_{scale}"), "corr", scale, features, all_ratings,
+                       total_movie_array, rating_threshold,
+                       corr_neighbor_table(features, 50, corr_min_periods(all_ratings)))
+        model_registry = ModelRegistry(pkl_dir)
+        for model_type in ("knn", "corr"):
+            movie_recommend = MovieRecommend(model_type, scale, 20, model_registry=model_registry, cache=None)
+            movie_recommend.launch(queries[0])
+            results[f"launch_{model_type}"] = measure(movie_recommend.launch, [(movie,) for movie in queries])
+    return results
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def run_benchmarks(scales: List[str], repeats: int = 3, n_queries: int = 50) -> dict:
+    """Benchmark results of all scales: '{"environment": ..., "results": {"scale/stage": measurement}}'."""
+    results = {}
+    for scale in scales:
+        for stage, measurement in benchmark_scale(scale, SCALES[scale], repeats, n_queries).items():
+            results[f"{scale}/{stage}"] = measurement
+    return {"environment": environment(), "results": results}
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float = TOLERANCE) -> List[str]:
+    """Regressions of 'results' against 'baseline': median latencies and peak memory higher than the baseline by more
+    than 'tolerance' (relative, plus MIN_SLACK_MS for latencies). Stages missing from the baseline are ignored."""
+    regressions = []
+    for key, measurement in results["results"].items():
+        reference = baseline.get("results", {}).get(key)
+        if reference is None:
+            continue
+        if measurement["p50_ms"] > reference["p50_ms"] * (1 + tolerance) + MIN_SLACK_MS:
+            regressions.append(f"{key}: median latency {measurement['p50_ms']:.2f} ms "
+                               f"(baseline {reference['p50_ms']:.2f} ms)")
+        if (measurement.get("peak_mb") is not None and reference.get("peak_mb") is not None
+                and measurement["peak_mb"] > reference["peak_mb"] * (1 + tolerance) + 1):
+            regressions.append(f"{key}: peak memory {measurement['peak_mb']:.1f} MB "
+                               f"(baseline {reference['peak_mb']:.1f} MB)")
+    return regressions
+
+
+def log_results(results: dict, baseline: Optional[dict] = None) -> None:
+    """Log a table of results, with the baseline medians if any."""
+    logging.info("%-40s %10s %10s %10s %10s %12s", "stage", "p50, ms", "p95, ms", "p99, ms", "peak, MB", "base p50")
+    for key, m in results["results"].items():
+        reference = (baseline or {}).get("results", {}).get(key)
+        peak = f"{m['peak_mb']:.1f}" if m["peak_mb"] is not None else "--"
+        base = f"{reference['p50_ms']:.2f}" if reference else "--"
+        logging.info("%-40s %10.2f %10.2f %10.2f %10s %12s", key, m["p50_ms"], m["p95_ms"], m["p99_ms"], peak, base)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the data pipeline and the recommendation engines.")
+    parser.add_argument("--scales", nargs="+", default=["xs", "s"], choices=list(SCALES))
+    parser.add_argument("--repeats", type=int, default=3, help="repeats of each pipeline stage")
+    parser.add_argument("--queries", type=int, default=50, help="number of movies for the recommendation stages")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file of the results")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="JSON file of the baseline results")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--save-baseline", "--update-baseline", action="store_true",
+                        help="store the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.scales, args.repeats, args.queries)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    logging.info("Benchmark results saved to: %s", args.output)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        logging.info("Baseline saved to: %s", args.baseline)
+        log_results(results)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        logging.error("No baseline to compare with: %s (use --save-baseline)", args.baseline)
+        log_results(results)
+        return 2
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    log_results(results, baseline)
+
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    for regression in regressions:
+        logging.error("Regression: %s", regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
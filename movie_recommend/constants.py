@@ -12,6 +12,9 @@ ZIP_LINK_FULL = "https://files.grouplens.org/datasets/movielens/ml-latest.zip"
 ZIP_LINK_SMALL = "https://files.grouplens.org/datasets/movielens/ml-latest-small.zip"
 LAST_ETAG_FILE = "last_etag.txt"
 LAST_MODIFIED_FILE = "last_modified.txt"
+LAST_CHECK_FILE = "last_check.txt"
+# The dataset isn't checked at the source page again for this number of hours
+FRESHNESS_HOURS = 24
 
 PKL_DIR = os.path.join(REPO_DIR, "app_data")
 
@@ -1,31 +1,133 @@
+import weakref
+from typing import Union
+
 from pandas import DataFrame
 
-from movie_recommend.utils.recommendation_algorithms import recommendation_corr, recommendation_knn
+from movie_recommend.utils.ann_index import IvfCosineNeighbors
+from movie_recommend.utils.rating_matrix import RatingMatrix, as_rating_matrix
+from movie_recommend.utils.recommendation_algorithms import (
+    CosineNeighbors,
+    recommendation_corr,
+    recommendation_corr_many,
+    recommendation_from_neighbors,
+    recommendation_knn,
+    recommendation_knn_many,
+    recommendation_profile_corr,
+    recommendation_profile_knn
+)
 
 class ModelType:
     """The ModelType interface declares the fields and operations that all specific model types must implement."""
     string = ""
+    score_name = ""
+    titles_on_index = True
+
+    def lookup_recommendations(self, features_df, movie_to_compare, n_recommend, total_ratings, neighbors):
+        """Recommendations from a precomputed neighbor table, or None if the table can't answer the request."""
+        if neighbors is None:
+            return None
+        features = as_rating_matrix(features_df, self.titles_on_index)
+        found = neighbors.lookup(features.get_loc(movie_to_compare), n_recommend)
+        if found is None:
+            return None
+        indices, scores = found
+        return recommendation_from_neighbors(
+            features.titles, indices, scores, self.score_name, movie_to_compare, total_ratings
+        )
+
+    def get_recommendations_many(self, features_df, model, movies_to_compare, n_recommend, total_ratings,
+                                 neighbors=None):
+        """Recommendations for several movies: neighbor table lookups first, then one batched live computation."""
+        results = [
+            self.lookup_recommendations(features_df, movie, n_recommend, total_ratings, neighbors)
+            for movie in movies_to_compare
+        ]
+        missing = [i for i, found in enumerate(results) if found is None]
+        if missing:
+            computed = self.compute_recommendations_many(
+                features_df, model, [movies_to_compare[i] for i in missing], n_recommend, total_ratings
+            )
+            for i, found in zip(missing, computed):
+                results[i] = found
+        return results
 
 
 class ModelTypeKnn(ModelType):
     """KNN model type class."""
     string = "knn"
+    score_name = "distance"
+    titles_on_index = True
+    # Nearest neighbors search: exact brute force or approximate inverted-file index
+    backends = {
+        "brute": CosineNeighbors,
+        "ivf": IvfCosineNeighbors,
+    }
+    # Exact searches built by exact_model() for models without one, kept as long as their rating matrix (the one of a
+    # loaded artifact)
+    _exact_models = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def build_model(cls, matrix, backend: str = "brute", **params):
+        """Build the neighbors search model of a 'Title vs Users' matrix with the selected backend."""
+        if backend not in cls.backends:
+            raise ValueError(f"Unknown KNN backend: {backend}")
+        return cls.backends[backend].build(matrix, **params)
 
-    def get_recommendations(self, features_df, model, movie_to_compare, n_recommend, total_ratings):
+    def get_recommendations(self, features_df, model, movie_to_compare, n_recommend, total_ratings, neighbors=None):
+        found = self.lookup_recommendations(features_df, movie_to_compare, n_recommend, total_ratings, neighbors)
+        if found is not None:
+            return found
         return recommendation_knn(features_df, model, movie_to_compare, n_recommend, total_ratings)
 
-    def get_movie_array(self, df: DataFrame):
+    def compute_recommendations_many(self, features_df, model, movies_to_compare, n_recommend, total_ratings):
+        return recommendation_knn_many(features_df, model, movies_to_compare, n_recommend, total_ratings)
+
+    def get_profile_recommendations(self, features_df, model, liked, disliked, n_recommend, total_ratings):
+        return recommendation_profile_knn(
+            features_df, self.exact_model(features_df, model), liked, disliked, n_recommend, total_ratings
+        )
+
+    @classmethod
+    def exact_model(cls, features_df, model) -> CosineNeighbors:
+        """Exact cosine search of a model: the model itself, the brute force fallback of an approximate index, or a
+        search built from the features for other models (once per rating matrix, see '_exact_models')."""
+        if isinstance(model, CosineNeighbors):
+            return model
+        if isinstance(model, IvfCosineNeighbors):
+            return model.brute
+        features = as_rating_matrix(features_df, titles_on_index=True)
+        exact = cls._exact_models.get(features)
+        if exact is None:
+            exact = cls._exact_models[features] = CosineNeighbors.build(features.values())
+        return exact
+
+    def get_movie_array(self, df: Union[RatingMatrix, DataFrame]):
+        if isinstance(df, RatingMatrix):
+            return df.titles
         return df.index
 
 
 class ModelTypeCorr(ModelType):
     """Pearson correlation model type class."""
     string = "corr"
+    score_name = "correlation"
+    titles_on_index = False
 
-    def get_recommendations(self, features_df, model, movie_to_compare, n_recommend, total_ratings):
+    def get_recommendations(self, features_df, model, movie_to_compare, n_recommend, total_ratings, neighbors=None):
+        found = self.lookup_recommendations(features_df, movie_to_compare, n_recommend, total_ratings, neighbors)
+        if found is not None:
+            return found
         return recommendation_corr(features_df, movie_to_compare, n_recommend, total_ratings)
 
-    def get_movie_array(self, df: DataFrame):
+    def compute_recommendations_many(self, features_df, model, movies_to_compare, n_recommend, total_ratings):
+        return recommendation_corr_many(features_df, movies_to_compare, n_recommend, total_ratings)
+
+    def get_profile_recommendations(self, features_df, model, liked, disliked, n_recommend, total_ratings):
+        return recommendation_profile_corr(features_df, liked, disliked, n_recommend, total_ratings)
+
+    def get_movie_array(self, df: Union[RatingMatrix, DataFrame]):
+        if isinstance(df, RatingMatrix):
+            return df.titles
         return df.columns
 
 
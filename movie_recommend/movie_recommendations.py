@@ -7,61 +7,178 @@ Local usage:
 - Uncomment the desired 'model_type' value (either 'knn' or 'corr').
 - Run the script to get the recommendations.
 
-The script loads the pre-trained KNN model and pre-formatted dataframes from pkl files. It determines
-which model and features to use based on the 'model_type' value. It then calls the 'get_recommendations()'
-function from the 'movie_recommend.app' module to get the movie recommendations using the selected model
-and features.
+The script gets the models and their rating matrices from the model registry, which loads the artifacts written by
+pkl_production.py once per process (and reloads them when they change on disk), and keeps recent responses in an LRU
+cache. It determines which model and features to use based on the 'model_type' value. It then calls the
+'get_recommendations_many()' function from the 'movie_recommend.utils.get_recommendations' module to get the movie
+recommendations using the selected model and features.
 """
 
-import os
-import pickle
-from typing import Tuple
+import time
+from typing import List, Optional, Tuple
 
 import logging
 import pandas as pd
 
-from movie_recommend.utils.get_recommendations import get_recommendations
-import movie_recommend.constants as c
+from movie_recommend.utils.artifact_store import ModelArtifact
+from movie_recommend.utils.get_recommendations import (
+    STATUS_NOT_ENOUGH_RATINGS,
+    STATUS_NOT_FOUND,
+    STATUS_OK,
+    get_profile_recommendations,
+    get_recommendations_many
+)
+from movie_recommend.utils.metrics import LAUNCH_SECONDS, RECOMMENDATIONS
+from movie_recommend.utils.model_registry import ModelRegistry, registry
+from movie_recommend.utils.response_cache import ResponseCache, response_cache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Outcome label of the metrics for each status of a response
+OUTCOMES = {STATUS_OK: "hit", STATUS_NOT_ENOUGH_RATINGS: "not_enough_ratings", STATUS_NOT_FOUND: "renamed"}
 
-def get_pkl_file_name(model_type: str, db_size: str) -> str:
-    return f"{model_type}_model_{db_size}.pkl"
-
-def load_data_from_pkl(pkl_file: str) -> Tuple:
-    """Load data from pkl file."""
-    try:
-        with open(pkl_file, "rb") as f:
-            return pickle.load(f)
-    except Exception as e:
-        logging.error(f"Error loading model: {e}")
-        exit()
 
 class MovieRecommend:
-    def __init__(self, model_type: str, db_size: str, n_recommend: int = 20):
+    def __init__(self, model_type: str, db_size: str, n_recommend: int = 20, model_registry: ModelRegistry = registry,
+                 cache: Optional[ResponseCache] = response_cache):
         self.model_type = model_type
         self.db_size = db_size
         self.n_recommend = n_recommend
+        self.model_registry = model_registry
+        self.cache = cache
 
     def launch(self, movie_to_compare: str) -> Tuple[str, pd.DataFrame]:
-        pkl_file = get_pkl_file_name(self.model_type, self.db_size)
-        features_df, model, all_ratings, total_movie_array = load_data_from_pkl(os.path.join(c.PKL_DIR, pkl_file))
-        movie_array = features_df.columns
+        start_time = time.perf_counter()
+        # Models are loaded once per process and shared (read-only) between requests
+        artifact = self.model_registry.get(self.model_type, self.db_size)
 
         # Get the movie recommendations
-        first_line, final_table = get_recommendations(
-            features_df, movie_to_compare, self.n_recommend, self.model_type, model, all_ratings,
-            total_movie_array
-        )
+        status, first_line, final_table = self.cached_recommendations(artifact, [movie_to_compare])[0]
+        LAUNCH_SECONDS.observe(time.perf_counter() - start_time, model_type=self.model_type, db_size=self.db_size,
+                               outcome=OUTCOMES[status])
 
         logging.info(
-            f"Number of movies to compare with (number of ratings is higher than the threshold): {len(movie_array)}"
+            "Number of movies to compare with (number of ratings is higher than the threshold): %d",
+            len(artifact.features_df.titles)
         )
 
         return first_line, final_table
 
+    def launch_many(self, movies_to_compare: List[str]) -> List[Tuple[str, str, pd.DataFrame]]:
+        """Recommendations for several movies in one batch: a status ('ok', 'not_enough_ratings' or 'not_found'),
+        a message line and a table for each movie."""
+        artifact = self.model_registry.get(self.model_type, self.db_size)
+        results = self.cached_recommendations(artifact, movies_to_compare)
+
+        logging.info("Recommendations computed for a batch of %d movies", len(movies_to_compare))
+
+        return results
+
+    def cache_key(self, artifact: ModelArtifact, movie_to_compare: str) -> Optional[Tuple[str, str, str]]:
+        """Cache key of a requested movie, with the title normalized by the title resolver. Unresolved titles have no
+        key: their responses (suggestions of similar titles, echoing the query) are not cached."""
+        title = artifact.title_resolver.resolve_title(movie_to_compare) if artifact.title_resolver else None
+        return None if title is None else (self.model_type, self.db_size, title)
+
+    def cached_responses(
+        self, artifact: ModelArtifact, movies_to_compare: List[str]
+    ) -> List[Optional[Tuple[str, str, pd.DataFrame]]]:
+        """Responses found in the cache, None for the missing ones."""
+        if self.cache is None:
+            return [None] * len(movies_to_compare)
+        keys = [self.cache_key(artifact, movie) for movie in movies_to_compare]
+        return [None if key is None else self.cache.get(key, self.n_recommend, artifact.version) for key in keys]
+
+    def compute(self, artifact: ModelArtifact, movies_to_compare: List[str]) -> List[Tuple[str, str, pd.DataFrame]]:
+        """Responses computed in one batch, without the cache."""
+        features_df, model, all_ratings, total_movie_array = artifact.as_tuple()
+        return get_recommendations_many(
+            features_df, movies_to_compare, self.n_recommend, self.model_type, model, all_ratings, total_movie_array,
+            artifact.neighbors, artifact.title_search, artifact.feature_title_search, artifact.title_resolver,
+            self.db_size
+        )
+
+    def store(
+        self, artifact: ModelArtifact, movies_to_compare: List[str], results: List[Tuple[str, str, pd.DataFrame]]
+    ) -> None:
+        """Add computed responses to the cache."""
+        if self.cache is None:
+            return
+        for movie, result in zip(movies_to_compare, results):
+            key = self.cache_key(artifact, movie)
+            if key is not None:
+                self.cache.put(key, self.n_recommend, artifact.version, result)
+
+    def record_outcomes(self, results: List[Tuple[str, str, pd.DataFrame]]) -> None:
+        for status, _, _ in results:
+            RECOMMENDATIONS.inc(model_type=self.model_type, db_size=self.db_size, outcome=OUTCOMES[status])
+
+    def launch_profile(self, liked: List[str], disliked: List[str] = ()) -> Tuple[str, str, pd.DataFrame]:
+        """Recommendations for a taste profile of liked (and optionally disliked) movies: a status ('ok' or
+        'not_found'), a message line and a table."""
+        artifact = self.model_registry.get(self.model_type, self.db_size)
+        result = self.cached_profile(artifact, liked, disliked)
+        if result is None:
+            result = self.compute_profile(artifact, liked, disliked)
+            self.store_profile(artifact, liked, disliked, result)
+        self.record_outcomes([result])
+
+        logging.info("Recommendations computed for a profile of %d liked and %d disliked movies", len(liked),
+                     len(disliked))
+
+        return result
+
+    def profile_key(self, artifact: ModelArtifact, liked: List[str], disliked: List[str]) -> Optional[tuple]:
+        """Cache key of a taste profile: the sets of normalized liked and disliked titles (scores don't depend on
+        their order). Profiles with unresolved titles have no key, their message lists the ignored titles."""
+        keys = [[self.cache_key(artifact, movie) for movie in movies] for movies in (liked, disliked)]
+        if any(key is None for movie_keys in keys for key in movie_keys):
+            return None
+        liked_titles, disliked_titles = (frozenset(key[2] for key in movie_keys) for movie_keys in keys)
+        return self.model_type, self.db_size, ("profile", liked_titles, disliked_titles)
+
+    def cached_profile(
+        self, artifact: ModelArtifact, liked: List[str], disliked: List[str]
+    ) -> Optional[Tuple[str, str, pd.DataFrame]]:
+        """Response for a taste profile found in the cache, or None."""
+        key = None if self.cache is None else self.profile_key(artifact, liked, disliked)
+        return None if key is None else self.cache.get(key, self.n_recommend, artifact.version)
+
+    def compute_profile(
+        self, artifact: ModelArtifact, liked: List[str], disliked: List[str]
+    ) -> Tuple[str, str, pd.DataFrame]:
+        """Response for a taste profile, without the cache."""
+        features_df, model, all_ratings, total_movie_array = artifact.as_tuple()
+        return get_profile_recommendations(
+            features_df, list(liked), list(disliked), self.n_recommend, self.model_type, model, all_ratings,
+            total_movie_array, artifact.title_resolver, self.db_size
+        )
+
+    def store_profile(
+        self, artifact: ModelArtifact, liked: List[str], disliked: List[str], result: Tuple[str, str, pd.DataFrame]
+    ) -> None:
+        """Add a computed response for a taste profile to the cache."""
+        key = None if self.cache is None else self.profile_key(artifact, liked, disliked)
+        if key is not None:
+            self.cache.put(key, self.n_recommend, artifact.version, result)
+
+    def cached_recommendations(
+        self, artifact: ModelArtifact, movies_to_compare: List[str]
+    ) -> List[Tuple[str, str, pd.DataFrame]]:
+        """Responses from the cache, with the missing ones computed in one batch and added to the cache."""
+        results = self.cached_responses(artifact, movies_to_compare)
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            missing_movies = [movies_to_compare[i] for i in missing]
+            computed = self.compute(artifact, missing_movies)
+            self.store(artifact, missing_movies, computed)
+            for i, result in zip(missing, computed):
+                results[i] = result
+
+        self.record_outcomes(results)
+        return results
+
 
 if __name__ == "__main__":
     # Settings: movie title, number of movies to recommend, model type
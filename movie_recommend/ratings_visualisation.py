@@ -51,7 +51,7 @@ def main(dataset_size: str, rating_threshold: int, min_rating: float) -> None:
     """Main function to load data, compute mean ratings, and generate visualizations."""
     try:
         # Import movies and ratings dataframes
-        movies_df, rating_df = get_db(dataset_size)
+        movies_df, rating_df = get_db(dataset_size, compact=True)
 
         logging.info("The total number of movies in the database: %d", len(movies_df.index))
         logging.info("The total number of ratings in the database: %d", len(rating_df.index))
@@ -0,0 +1,198 @@
+"""
+Approximate cosine k-Nearest Neighbors with an inverted-file (IVF) index.
+
+The rows of the 'Title vs Users' matrix are L2-normalized and embedded in a few dimensions with a truncated SVD, and the
+embeddings are grouped in 'n_lists' clusters by spherical k-means. A query is embedded the same way; only the movies of
+its 'n_probes' closest clusters are scored in the embedding space, and the 'n_candidates' best of them are reranked with
+their exact cosine distances. More probes and candidates raise recall, fewer make queries faster.
+knn_recall_report() measures recall@k against the brute-force search.
+"""
+
+import time
+import logging
+from typing import Dict, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.metrics.pairwise import cosine_distances
+from sklearn.preprocessing import normalize
+from sklearn.utils.extmath import randomized_svd
+
+from movie_recommend.utils.rating_matrix import float_values
+from movie_recommend.utils.recommendation_algorithms import CosineNeighbors
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+KMEANS_ITERATIONS = 10
+
+
+class IvfCosineNeighbors:
+    """IVF index with the kneighbors() interface of CosineNeighbors.
+    'components' ('n_users x n_components') embeds normalized rating rows, 'embeddings' are the normalized embeddings
+    of all movies, and the movies of cluster 'i' are 'list_members[list_offsets[i]:list_offsets[i + 1]]'."""
+
+    def __init__(self, matrix: csr_matrix, components: np.ndarray, embeddings: np.ndarray, centroids: np.ndarray,
+                 list_offsets: np.ndarray, list_members: np.ndarray, n_probes: int = 8, n_candidates: int = 500):
+        self.matrix = matrix
+        self.components = components
+        self.embeddings = embeddings
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_members = list_members
+        self.n_probes = n_probes
+        self.n_candidates = n_candidates
+        self._brute = None
+
+    @property
+    def brute(self) -> CosineNeighbors:
+        """Exact search of the queries with too few candidates (its normalized vectors are built on first use)."""
+        if self._brute is None:
+            self._brute = CosineNeighbors(self.matrix)
+        return self._brute
+
+    @property
+    def params(self) -> dict:
+        return {
+            "n_components": self.components.shape[1], "n_lists": self.centroids.shape[0],
+            "n_probes": self.n_probes, "n_candidates": self.n_candidates,
+        }
+
+    @classmethod
+    def build(cls, matrix: csr_matrix, n_components: int = 64, n_lists: int = 0, n_probes: int = 8,
+              n_candidates: int = 500, seed: int = 0) -> "IvfCosineNeighbors":
+        """Build the index. By default, the number of clusters is about the square root of the number of movies."""
+        start_time = time.time()
+        n_movies = matrix.shape[0]
+        n_components = min(n_components, min(matrix.shape) - 1)
+        n_lists = min(n_lists or max(int(np.sqrt(n_movies)), 1), n_movies)
+
+        # Truncated SVD of the normalized rows: movie embeddings are 'u * s', queries are projected on 'vt'
+        _, _, vt = randomized_svd(normalize(float_values(matrix)), n_components, n_iter=4, random_state=seed)
+        components = np.ascontiguousarray(vt.T, dtype=np.float32)
+        embeddings = _embed(matrix, components)
+
+        # Spherical k-means: clusters of embeddings with the highest cosine similarity to their centroid
+        rng = np.random.default_rng(seed)
+        centroids = embeddings[rng.choice(n_movies, size=n_lists, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            assignments = np.argmax(embeddings @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, embeddings)
+            # Empty clusters keep their centroid
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = normalize(sums).astype(np.float32)
+        assignments = np.argmax(embeddings @ centroids.T, axis=1)
+
+        list_members = np.argsort(assignments, kind="stable").astype(np.int32)
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=n_lists), out=list_offsets[1:])
+
+        logging.info("IVF index built in %.2f seconds (%d components, %d lists)", time.time() - start_time,
+                     n_components, n_lists)
+        return cls(matrix, components, embeddings, centroids, list_offsets, list_members, n_probes, n_candidates)
+
+    def candidates(self, embedding: np.ndarray, n_neighbors: int) -> np.ndarray:
+        """Positions of the best movies of the probed clusters in the embedding space (for one query embedding)."""
+        n_probes = min(self.n_probes, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ embedding), n_probes - 1)[:n_probes]
+        members = np.concatenate([self.list_members[self.list_offsets[i]:self.list_offsets[i + 1]] for i in probes])
+
+        n_candidates = max(self.n_candidates, n_neighbors)
+        if len(members) <= n_candidates:
+            return members
+        scores = self.embeddings[members] @ embedding
+        return members[np.argpartition(-scores, n_candidates - 1)[:n_candidates]]
+
+    def kneighbors(self, X, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate cosine distances and positions of the 'n_neighbors' closest movies of each row of 'X'.
+        A row with fewer candidates than 'n_neighbors' is answered by the brute-force search."""
+        X = csr_matrix(X)
+        query_embeddings = _embed(X, self.components)
+        distances = np.empty((X.shape[0], n_neighbors), dtype=np.float32)
+        indices = np.empty((X.shape[0], n_neighbors), dtype=np.int64)
+
+        for row in range(X.shape[0]):
+            candidates = self.candidates(query_embeddings[row], n_neighbors)
+            if len(candidates) < n_neighbors:
+                row_distances, row_indices = self.brute.kneighbors(X[row], n_neighbors)
+                distances[row], indices[row] = row_distances[0], row_indices[0]
+                continue
+            # Exact cosine distances of the candidates, sorted as in CosineNeighbors
+            dist = cosine_distances(float_values(X[row]), float_values(self.matrix[candidates]))[0]
+            top = np.argpartition(dist, n_neighbors - 1)[:n_neighbors]
+            top = top[np.argsort(dist[top])]
+            distances[row], indices[row] = dist[top], candidates[top]
+        return distances, indices
+
+    def updated(self, matrix: csr_matrix, old_to_new: np.ndarray, rows: np.ndarray) -> "IvfCosineNeighbors":
+        """Index of an updated matrix: the movies 'rows' (new positions) are re-embedded, the others are moved from
+        'old_to_new', and all movies are reassigned to the existing clusters. New users (columns) get no weight in
+        the embeddings until the index is rebuilt."""
+        components = self.components
+        if matrix.shape[1] > components.shape[0]:
+            components = np.vstack([
+                components, np.zeros((matrix.shape[1] - components.shape[0], components.shape[1]), np.float32)
+            ])
+        embeddings = np.zeros((matrix.shape[0], components.shape[1]), dtype=np.float32)
+        embeddings[old_to_new] = self.embeddings
+        embeddings[rows] = _embed(matrix[rows], components)
+
+        assignments = np.argmax(embeddings @ np.asarray(self.centroids).T, axis=1)
+        list_members = np.argsort(assignments, kind="stable").astype(np.int32)
+        list_offsets = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=len(self.centroids)), out=list_offsets[1:])
+        return IvfCosineNeighbors(matrix, components, embeddings, np.asarray(self.centroids), list_offsets,
+                                  list_members, self.n_probes, self.n_candidates)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Arrays to save with an artifact (see from_arrays())."""
+        return {
+            "components": self.components, "embeddings": self.embeddings, "centroids": self.centroids,
+            "list_offsets": self.list_offsets, "list_members": self.list_members,
+        }
+
+    @classmethod
+    def from_arrays(cls, matrix: csr_matrix, arrays: Dict[str, np.ndarray], params: dict) -> "IvfCosineNeighbors":
+        return cls(
+            matrix, arrays["components"], arrays["embeddings"], arrays["centroids"], arrays["list_offsets"],
+            arrays["list_members"], params.get("n_probes", 8), params.get("n_candidates", 500),
+        )
+
+
+def _embed(matrix: csr_matrix, components: np.ndarray) -> np.ndarray:
+    """Normalized embeddings of the normalized rows of a sparse matrix."""
+    return normalize(np.asarray(normalize(float_values(matrix)) @ components, dtype=np.float32)).astype(np.float32)
+
+
+def knn_recall_report(model, matrix: csr_matrix, k: int = 20, n_queries: int = 200, seed: int = 0) -> dict:
+    """Recall@k of an approximate model against the brute-force cosine search, on a random sample of movies (the
+    movie itself excluded), with the mean query time of both."""
+    rng = np.random.default_rng(seed)
+    n_movies = matrix.shape[0]
+    queries = rng.choice(n_movies, size=min(n_queries, n_movies), replace=False)
+    n_neighbors = min(k + 1, n_movies)
+    exact_model = CosineNeighbors(matrix)
+
+    recalls, exact_time, approx_time = [], 0.0, 0.0
+    for movie_index in queries:
+        start_time = time.perf_counter()
+        _, exact = exact_model.kneighbors(matrix[movie_index], n_neighbors)
+        exact_time += time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        _, approx = model.kneighbors(matrix[movie_index], n_neighbors)
+        approx_time += time.perf_counter() - start_time
+
+        exact_set = set(exact[0].tolist()) - {movie_index}
+        approx_set = set(approx[0].tolist()) - {movie_index}
+        recalls.append(len(exact_set & approx_set) / max(len(exact_set), 1))
+
+    return {
+        "k": k,
+        "n_queries": len(queries),
+        "recall_at_k": float(np.mean(recalls)),
+        "exact_query_ms": 1000 * exact_time / len(queries),
+        "approx_query_ms": 1000 * approx_time / len(queries),
+    }
@@ -0,0 +1,122 @@
+"""
+Parsing of the JSON requests and building of the JSON responses of the recommendation API, and parsing of the HTML
+form of /recommend.
+
+The functions are shared by the Flask app (app.py) and the ASGI app (asgi_app.py), so that both serve the same API:
+- /recommend_api: '{"data": {"movie": ..., "n_recommend": ..., "model_type": ...}}' (values in this order), answered
+  with a message line and a table;
+- /recommend_batch: '{"data": {"titles": [...], "n_recommend": 10, "model_type": "knn"}}', answered with one result
+  or error entry per title;
+- /recommend_profile: '{"data": {"liked": [...], "disliked": [...], "n_recommend": 10, "model_type": "knn"}}' (the
+  disliked titles are optional), answered with a status, a message line and a table;
+- /recommend: the title, number of recommendations and model type fields of the HTML form (in this order).
+Invalid requests raise InvalidRequest, answered with a 400 status.
+"""
+
+import json
+from typing import List, Tuple
+
+import pandas as pd
+
+from movie_recommend.utils.get_recommendations import STATUS_OK
+from movie_recommend.utils.model_registry import MODEL_TYPES
+
+
+class InvalidRequest(ValueError):
+    """Request rejected with a 400 status and its message."""
+
+
+def request_data(payload) -> dict:
+    """'data' field of a parsed JSON request body. Raises InvalidRequest if the body is not a JSON object."""
+    if not isinstance(payload, dict):
+        raise InvalidRequest("Invalid request")
+    return payload.get("data")
+
+
+def parse_single_request(input_data: dict) -> Tuple[str, int, str]:
+    """Movie title, number of recommendations and model type of a /recommend_api request."""
+    if not input_data or not isinstance(input_data, dict):
+        raise InvalidRequest("Invalid request")
+    return parse_form_request(list(input_data.values()))
+
+
+def parse_form_request(values: List[str]) -> Tuple[str, int, str]:
+    """Movie title, number of recommendations and model type of the values of a /recommend form (blank values
+    included, so that a blank field is rejected rather than shifting the others)."""
+    if len(values) != 3:
+        raise InvalidRequest("Invalid request")
+    movie_to_compare, n_recommend, model_type = values
+    try:
+        n_recommend = int(n_recommend)
+    except (TypeError, ValueError):
+        raise InvalidRequest("Invalid request")
+
+    if (not isinstance(movie_to_compare, str) or not movie_to_compare or model_type not in MODEL_TYPES
+            or n_recommend < 1):
+        raise InvalidRequest("Invalid request")
+    return movie_to_compare, n_recommend, model_type
+
+
+def single_response(first_line: str, final_table: pd.DataFrame) -> dict:
+    """JSON response of a /recommend_api request."""
+    return {
+        "json_string": json.dumps({"message": first_line}),
+        "json_table": final_table.to_json(orient="table"),
+    }
+
+
+def parse_batch_request(input_data: dict, max_titles: int) -> Tuple[List[str], int, str]:
+    """Movie titles, number of recommendations and model type of a /recommend_batch request."""
+    if not input_data or not isinstance(input_data, dict):
+        raise InvalidRequest("Invalid request")
+
+    movies_to_compare = input_data.get("titles")
+    model_type = input_data.get("model_type")
+    try:
+        n_recommend = int(input_data.get("n_recommend"))
+    except (TypeError, ValueError):
+        raise InvalidRequest("Invalid request")
+
+    if (not isinstance(movies_to_compare, list) or not movies_to_compare or model_type not in MODEL_TYPES
+            or n_recommend < 1 or not all(isinstance(movie, str) for movie in movies_to_compare)):
+        raise InvalidRequest("Invalid request")
+    if len(movies_to_compare) > max_titles:
+        raise InvalidRequest(f"Too many titles (maximum {max_titles})")
+    return movies_to_compare, n_recommend, model_type
+
+
+def batch_response(movies_to_compare: List[str], results: List[Tuple[str, str, pd.DataFrame]]) -> dict:
+    """JSON response of a /recommend_batch request. Unknown titles (or titles without enough ratings) get an error
+    entry with suggested titles."""
+    response = []
+    for movie_to_compare, (status, first_line, final_table) in zip(movies_to_compare, results):
+        entry = {"title": movie_to_compare, "status": status, "json_table": final_table.to_json(orient="table")}
+        entry["message" if status == STATUS_OK else "error"] = first_line
+        response.append(entry)
+    return {"results": response}
+
+
+def parse_profile_request(input_data: dict, max_titles: int) -> Tuple[List[str], List[str], int, str]:
+    """Liked and disliked titles, number of recommendations and model type of a /recommend_profile request."""
+    if not input_data or not isinstance(input_data, dict):
+        raise InvalidRequest("Invalid request")
+
+    liked = input_data.get("liked")
+    disliked = input_data.get("disliked") or []
+    model_type = input_data.get("model_type")
+    try:
+        n_recommend = int(input_data.get("n_recommend"))
+    except (TypeError, ValueError):
+        raise InvalidRequest("Invalid request")
+
+    if (not isinstance(liked, list) or not liked or not isinstance(disliked, list) or model_type not in MODEL_TYPES
+            or n_recommend < 1 or not all(isinstance(movie, str) for movie in liked + disliked)):
+        raise InvalidRequest("Invalid request")
+    if len(liked) + len(disliked) > max_titles:
+        raise InvalidRequest(f"Too many titles (maximum {max_titles})")
+    return liked, disliked, n_recommend, model_type
+
+
+def profile_response(status: str, first_line: str, final_table: pd.DataFrame) -> dict:
+    """JSON response of a /recommend_profile request."""
+    return {"status": status, **single_response(first_line, final_table)}
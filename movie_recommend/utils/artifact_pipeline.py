@@ -0,0 +1,221 @@
+"""
+Production pipeline of model artifacts.
+
+The stages shared by all models of a dataset (loading, merging, mean ratings, filtering and the sparse rating matrix)
+run once per dataset size, and their output is saved to a temporary folder of '.npy' files. The model builds (top-K
+neighbor tables and artifact writing) are then fanned out to a process pool: each worker memory-maps the shared data
+instead of receiving a pickled copy. Several dataset sizes can be processed at the same time. The wall time and peak
+RSS of every stage are logged at the end. With a memory limit, the ratings file is streamed in chunks instead of being
+loaded and merged at once (see rating_ingest.py).
+"""
+
+import os
+import shutil
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional
+
+import movie_recommend.constants as c
+from movie_recommend.model_types import ModelTypeKnn
+from movie_recommend.utils.ann_index import knn_recall_report
+from movie_recommend.utils.artifact_store import (
+    get_artifact_dir_name,
+    load_dataset,
+    load_pending,
+    save_dataset,
+    write_artifact
+)
+from movie_recommend.utils.get_databases import fetch_db_files, get_db, read_movies_table
+from movie_recommend.utils.neighbor_table import corr_neighbor_table, knn_neighbor_table
+from movie_recommend.utils.rating_ingest import ingest_ratings
+from movie_recommend.utils.recommendation_algorithms import corr_min_periods
+from movie_recommend.utils.stage_timer import StageTimer, log_stage_report
+from movie_recommend.utils.table_formatting import (
+    filter_movies_by_rating_count,
+    mean_rating_table,
+    merged_table,
+    sparse_pivot_ratings
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def get_shared_dir_name(db_size: str) -> str:
+    return f".shared_{db_size}"
+
+
+def prepare_dataset(
+    db_size: str, rating_threshold: int, shared_dir: str, load_db: Callable = get_db,
+    memory_limit_mb: Optional[float] = None, fetch_files: Callable = fetch_db_files
+) -> List[dict]:
+    """Run the stages shared by all models of a dataset and save their output to 'shared_dir'.
+    With 'memory_limit_mb', the ratings file is streamed in chunks (see rating_ingest.py) instead of loaded at once."""
+    timer = StageTimer(f"{db_size} dataset")
+    if memory_limit_mb:
+        return prepare_dataset_streaming(db_size, rating_threshold, shared_dir, memory_limit_mb, fetch_files, timer)
+
+    with timer.stage("get_db"):
+        movies_df, rating_df = load_db(db_size, compact=True)
+        total_movie_array = movies_df[c.TITLE].to_numpy(dtype=object)
+        movie_ids = movies_df[c.MOVIE_ID].astype(str).to_numpy(dtype=object)
+    logging.info("The total number of movies in the '%s' database: %d", db_size, len(total_movie_array))
+    logging.info("The total number of ratings in the '%s' database: %d", db_size, len(rating_df.index))
+
+    with timer.stage("merged_table"):
+        movie_rating_df = merged_table(movies_df, rating_df)
+        del movies_df, rating_df
+    with timer.stage("mean_rating_table"):
+        all_ratings = mean_rating_table(movie_rating_df)
+    with timer.stage("filter_movies_by_rating_count"):
+        rating_movie_per_user = filter_movies_by_rating_count(movie_rating_df, rating_threshold)
+        # Ratings of the movies below the threshold, kept for incremental updates
+        pending_ratings = movie_rating_df[movie_rating_df[c.TOTAL_RATING_COUNT].values <= rating_threshold]
+        del movie_rating_df
+    with timer.stage("sparse_pivot_ratings"):
+        # Sparse "Title vs Users" matrix of ratings, shared by all models
+        features = sparse_pivot_ratings(rating_movie_per_user)
+        pending = sparse_pivot_ratings(pending_ratings)
+    logging.info("Number of movies with more than %d ratings: %d", rating_threshold, len(features))
+
+    with timer.stage("save shared data"):
+        shutil.rmtree(shared_dir, ignore_errors=True)
+        os.makedirs(shared_dir)
+        save_dataset(shared_dir, features, all_ratings, total_movie_array, pending, movie_ids)
+    return timer.records
+
+
+def prepare_dataset_streaming(
+    db_size: str, rating_threshold: int, shared_dir: str, memory_limit_mb: float, fetch_files: Callable,
+    timer: StageTimer
+) -> List[dict]:
+    """prepare_dataset() with the ratings file streamed in chunks under a memory limit."""
+    with timer.stage("read movies"):
+        movies_path, ratings_path = fetch_files(db_size)
+        movies_df = read_movies_table(movies_path, compact=True)
+        total_movie_array = movies_df[c.TITLE].to_numpy(dtype=object)
+        movie_ids = movies_df[c.MOVIE_ID].astype(str).to_numpy(dtype=object)
+    with timer.stage("ingest_ratings"):
+        features, pending, all_ratings = ingest_ratings(movies_df, ratings_path, rating_threshold, memory_limit_mb)
+    logging.info("Number of movies with more than %d ratings: %d", rating_threshold, len(features))
+
+    with timer.stage("save shared data"):
+        shutil.rmtree(shared_dir, ignore_errors=True)
+        os.makedirs(shared_dir)
+        save_dataset(shared_dir, features, all_ratings, total_movie_array, pending, movie_ids)
+    return timer.records
+
+
+def build_artifact(
+    model_type: str, db_size: str, rating_threshold: int, shared_dir: str, out_dir: str, n_neighbors: int,
+    knn_backend: str = "brute", ivf_params: Optional[dict] = None
+) -> List[dict]:
+    """Build and save the artifact of one model ('knn' or 'corr') from the shared data of a dataset."""
+    timer = StageTimer(f"{model_type} {db_size}")
+    features, all_ratings, total_movie_array = load_dataset(shared_dir)
+    pending, movie_ids = load_pending(shared_dir)
+    dir_path = os.path.join(out_dir, get_artifact_dir_name(model_type, db_size))
+
+    if model_type == "knn":
+        with timer.stage(f"knn model ({knn_backend})"):
+            # Nearest neighbors search model
+            knn_model = ModelTypeKnn.build_model(
+                features.values(), knn_backend, **((ivf_params or {}) if knn_backend == "ivf" else {})
+            )
+        knn_index, knn_recall = None, None
+        if knn_backend != "brute":
+            knn_index = knn_model
+            with timer.stage("knn recall report"):
+                knn_recall = knn_recall_report(knn_model, features.values())
+            logging.info("Recall@%d of the '%s' backend: %.3f (%.2f ms per query, brute force: %.2f ms)",
+                         knn_recall["k"], knn_backend, knn_recall["recall_at_k"],
+                         knn_recall["approx_query_ms"], knn_recall["exact_query_ms"])
+
+        with timer.stage("knn neighbor table"):
+            # Top-K neighbors of every movie
+            neighbors = knn_neighbor_table(features, n_neighbors, model=knn_model)
+        with timer.stage("write artifact"):
+            write_artifact(dir_path, "knn", db_size, features, all_ratings, total_movie_array, rating_threshold,
+                           neighbors, knn_index, knn_recall, pending, movie_ids)
+
+    elif model_type == "corr":
+        with timer.stage("corr neighbor table"):
+            # Top-K correlated movies of every movie
+            neighbors = corr_neighbor_table(features, n_neighbors, corr_min_periods(all_ratings))
+        with timer.stage("write artifact"):
+            write_artifact(dir_path, "corr", db_size, features, all_ratings, total_movie_array, rating_threshold,
+                           neighbors, pending=pending, movie_ids=movie_ids)
+
+    else:
+        raise ValueError(f"Unknown model type: {model_type}")
+    return timer.records
+
+
+class InlineExecutor:
+    """Executor running every task in the calling process (used with a single worker)."""
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def produce_artifacts(
+    datasets: Dict[str, int], model_types: Iterable[str] = ("knn", "corr"), out_dir: str = c.PKL_DIR,
+    n_workers: int = 1, n_neighbors: int = 200, knn_backend: str = "brute", ivf_params: Optional[dict] = None,
+    load_db: Callable = get_db, memory_limit_mb: Optional[float] = None, fetch_files: Callable = fetch_db_files
+) -> List[dict]:
+    """Build the artifacts of all model types for all datasets ('db_size -> rating_threshold').
+    With 'n_workers' > 1, datasets are prepared and models are built in parallel worker processes. With
+    'memory_limit_mb', the ratings files are streamed in chunks under this memory limit.
+    Returns the stage records (wall time and peak RSS of each stage)."""
+    os.makedirs(out_dir, exist_ok=True)
+    model_types = tuple(model_types)
+    records = []
+    executor = ProcessPoolExecutor(n_workers) if n_workers > 1 else InlineExecutor()
+
+    try:
+        with executor:
+            prepared = {
+                executor.submit(prepare_dataset, db_size, rating_threshold,
+                                os.path.join(out_dir, get_shared_dir_name(db_size)), load_db, memory_limit_mb,
+                                fetch_files): db_size
+                for db_size, rating_threshold in datasets.items()
+            }
+
+            # Model builds of a dataset start as soon as its shared stages are done
+            builds = {}
+            for future in as_completed(prepared):
+                db_size = prepared[future]
+                try:
+                    records += future.result()
+                except Exception as e:
+                    logging.error("Error processing the '%s' dataset: %s", db_size, e)
+                    continue
+                for model_type in model_types:
+                    builds[executor.submit(
+                        build_artifact, model_type, db_size, datasets[db_size],
+                        os.path.join(out_dir, get_shared_dir_name(db_size)), out_dir, n_neighbors, knn_backend,
+                        ivf_params
+                    )] = (model_type, db_size)
+
+            for future in as_completed(builds):
+                try:
+                    records += future.result()
+                except Exception as e:
+                    logging.error("Error processing model '%s' (%s dataset): %s", *builds[future], e)
+    finally:
+        for db_size in datasets:
+            shutil.rmtree(os.path.join(out_dir, get_shared_dir_name(db_size)), ignore_errors=True)
+
+    log_stage_report(records)
+    return records
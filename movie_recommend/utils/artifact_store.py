@@ -0,0 +1,348 @@
+"""
+Directory-based storage of model artifacts.
+
+An artifact is a folder with raw '.npy' arrays and a small 'manifest.json':
+- 'data.npy', 'indices.npy', 'indptr.npy': CSR arrays of the 'Title vs Users' rating matrix, with 'uint8' ratings in
+  half stars (see rating_matrix.py; format 1 artifacts have 'float64' ratings, encoded in memory when opened);
+- 'counts_*.npy' (optional): CSR arrays of the numbers of ratings of the cells that average several ratings of a user
+  (movies sharing a title), used to weight these averages in incremental updates;
+- 'averages_*.npy' (optional): CSR arrays of the exact values of the averages between half stars (stored rounded in
+  'data.npy'), in 'float64' numbers of half stars;
+- 'titles', 'users', 'ratings_title', 'total_titles': strings stored as a UTF-8 buffer ('*_bytes.npy') plus
+  offsets ('*_offsets.npy');
+- 'ratings_mean.npy', 'ratings_count.npy': mean rating and number of ratings per movie ('all_ratings' table);
+- 'neighbor_indices.npy', 'neighbor_scores.npy' (optional): precomputed top-K neighbor table of every movie, with
+  scores in the dtype of the live computation ('float32' distances, 'float64' correlations);
+- 'search_total_*', 'search_features_*': n-gram indexes for fuzzy search of all titles and of the model's titles;
+- 'ivf_*.npy' (optional): approximate nearest neighbors index of the KNN model (see ann_index.py);
+- 'cosine_*.npy' (KNN model with the brute-force search): CSR arrays of the L2-normalized movie rows, transposed, of
+  the exact cosine search (see CosineNeighbors; built when the artifact is opened if missing);
+- 'movie_ids', 'pending_*' (optional): movie IDs of 'total_titles', and the ratings of the movies below the rating
+  threshold, used by incremental updates (see artifact_update.py).
+
+Numeric arrays are opened with np.load(mmap_mode="r"), so all processes serving the same artifact share one copy in
+the page cache instead of unpickling it into their own heap.
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import itertools
+import logging
+import datetime
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix, issparse
+
+import movie_recommend.constants as c
+from movie_recommend.utils.ann_index import IvfCosineNeighbors
+from movie_recommend.utils.neighbor_table import SCORE_DTYPES, NeighborTable
+from movie_recommend.utils.rating_matrix import RatingMatrix
+from movie_recommend.utils.recommendation_algorithms import CosineNeighbors
+from movie_recommend.utils.string_arrays import load_strings, save_strings
+from movie_recommend.utils.title_search import TitleResolver, TitleSearchIndex
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+ARTIFACT_FORMAT_VERSION = 2
+# Format versions that can be opened
+READABLE_FORMAT_VERSIONS = (1, 2)
+MANIFEST_FILE = "manifest.json"
+IVF_ARRAYS = ("components", "embeddings", "centroids", "list_offsets", "list_members")
+COSINE_ARRAYS = ("data", "indices", "indptr")
+
+# Numbers identifying artifacts loaded from pickle files (these have no checksum)
+_load_numbers = itertools.count()
+
+
+class ModelArtifact:
+    """Loaded model data shared between requests: movie features, trained model, ratings and movie titles."""
+
+    def __init__(self, features_df, model, all_ratings, total_movie_array, manifest: Optional[dict] = None,
+                 neighbors: Optional[NeighborTable] = None, title_search: Optional[TitleSearchIndex] = None,
+                 feature_title_search: Optional[TitleSearchIndex] = None,
+                 title_resolver: Optional[TitleResolver] = None):
+        self.features_df = features_df
+        self.model = model
+        self.all_ratings = all_ratings
+        self.total_movie_array = total_movie_array
+        self.manifest = manifest or {}
+        self.neighbors = neighbors
+        # Fuzzy search indexes over 'total_movie_array' and over the titles of 'features_df'
+        self.title_search = title_search
+        self.feature_title_search = feature_title_search
+        # Exact and normalized titles of 'total_movie_array', resolved with a dictionary lookup
+        self.title_resolver = title_resolver
+        self.load_number = next(_load_numbers)
+
+    def as_tuple(self) -> Tuple:
+        return self.features_df, self.model, self.all_ratings, self.total_movie_array
+
+    @property
+    def nbytes(self) -> int:
+        """Memory size of the arrays and tables of the artifact in bytes (memory-mapped arrays at their full size)."""
+        parts = (self.features_df, self.model, self.all_ratings, self.total_movie_array, self.neighbors,
+                 self.title_search, self.feature_title_search)
+        return sum(data_nbytes(part) for part in parts)
+
+    @property
+    def version(self) -> Tuple:
+        """Identifies the loaded data: format version and checksum of an artifact folder, or a number unique to each
+        load for artifacts loaded from pickle files."""
+        if self.manifest.get("checksum"):
+            return self.manifest.get("format_version"), self.manifest["checksum"]
+        return "pickle", self.load_number
+
+
+def data_nbytes(data) -> int:
+    """Memory size of an array, a table or a model part in bytes (Python strings of object arrays included)."""
+    if isinstance(data, np.ndarray):
+        if data.dtype == object:
+            return data.nbytes + sum(sys.getsizeof(value) for value in data.flat)
+        return data.nbytes
+    if isinstance(data, pd.DataFrame):
+        return int(data.memory_usage(index=True, deep=True).sum())
+    if issparse(data):
+        return data.data.nbytes + data.indices.nbytes + data.indptr.nbytes
+    if isinstance(data, (list, tuple)):
+        return sum(sys.getsizeof(value) for value in data)
+    if isinstance(data, RatingMatrix):
+        parts = (data.matrix, data.titles, data.users) + tuple(
+            extra for extra in (data.counts, data.averages) if extra is not None
+        )
+    elif isinstance(data, NeighborTable):
+        parts = (data.indices, data.scores)
+    elif isinstance(data, TitleSearchIndex):
+        parts = (data.keys, data.offsets, data.postings)
+    elif isinstance(data, CosineNeighbors):
+        # The rating matrix is shared with the features
+        parts = (data.vectors,)
+    elif isinstance(data, IvfCosineNeighbors):
+        # The rating matrix is shared with the features
+        parts = tuple(getattr(data, name) for name in IVF_ARRAYS)
+    else:
+        # Models sharing the rating matrix of the features, and legacy models
+        return 0
+    return sum(data_nbytes(part) for part in parts)
+
+
+def get_artifact_dir_name(model_type: str, db_size: str) -> str:
+    return f"{model_type}_model_{db_size}"
+
+
+def build_title_resolver(total_movie_array: np.ndarray, all_ratings: pd.DataFrame) -> TitleResolver:
+    """Title resolver over all titles; ambiguous variants resolve to the most rated title."""
+    rating_counts = dict(zip(all_ratings[c.TITLE], all_ratings[c.TOTAL_RATING_COUNT]))
+    return TitleResolver.build(total_movie_array, rating_counts)
+
+
+def save_title_search(dir_path: str, name: str, index: TitleSearchIndex) -> None:
+    """Save the n-gram keys, offsets and postings of a title search index."""
+    save_strings(dir_path, f"{name}_keys", index.keys)
+    np.save(os.path.join(dir_path, f"{name}_offsets.npy"), index.offsets)
+    np.save(os.path.join(dir_path, f"{name}_postings.npy"), index.postings)
+
+
+def load_title_search(
+    dir_path: str, name: str, titles: np.ndarray, mmap_mode: Optional[str] = "r"
+) -> TitleSearchIndex:
+    """Load a title search index saved by save_title_search()."""
+    return TitleSearchIndex(
+        titles,
+        load_strings(dir_path, f"{name}_keys"),
+        np.load(os.path.join(dir_path, f"{name}_offsets.npy"), mmap_mode=mmap_mode),
+        np.load(os.path.join(dir_path, f"{name}_postings.npy"), mmap_mode=mmap_mode),
+    )
+
+
+def save_rating_matrix(dir_path: str, features: RatingMatrix, prefix: str = "") -> csr_matrix:
+    """Save the CSR arrays, titles and users of a rating matrix, and the numbers of ratings of the cells that average
+    several ratings and the exact averages between half stars, if any. Returns the saved (canonical) CSR matrix."""
+    matrix = csr_matrix(features.matrix)
+    matrix.sum_duplicates()
+    np.save(os.path.join(dir_path, f"{prefix}data.npy"), matrix.data)
+    np.save(os.path.join(dir_path, f"{prefix}indices.npy"), matrix.indices)
+    np.save(os.path.join(dir_path, f"{prefix}indptr.npy"), matrix.indptr)
+    for extra_name in ("counts", "averages"):
+        extra = getattr(features, extra_name)
+        if extra is not None:
+            extra = csr_matrix(extra)
+            extra.sum_duplicates()
+            for name in ("data", "indices", "indptr"):
+                np.save(os.path.join(dir_path, f"{prefix}{extra_name}_{name}.npy"), getattr(extra, name))
+    save_strings(dir_path, f"{prefix}titles", features.titles)
+    save_strings(dir_path, f"{prefix}users", features.users)
+    return matrix
+
+
+def load_rating_matrix(dir_path: str, prefix: str = "", mmap_mode: Optional[str] = "r") -> RatingMatrix:
+    """Load a rating matrix saved by save_rating_matrix()."""
+    def load_array(name: str) -> np.ndarray:
+        return np.load(os.path.join(dir_path, f"{prefix}{name}.npy"), mmap_mode=mmap_mode)
+
+    titles, users = load_strings(dir_path, f"{prefix}titles"), load_strings(dir_path, f"{prefix}users")
+    shape = (len(titles), len(users))
+    matrix = csr_matrix((load_array("data"), load_array("indices"), load_array("indptr")), shape=shape, copy=False)
+    def load_extra(name: str) -> Optional[csr_matrix]:
+        if not os.path.exists(os.path.join(dir_path, f"{prefix}{name}_data.npy")):
+            return None
+        return csr_matrix((load_array(f"{name}_data"), load_array(f"{name}_indices"), load_array(f"{name}_indptr")),
+                          shape=shape, copy=False)
+
+    return RatingMatrix(matrix, titles, users, load_extra("counts"), load_extra("averages"))
+
+
+def save_dataset(
+    dir_path: str, features: RatingMatrix, all_ratings: pd.DataFrame, total_movie_array: np.ndarray,
+    pending: Optional[RatingMatrix] = None, movie_ids: Optional[np.ndarray] = None
+) -> csr_matrix:
+    """Save the rating matrix, the 'all_ratings' table and all titles, and optionally the data needed by incremental
+    updates: the ratings of the movies below the rating threshold and the movie IDs of all titles.
+    Returns the saved (canonical) CSR matrix."""
+    matrix = save_rating_matrix(dir_path, features)
+
+    save_strings(dir_path, "ratings_title", all_ratings[c.TITLE].values)
+    np.save(os.path.join(dir_path, "ratings_mean.npy"), all_ratings[c.MEAN_RATING].to_numpy())
+    np.save(os.path.join(dir_path, "ratings_count.npy"), all_ratings[c.TOTAL_RATING_COUNT].to_numpy())
+    save_strings(dir_path, "total_titles", total_movie_array)
+
+    if pending is not None and movie_ids is not None:
+        save_rating_matrix(dir_path, pending, prefix="pending_")
+        save_strings(dir_path, "movie_ids", movie_ids)
+    return matrix
+
+
+def load_dataset(dir_path: str, mmap_mode: Optional[str] = "r") -> Tuple[RatingMatrix, pd.DataFrame, np.ndarray]:
+    """Load the rating matrix (memory-mapped unless 'mmap_mode' is None), 'all_ratings' and all titles saved by
+    save_dataset()."""
+    def load_array(name: str) -> np.ndarray:
+        return np.load(os.path.join(dir_path, f"{name}.npy"), mmap_mode=mmap_mode)
+
+    features = load_rating_matrix(dir_path, mmap_mode=mmap_mode)
+    all_ratings = pd.DataFrame({
+        c.TITLE: load_strings(dir_path, "ratings_title"),
+        c.MEAN_RATING: np.asarray(load_array("ratings_mean")),
+        c.TOTAL_RATING_COUNT: np.asarray(load_array("ratings_count")),
+    })
+    return features, all_ratings, load_strings(dir_path, "total_titles")
+
+
+def load_pending(dir_path: str, mmap_mode: Optional[str] = "r") -> Optional[Tuple[RatingMatrix, np.ndarray]]:
+    """Ratings of the movies below the rating threshold and movie IDs of all titles, or None if they weren't saved."""
+    if not os.path.exists(os.path.join(dir_path, "movie_ids_offsets.npy")):
+        return None
+    return load_rating_matrix(dir_path, "pending_", mmap_mode), load_strings(dir_path, "movie_ids")
+
+
+def directory_checksum(dir_path: str) -> str:
+    """SHA-256 of all array files of an artifact."""
+    sha = hashlib.sha256()
+    for file_name in sorted(os.listdir(dir_path)):
+        if not file_name.endswith(".npy"):
+            continue
+        sha.update(file_name.encode("utf-8"))
+        with open(os.path.join(dir_path, file_name), "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+    return sha.hexdigest()
+
+
+def write_artifact(
+    dir_path: str, model_type: str, db_size: str, features: RatingMatrix, all_ratings: pd.DataFrame,
+    total_movie_array: np.ndarray, rating_threshold: int, neighbors: Optional[NeighborTable] = None,
+    knn_index: Optional[IvfCosineNeighbors] = None, knn_recall: Optional[dict] = None,
+    pending: Optional[RatingMatrix] = None, movie_ids: Optional[np.ndarray] = None, update: Optional[dict] = None
+) -> dict:
+    """Write a model artifact folder. The folder is written aside and then swapped in place.
+    An approximate KNN index is saved with its parameters and, if given, its recall report. 'pending' and 'movie_ids'
+    allow incremental updates of the artifact; 'update' describes the update that produced it (see artifact_update.py).
+    """
+    tmp_path = dir_path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    matrix = save_dataset(tmp_path, features, all_ratings, total_movie_array, pending, movie_ids)
+    save_title_search(tmp_path, "search_total", TitleSearchIndex.build(total_movie_array))
+    save_title_search(tmp_path, "search_features", TitleSearchIndex.build(features.titles))
+
+    if neighbors is not None:
+        np.save(os.path.join(tmp_path, "neighbor_indices.npy"), neighbors.indices.astype(np.int32))
+        np.save(os.path.join(tmp_path, "neighbor_scores.npy"), neighbors.scores.astype(SCORE_DTYPES[model_type]))
+
+    if knn_index is not None:
+        for name, array in knn_index.arrays().items():
+            np.save(os.path.join(tmp_path, f"ivf_{name}.npy"), array)
+    elif model_type == "knn":
+        # Normalized vectors of the exact cosine search, from the saved matrix
+        for name, array in CosineNeighbors.build(matrix).arrays().items():
+            np.save(os.path.join(tmp_path, f"cosine_{name}.npy"), array)
+
+    manifest = {
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        "model_type": model_type,
+        "db_size": db_size,
+        "rating_threshold": rating_threshold,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "shape": list(matrix.shape),
+        "nnz": int(matrix.nnz),
+        "neighbors_k": neighbors.k if neighbors is not None else 0,
+        "knn_backend": "ivf" if knn_index is not None else "brute",
+        "knn_params": knn_index.params if knn_index is not None else {},
+        "knn_recall": knn_recall or {},
+        "version": (update or {}).get("version", 1),
+        "update": update or {},
+        "checksum": directory_checksum(tmp_path),
+    }
+    with open(os.path.join(tmp_path, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(dir_path, ignore_errors=True)
+    os.replace(tmp_path, dir_path)
+    logging.info("Artifact saved to: %s", dir_path)
+    return manifest
+
+
+def read_artifact(dir_path: str, mmap_mode: Optional[str] = "r") -> ModelArtifact:
+    """Open a model artifact folder. The rating matrix is memory-mapped unless 'mmap_mode' is None."""
+    with open(os.path.join(dir_path, MANIFEST_FILE), "r") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") not in READABLE_FORMAT_VERSIONS:
+        raise ValueError(f"Unsupported artifact format version: {manifest.get('format_version')}")
+
+    def load_array(name: str) -> np.ndarray:
+        return np.load(os.path.join(dir_path, f"{name}.npy"), mmap_mode=mmap_mode)
+
+    features, all_ratings, total_movie_array = load_dataset(dir_path, mmap_mode)
+    matrix = features.values()
+
+    model = None
+    if manifest["model_type"] == "knn":
+        if manifest.get("knn_backend") == "ivf":
+            arrays = {name: load_array(f"ivf_{name}") for name in IVF_ARRAYS}
+            model = IvfCosineNeighbors.from_arrays(matrix, arrays, manifest["knn_params"])
+        elif os.path.exists(os.path.join(dir_path, "cosine_data.npy")):
+            model = CosineNeighbors.from_arrays(matrix, {name: load_array(f"cosine_{name}") for name in COSINE_ARRAYS})
+        else:
+            model = CosineNeighbors(matrix)
+
+    neighbors = None
+    if manifest.get("neighbors_k"):
+        scores = load_array("neighbor_scores")
+        if scores.dtype == SCORE_DTYPES[manifest["model_type"]]:
+            neighbors = NeighborTable(load_array("neighbor_indices"), scores)
+        else:
+            # Correlations of former artifacts were saved in 'float32': lookups would not match the live computation
+            logging.warning("Neighbor table of '%s' ignored (%s scores), rebuild the artifact to use it", dir_path,
+                            scores.dtype)
+
+    return ModelArtifact(
+        features, model, all_ratings, total_movie_array, manifest, neighbors,
+        load_title_search(dir_path, "search_total", total_movie_array, mmap_mode),
+        load_title_search(dir_path, "search_features", features.titles, mmap_mode),
+        build_title_resolver(total_movie_array, all_ratings),
+    )
@@ -0,0 +1,265 @@
+"""
+Incremental updates of model artifacts from a delta of new ratings.
+
+A delta is a CSV file of new ratings with the columns of the MovieLens ratings file ('userId', 'movieId', 'rating').
+Instead of rebuilding an artifact from the full dataset, update_artifact() patches it:
+- the mean rating and the number of ratings of the rated movies ('all_ratings');
+- the rows of the rated movies in the rating matrix, with new users appended as columns. As in the full build, several
+  ratings of a user for the same title are averaged; a new rating of an already stored (title, user) pair is averaged
+  with the stored average, weighted by the number of ratings it holds (see RatingMatrix.counts). Stored averages are
+  exact (see RatingMatrix.averages), so the result only differs from a full rebuild by floating-point rounding;
+- the movies below the rating threshold ('pending' ratings) that cross it are moved to the rating matrix;
+- the neighbor table, where only the rows of the rated and admitted movies and the rows that lost a neighbor are
+  recomputed (see neighbor_table.update_neighbor_table());
+- the embeddings of the approximate KNN index, if any (its clusters are kept).
+
+Cost: the similarities, the expensive part of a full build, are only computed for the touched movies (the rated and
+admitted ones and the rows that lost a neighbor), and ratings are only merged in the rows of the rated movies. The
+rest of the update is still linear in the size of the artifact, with simple array operations: the new version of
+every array is copied and written (with its checksum), the user labels are indexed to place the new ratings, the
+similarities of the touched movies are merged into every row of the neighbor table (movies x K), the rows are
+reordered when movies are admitted, and the IVF index reassigns all embeddings to its clusters.
+"""
+
+import os
+import time
+import logging
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix, csr_matrix
+
+import movie_recommend.constants as c
+from movie_recommend.utils.ann_index import IvfCosineNeighbors
+from movie_recommend.utils.artifact_store import get_artifact_dir_name, load_pending, read_artifact, write_artifact
+from movie_recommend.utils.neighbor_table import update_neighbor_table
+from movie_recommend.utils.rating_matrix import COUNT_DTYPE, RatingMatrix, as_half_stars, multi_counts, off_half_stars
+from movie_recommend.utils.recommendation_algorithms import corr_min_periods
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def read_ratings_delta(path: str) -> pd.DataFrame:
+    """Read a CSV file of new ratings ('userId', 'movieId', 'rating')."""
+    return pd.read_csv(
+        path, usecols=[c.USER_ID, c.MOVIE_ID, c.RATING],
+        dtype={c.USER_ID: str, c.MOVIE_ID: str, c.RATING: np.float32}
+    ).dropna()
+
+
+def enlarged(matrix: csr_matrix, shape: Tuple[int, int]) -> csr_matrix:
+    """'matrix' with empty rows and columns appended up to 'shape' (the arrays are shared)."""
+    indptr = np.concatenate([matrix.indptr, np.full(shape[0] - matrix.shape[0], matrix.indptr[-1],
+                                                    dtype=matrix.indptr.dtype)])
+    return csr_matrix((matrix.data, matrix.indices, indptr), shape=shape, copy=False)
+
+
+def replace_rows(matrix: csr_matrix, rows: np.ndarray, new_rows: csr_matrix) -> csr_matrix:
+    """Copy of 'matrix' with its rows 'rows' (sorted) replaced by the rows of 'new_rows'. The other rows are copied
+    as they are, without any computation on their values."""
+    lengths = np.diff(matrix.indptr)
+    new_lengths = lengths.copy()
+    new_lengths[rows] = np.diff(new_rows.indptr)
+    indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(new_lengths, out=indptr[1:])
+
+    kept = np.ones(len(lengths), dtype=bool)
+    kept[rows] = False
+    old_kept, new_kept = np.repeat(kept, lengths), np.repeat(kept, new_lengths)
+    data = np.empty(indptr[-1], dtype=matrix.dtype)
+    indices = np.empty(indptr[-1], dtype=matrix.indices.dtype)
+    data[new_kept], indices[new_kept] = matrix.data[old_kept], matrix.indices[old_kept]
+    data[~new_kept], indices[~new_kept] = new_rows.data, new_rows.indices
+    return csr_matrix((data, indices, indptr), shape=matrix.shape)
+
+
+def add_ratings(
+    ratings: RatingMatrix, titles: np.ndarray, users: np.ndarray, values: np.ndarray,
+    counts: Optional[np.ndarray] = None
+) -> RatingMatrix:
+    """Add ratings to a rating matrix; each value may be the average of 'counts' ratings (one by default). New titles
+    and users are appended as rows and columns. Ratings of the same (title, user) pair are averaged with the stored
+    average, weighted by its number of ratings (see RatingMatrix.counts).
+    Only the rows of the rated titles are computed, the other rows are copied."""
+    positions = ratings.positions
+    new_titles = pd.unique(np.asarray([title for title in titles if title not in positions], dtype=object))
+    users = np.asarray([str(user) for user in users], dtype=object)
+    user_index = pd.Index(np.asarray(ratings.users).astype(str))
+    user_codes = user_index.get_indexer(users)
+    new_users = pd.unique(users[user_codes < 0])
+
+    n_titles, n_users = len(ratings.titles), len(ratings.users)
+    all_titles = np.concatenate([np.asarray(ratings.titles, dtype=object), new_titles.astype(object)])
+    all_users = np.concatenate([np.asarray(ratings.users, dtype=object), new_users.astype(object)])
+    new_positions = {title: n_titles + i for i, title in enumerate(new_titles)}
+    user_codes[user_codes < 0] = n_users + pd.Index(new_users).get_indexer(users[user_codes < 0])
+    shape = (len(all_titles), len(all_users))
+
+    # Sums and numbers of the new ratings of the rated rows
+    title_codes = np.fromiter((positions[title] if title in positions else new_positions[title] for title in titles),
+                              dtype=np.int64, count=len(titles))
+    rows = np.unique(title_codes)
+    coords = (np.searchsorted(rows, title_codes), user_codes)
+    counts = np.ones(len(values)) if counts is None else np.asarray(counts, dtype=np.float64)
+    sub_shape = (len(rows), shape[1])
+    sums = coo_matrix((np.asarray(values, dtype=np.float64) * counts, coords), shape=sub_shape).tocsr()
+    new_counts = coo_matrix((counts, coords), shape=sub_shape).tocsr()
+
+    # Stored averages of these rows, weighted by their numbers of ratings (new titles have empty rows)
+    stored = ratings.take_rows(rows[rows < n_titles])
+    stored_counts = enlarged(stored.rating_counts(), sub_shape)
+    total_counts = stored_counts + new_counts
+    rows_matrix = csr_matrix((enlarged(stored.ratings(np.float64), sub_shape).multiply(stored_counts) + sums)
+                             .multiply(total_counts.power(-1)))
+    rows_matrix.sort_indices()
+    rows_counts = multi_counts(total_counts)
+
+    matrix = replace_rows(enlarged(ratings.matrix, shape), rows, as_half_stars(rows_matrix))
+    old_counts = ratings.counts if ratings.counts is not None else csr_matrix(ratings.shape, dtype=COUNT_DTYPE)
+    all_counts = replace_rows(enlarged(old_counts, shape), rows,
+                              rows_counts if rows_counts is not None else csr_matrix(sub_shape, dtype=COUNT_DTYPE))
+    rows_averages = off_half_stars(rows_matrix)
+    old_averages = ratings.averages if ratings.averages is not None else csr_matrix(ratings.shape)
+    all_averages = replace_rows(enlarged(old_averages, shape), rows,
+                                rows_averages if rows_averages is not None else csr_matrix(sub_shape))
+    return RatingMatrix(matrix, all_titles, all_users, all_counts, all_averages)
+
+
+def update_rating_counts(all_ratings: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+    """Mean rating and number of ratings per movie after adding the ratings of 'delta' ('title', 'rating')."""
+    grouped = delta.groupby(c.TITLE)[c.RATING].agg(["count", "sum"])
+    table = all_ratings.set_index(c.TITLE)
+    table = table.reindex(table.index.append(grouped.index.difference(table.index)))
+
+    count = table[c.TOTAL_RATING_COUNT].fillna(0).to_numpy(dtype=np.int64, copy=True)
+    total = np.nan_to_num(table[c.MEAN_RATING].to_numpy(dtype=np.float64)) * count
+    positions = table.index.get_indexer(grouped.index)
+    count[positions] += grouped["count"].to_numpy(dtype=np.int64)
+    total[positions] += grouped["sum"].to_numpy(dtype=np.float64)
+
+    updated = pd.DataFrame({
+        c.TITLE: table.index.to_numpy(dtype=object),
+        c.MEAN_RATING: (total / count).astype(all_ratings[c.MEAN_RATING].dtype),
+        c.TOTAL_RATING_COUNT: count.astype(all_ratings[c.TOTAL_RATING_COUNT].dtype),
+    })
+    return updated.sort_values(c.MEAN_RATING, ascending=False, kind="stable").reset_index(drop=True)
+
+
+def apply_delta(
+    features: RatingMatrix, pending: RatingMatrix, all_ratings: pd.DataFrame, delta: pd.DataFrame,
+    rating_threshold: int
+) -> Tuple[RatingMatrix, RatingMatrix, pd.DataFrame, np.ndarray, np.ndarray]:
+    """Add the ratings of 'delta' ('title', 'userId', 'rating') and move the movies crossing the rating threshold from
+    'pending' to 'features'. Returns the new features, pending ratings and 'all_ratings', the new positions of the old
+    features and the positions of the movies whose rows changed."""
+    all_ratings = update_rating_counts(all_ratings, delta)
+
+    in_features = delta[c.TITLE].isin(features.positions).to_numpy()
+    rated_titles = pd.unique(delta.loc[in_features, c.TITLE])
+    features = add_ratings(features, *(delta.loc[in_features, column].to_numpy() for column in
+                                       (c.TITLE, c.USER_ID, c.RATING)))
+    pending = add_ratings(pending, *(delta.loc[~in_features, column].to_numpy() for column in
+                                     (c.TITLE, c.USER_ID, c.RATING)))
+
+    # Movies crossing the threshold move from the pending ratings to the features
+    counts = dict(zip(all_ratings[c.TITLE], all_ratings[c.TOTAL_RATING_COUNT]))
+    admitted = np.flatnonzero([counts.get(title, 0) > rating_threshold for title in pending.titles])
+    n_old = len(features)
+    new_positions = np.arange(n_old)
+    if len(admitted):
+        # The averages of the admitted movies keep their numbers of ratings
+        block = pending.take_rows(admitted)
+        rows = block.ratings(np.float64).tocoo()
+        weights = np.asarray(block.rating_counts()[rows.row, rows.col]).ravel()
+        features = add_ratings(features, block.titles[rows.row], block.users[rows.col], rows.data, weights)
+        pending = pending.take_rows(np.setdiff1d(np.arange(len(pending)), admitted))
+
+        # Rows in title order, as in a full build: the admitted titles are merged into the sorted titles
+        old_titles, new_titles = features.titles[:n_old], features.titles[n_old:]
+        new_order = np.argsort(new_titles, kind="stable")
+        new_positions = np.empty(len(features), dtype=np.int64)
+        sorted_new_titles = new_titles[new_order]
+        new_positions[:n_old] = np.arange(n_old) + np.searchsorted(sorted_new_titles, old_titles, side="right")
+        new_positions[n_old + new_order] = np.searchsorted(old_titles, sorted_new_titles) + np.arange(len(new_order))
+        order = np.empty(len(features), dtype=np.int64)
+        order[new_positions] = np.arange(len(features))
+        features = features.take_rows(order)
+
+    touched = np.union1d(
+        np.fromiter((features.get_loc(title) for title in rated_titles), dtype=np.int64, count=len(rated_titles)),
+        new_positions[n_old:]
+    )
+    logging.info("%d movies rated, %d movies admitted over the rating threshold", len(rated_titles), len(admitted))
+    return features, pending, all_ratings, new_positions[:n_old], touched
+
+
+def update_artifact(dir_path: str, delta: pd.DataFrame, out_path: Optional[str] = None) -> dict:
+    """Add the ratings of 'delta' ('userId', 'movieId', 'rating') to an artifact and write it as a new version to
+    'out_path' (by default, in place). Returns the new manifest."""
+    start_time = time.time()
+    # Arrays are memory-mapped: only the new version of the arrays is built in memory
+    artifact = read_artifact(dir_path)
+    manifest = artifact.manifest
+    pending_data = load_pending(dir_path)
+    if pending_data is None:
+        raise ValueError(f"The artifact has no data for incremental updates, rebuild it: {dir_path}")
+    pending, movie_ids = pending_data
+
+    # Movie IDs -> titles
+    titles = dict(zip(movie_ids, artifact.total_movie_array))
+    delta = delta.assign(**{c.TITLE: delta[c.MOVIE_ID].astype(str).map(titles)})
+    unknown = delta[c.TITLE].isna()
+    if unknown.any():
+        logging.warning("Skipping %d ratings of unknown movie IDs", int(unknown.sum()))
+        delta = delta[~unknown]
+
+    features, pending, all_ratings, old_to_new, touched = apply_delta(
+        artifact.features_df, pending, artifact.all_ratings, delta, manifest["rating_threshold"]
+    )
+
+    neighbors = artifact.neighbors
+    if neighbors is not None:
+        min_periods = 0
+        if manifest["model_type"] == "corr":
+            min_periods = corr_min_periods(all_ratings)
+            if min_periods != corr_min_periods(artifact.all_ratings):
+                # The minimum number of correlating ratings changed with the size of the dataset
+                touched = np.arange(len(features))
+        neighbors = update_neighbor_table(neighbors, features, old_to_new, touched, manifest["model_type"],
+                                          min_periods)
+
+    knn_index = None
+    if isinstance(artifact.model, IvfCosineNeighbors):
+        knn_index = artifact.model.updated(features.values(), old_to_new, touched)
+
+    update = {
+        "version": manifest.get("version", 1) + 1,
+        "parent_checksum": manifest.get("checksum"),
+        "delta_rows": len(delta),
+        "skipped_rows": int(unknown.sum()),
+        "touched_movies": len(touched),
+        "admitted_movies": len(features) - len(old_to_new),
+    }
+    new_manifest = write_artifact(
+        out_path or dir_path, manifest["model_type"], manifest["db_size"], features, all_ratings,
+        artifact.total_movie_array, manifest["rating_threshold"], neighbors, knn_index, manifest.get("knn_recall"),
+        pending, movie_ids, update
+    )
+    logging.info("Artifact updated to version %d in %.2f seconds", update["version"], time.time() - start_time)
+    return new_manifest
+
+
+def update_artifacts(
+    db_sizes: Iterable[str], model_types: Iterable[str], delta_path: str, out_dir: str = c.PKL_DIR
+) -> None:
+    """Add a CSV file of new ratings to the artifacts of all model types for all dataset sizes."""
+    delta = read_ratings_delta(delta_path)
+    for db_size in db_sizes:
+        for model_type in model_types:
+            dir_path = os.path.join(out_dir, get_artifact_dir_name(model_type, db_size))
+            try:
+                update_artifact(dir_path, delta)
+            except Exception as e:
+                logging.error("Error updating model '%s' (%s dataset): %s", model_type, db_size, e)
@@ -1,22 +1,36 @@
 import os
-from typing import Tuple
-from zipfile import ZipFile
+import time
+import zlib
+import shutil
+import importlib.util
+from typing import Iterable, Optional, Tuple
+from zipfile import BadZipFile, ZipFile
 
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
+from urllib3.util.retry import Retry
 import pandas as pd
 from pandas import DataFrame
 import logging
 
 import movie_recommend.constants as c
+from movie_recommend.utils.table_cache import RATING_COLUMNS, get_cache_dir, read_table_cache, write_table_cache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Files extracted from the dataset archives, and suffix of a partially downloaded archive
+DATASET_MEMBERS = (c.MOVIES_CSV, c.RATINGS_CSV)
+SPILL_SUFFIX = ".part"
+# Timeouts of HTTP requests in seconds (connection, read) and number of retries
+REQUEST_TIMEOUT = (10, 60)
+MAX_RETRIES = 3
+
 
 def fetch_headers(url: str) -> dict:
     """Fetch headers for the given URL."""
-    response = requests.head(url)
+    response = make_session().head(url, timeout=REQUEST_TIMEOUT)
     response.raise_for_status()
     return response.headers
 
@@ -62,42 +76,158 @@ def check_file_change(dir_path: str, url: str, etag_file: str, modified_file: st
     return file_changed
 
 
-def download_and_extract_zip(zip_link: str, dir_path: str) -> None:
-    """Download and extract a zip file."""
-    temp_zip_path = "temp.zip"
-
-    # Download the zip file in chunks
-    response = requests.get(zip_link, stream=True)
-    response.raise_for_status()  # Raise an exception if the request was unsuccessful
-
-    # For visualization the progress bar
-    total_size = int(response.headers.get('content-length', 0))
-    progress_bar = tqdm(total=total_size, unit='B', unit_scale=True)
+def make_session(retries: int = MAX_RETRIES) -> requests.Session:
+    """HTTP session retrying failed connections and server errors 'retries' times, with an exponential backoff."""
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=("HEAD", "GET"))
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(max_retries=retry))
+    session.mount("https://", HTTPAdapter(max_retries=retry))
+    return session
+
+
+def download_file(
+    url: str, spill_path: str, headers: Optional[dict] = None, session: Optional[requests.Session] = None,
+    retries: int = MAX_RETRIES, chunk_size: int = 8192
+) -> Optional[requests.structures.CaseInsensitiveDict]:
+    """Stream a file to 'spill_path' with a GET request with 'headers' (e.g. conditional headers). Returns the headers
+    of the response, or None if the server answered 304 Not Modified.
+    A partial file is resumed with an HTTP Range request if it is still the same version of the file (If-Range with
+    its ETag), else it is downloaded again. A connection dropped during the transfer is resumed up to 'retries' times;
+    the partial file is kept for the next call if it still fails. Raises IOError if the size doesn't match the
+    Content-Length of the response."""
+    session = session or make_session(retries)
+    validator_path = spill_path + ".etag"
+    for attempt in range(retries + 1):
+        offset = os.path.getsize(spill_path) if os.path.exists(spill_path) else 0
+        request_headers = dict(headers or {})
+        if offset:
+            request_headers["Range"] = f"bytes={offset}-"
+            if os.path.exists(validator_path):
+                with open(validator_path, "r") as f:
+                    request_headers["If-Range"] = f.read().strip()
+
+        with session.get(url, stream=True, headers=request_headers, timeout=REQUEST_TIMEOUT) as response:
+            if response.status_code == 304:
+                return None
+            if offset and response.status_code == 416:
+                # Range not satisfiable: the partial file is already complete
+                logging.info("The file was already downloaded: %s", spill_path)
+                return response.headers
+            response.raise_for_status()
+            if response.status_code != 206:
+                offset = 0
+                if response.headers.get("ETag"):
+                    with open(validator_path, "w") as f:
+                        f.write(response.headers["ETag"])
+
+            # For visualization the progress bar
+            total_size = offset + int(response.headers.get('content-length', 0))
+            progress_bar = tqdm(total=total_size, initial=offset, unit='B', unit_scale=True)
+            try:
+                with open(spill_path, "ab" if offset else "wb") as spill_file:
+                    # Iterate over the response content in chunks of 8192 bytes (8 KB)
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if chunk:
+                            spill_file.write(chunk)
+                            progress_bar.update(len(chunk))
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                if attempt == retries:
+                    raise
+                logging.warning("Download interrupted, resuming (%d/%d): %s", attempt + 1, retries, e)
+                continue
+            finally:
+                progress_bar.close()
+
+        size = os.path.getsize(spill_path)
+        if 'content-length' in response.headers and size != total_size:
+            raise IOError(f"Incomplete download of {url}: {size} of {total_size} bytes")
+        return response.headers
+
+
+def extract_members(zip_path: str, dir_path: str, members: Iterable[str]) -> None:
+    """Extract the files named 'members' (in any folder of the archive) to 'dir_path', checking their CRC."""
+    members = set(members)
+    with ZipFile(zip_path, "r") as zip_file:
+        found = {}
+        for info in zip_file.infolist():
+            name = os.path.basename(info.filename)
+            if name in members and not info.is_dir():
+                found[name] = info
+        missing = members - found.keys()
+        if missing:
+            raise BadZipFile(f"Files missing from the archive: {sorted(missing)}")
+
+        # All files are written aside before any is moved in place, so that a corrupted archive changes nothing
+        tmp_paths = {name: os.path.join(dir_path, name + ".tmp") for name in found}
+        try:
+            for name, info in found.items():
+                # Reading a member to the end checks its CRC (BadZipFile if it doesn't match)
+                with zip_file.open(info) as source, open(tmp_paths[name], "wb") as target:
+                    shutil.copyfileobj(source, target, 1 << 20)
+        except (BadZipFile, zlib.error) as e:
+            for tmp_path in tmp_paths.values():
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            raise BadZipFile(f"Corrupted archive {zip_path}: {e}")
+
+    for name, tmp_path in tmp_paths.items():
+        os.replace(tmp_path, os.path.join(dir_path, name))
+
+
+def download_and_extract_zip(
+    zip_link: str, dir_path: str, members: Iterable[str] = DATASET_MEMBERS, headers: Optional[dict] = None,
+    session: Optional[requests.Session] = None
+) -> Optional[requests.structures.CaseInsensitiveDict]:
+    """Download a zip file to a spill file in 'dir_path' and extract the files 'members' from it.
+    Returns the headers of the response, or None if the server answered 304 Not Modified to the conditional
+    'headers'. An interrupted download is resumed by the next call; a corrupted archive is deleted."""
+    os.makedirs(dir_path, exist_ok=True)
+    spill_path = os.path.join(dir_path, os.path.basename(zip_link) + SPILL_SUFFIX)
 
     try:
-        with open(temp_zip_path, 'wb') as temp_zip_file:
-            # Iterate over the response content in chunks of 8192 bytes (8 KB)
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    temp_zip_file.write(chunk)
-                    progress_bar.update(len(chunk))
-        progress_bar.close()
+        response_headers = download_file(zip_link, spill_path, headers, session)
     except Exception as e:
-        logging.error("Error downloading data: %s", e)
-        exit(1)
+        logging.error("Error downloading data (the download will be resumed by the next run): %s", e)
+        raise
+    if response_headers is None:
+        return None
     logging.info("Zip file downloaded successfully")
 
-    # Create a zip object and extract
     try:
-        with ZipFile(temp_zip_path, "r") as zip_file:
-            zip_file.extractall(path=c.DATA_DIR)
-    except Exception as e:
-        logging.error("Error unzipping data: %s", e)
-        exit(1)
+        extract_members(spill_path, dir_path, members)
+    except BadZipFile as e:
+        logging.error("Error unzipping data, the downloaded file is deleted: %s", e)
+        remove_spill_file(spill_path)
+        raise
     logging.info("CSV files extracted successfully")
 
-    # Delete the temporary zip file
-    os.remove(temp_zip_path)
+    # Delete the spill file
+    remove_spill_file(spill_path)
+    return response_headers
+
+
+def remove_spill_file(spill_path: str) -> None:
+    """Delete a spill file and the ETag of its partial download."""
+    for path in (spill_path, spill_path + ".etag"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def is_fresh(dir_path: str, freshness_hours: float) -> bool:
+    """Whether the dataset was checked at the source page less than 'freshness_hours' ago."""
+    try:
+        with open(os.path.join(dir_path, c.LAST_CHECK_FILE), 'r') as f:
+            last_check = float(f.read().strip())
+    except (OSError, ValueError):
+        return False
+    return 0 <= time.time() - last_check < freshness_hours * 3600
+
+
+def save_check_time(dir_path: str) -> None:
+    """Save the time of the last check of the dataset at the source page."""
+    with open(os.path.join(dir_path, c.LAST_CHECK_FILE), 'w') as f:
+        f.write(str(time.time()))
 
 
 def set_folders_files(dataset_size: str) -> Tuple[str, str, str, str, str, str]:
@@ -115,30 +245,102 @@ def set_folders_files(dataset_size: str) -> Tuple[str, str, str, str, str, str]:
     return dir_path, movies_path, ratings_path, zip_link, last_etag_file, last_modified_file
 
 
-def get_db(dataset_size: str) -> Tuple[DataFrame, DataFrame]:
-    """Import movies and rating tables.
-    Select links to MovieLens datasets ("small" or "full"), and if the files don't exist, load them from the webpage.
-    """
-
+def fetch_db_files(
+    dataset_size: str, freshness_hours: float = c.FRESHNESS_HOURS, offline: bool = False
+) -> Tuple[str, str]:
+    """Paths of the movies and ratings CSV files of a MovieLens dataset ("small" or "full").
+    The local files are used without any network request if they were checked less than 'freshness_hours' ago, or in
+    the 'offline' mode. Otherwise, a single conditional GET downloads the zip file only if it was modified at the
+    source page (or if the files don't exist). If the check, the download or the extraction fails (network, disk or
+    corrupted archive), existing local files are used."""
     dir_path, movies_path, ratings_path, zip_link, last_etag_file, last_modified_file = set_folders_files(dataset_size)
+    files_exist = os.path.exists(movies_path) and os.path.exists(ratings_path)
+
+    if files_exist and (offline or is_fresh(dir_path, freshness_hours)):
+        logging.info("The database was checked less than %s hours ago (or offline mode). No need to check the web",
+                     freshness_hours)
+        return movies_path, ratings_path
+    if offline:
+        raise FileNotFoundError(f"The database files don't exist, they can't be downloaded offline: {dir_path}")
+
+    # Conditional request: the server answers 304 Not Modified if the zip file didn't change
+    headers = {}
+    if files_exist:
+        last_etag, last_modified = load_last_values(dir_path, last_etag_file, last_modified_file)
+        headers = {name: value for name, value in
+                   [("If-None-Match", last_etag), ("If-Modified-Since", last_modified)] if value}
 
-    # Check if zip file was modified at the source page
-    file_changed = check_file_change(dir_path, zip_link, last_etag_file, last_modified_file)
-
-    # If the db files don't exist or were modified in the MovieLens webpage, download them
-    if file_changed or not (os.path.exists(movies_path) and os.path.exists(ratings_path)):
-        logging.info("The database has to be updated. Downloading the new file...")
-        download_and_extract_zip(zip_link, dir_path)
-    else:
+    try:
+        response_headers = download_and_extract_zip(zip_link, dir_path, headers=headers)
+    except (requests.RequestException, OSError, BadZipFile, zlib.error) as e:
+        if not files_exist:
+            raise
+        logging.warning("The database couldn't be updated from the source page, using the local files (%s: %s)",
+                        type(e).__name__, e)
+        return movies_path, ratings_path
+
+    if response_headers is None:
         logging.info("The database has not changed. No need to download from the web")
-
-    movies_df = pd.read_csv(movies_path, usecols=["movieId", "title"], dtype=dict(movieId="str", title="str"))
+    else:
+        logging.info("The database was updated from the web")
+        shutil.rmtree(get_cache_dir(dir_path), ignore_errors=True)
+        save_current_values(last_etag_file, last_modified_file, response_headers.get('ETag') or "",
+                            response_headers.get('Last-Modified') or "")
+    save_check_time(dir_path)
+    return movies_path, ratings_path
+
+
+def get_db(
+    dataset_size: str, compact: bool = False, rating_columns: Iterable[str] = RATING_COLUMNS,
+    freshness_hours: float = c.FRESHNESS_HOURS, offline: bool = False
+) -> Tuple[DataFrame, DataFrame]:
+    """Import movies and rating tables.
+    Select links to MovieLens datasets ("small" or "full"), and if the files don't exist or changed, load them from
+    the webpage (see fetch_db_files()).
+    With 'compact', the tables are read with integer IDs and categorical titles (see read_tables()), from a columnar
+    cache of the CSV files when it is up to date (only 'rating_columns' of the ratings table).
+    """
+    movies_path, ratings_path = fetch_db_files(dataset_size, freshness_hours, offline)
+    if not compact:
+        return read_tables(movies_path, ratings_path)
+
+    dir_path, _, _, _, last_etag_file, last_modified_file = set_folders_files(dataset_size)
+    etag, last_modified = load_last_values(dir_path, last_etag_file, last_modified_file)
+    source = {"etag": etag, "last_modified": last_modified}
+    tables = read_table_cache(get_cache_dir(dir_path), source, rating_columns)
+    if tables is None:
+        movies_df, rating_df = read_tables(movies_path, ratings_path, compact=True)
+        write_table_cache(get_cache_dir(dir_path), movies_df, rating_df, source)
+        tables = movies_df, rating_df[list(rating_columns)]
+    return tables
+
+
+def read_tables(movies_path: str, ratings_path: str, compact: bool = False) -> Tuple[DataFrame, DataFrame]:
+    """Read movies and rating tables from the CSV files.
+    In the compact mode, IDs are read as 32-bit integers ('userId' as nullable Int32, as it gets missing values for
+    movies without ratings in merged_table()), ratings as float32 and titles as categories, with the multithreaded
+    pyarrow CSV engine if it is installed."""
+    movies_df = read_movies_table(movies_path, compact)
+    if not compact:
+        rating_df = pd.read_csv(ratings_path, usecols=["userId", "movieId", "rating"],
+                                dtype=dict(userId="str", movieId="str", rating="float32"))
+        return movies_df, rating_df
+
+    engine = "pyarrow" if importlib.util.find_spec("pyarrow") else "c"
     rating_df = pd.read_csv(ratings_path, usecols=["userId", "movieId", "rating"],
-                            dtype=dict(userId="str", movieId="str", rating="float32"))
-
+                            dtype=dict(userId="Int32", movieId="int32", rating="float32"), engine=engine)
     return movies_df, rating_df
 
 
+def read_movies_table(movies_path: str, compact: bool = False) -> DataFrame:
+    """Read the movies table from the CSV file (see read_tables())."""
+    if not compact:
+        return pd.read_csv(movies_path, usecols=["movieId", "title"], dtype=dict(movieId="str", title="str"))
+    engine = "pyarrow" if importlib.util.find_spec("pyarrow") else "c"
+    return pd.read_csv(movies_path, usecols=["movieId", "title"], dtype=dict(movieId="int32", title="category"),
+                       engine=engine)
+
+
 def main(dataset_size: str = "full") -> None:
     """For local testing"""
     dir_path, movies_path, ratings_path, zip_link, last_etag_file, last_modified_file = set_folders_files(dataset_size)
@@ -1,42 +1,163 @@
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 import pandas as pd
 
 from movie_recommend.model_types import get_model_type_class_by_name
+from movie_recommend.utils.metrics import OUTCOME_NOT_FOUND, OUTCOME_OK, STAGE_SECONDS
+from movie_recommend.utils.neighbor_table import NeighborTable
+from movie_recommend.utils.rating_matrix import RatingMatrix
 from movie_recommend.utils.recommendation_algorithms import recommendation_rename_movie
+from movie_recommend.utils.result_table import render_table, titles_table
+from movie_recommend.utils.title_search import TitleResolver, TitleSearchIndex
+
+# Status of each title in a batch of recommendations
+STATUS_OK = "ok"
+STATUS_NOT_ENOUGH_RATINGS = "not_enough_ratings"
+STATUS_NOT_FOUND = "not_found"
+
+
+def resolve_movie(
+    movie_to_compare: str, total_movie_array: List[str], title_resolver: Optional[TitleResolver] = None
+) -> Tuple[str, bool]:
+    """Returns the title to use for a requested movie and whether it is in the original dataset."""
+    # Titles are checked with hash lookups rather than scans of the movie arrays
+    if title_resolver is not None:
+        title = title_resolver.resolve_title(movie_to_compare)
+        return (movie_to_compare, False) if title is None else (title, True)
+    return movie_to_compare, movie_to_compare in total_movie_array
+
+
+def polish_table(final_table: pd.DataFrame) -> pd.DataFrame:
+    """Final polishing of a table of recommendations: numbering from 1 and '--' for missing values."""
+    return render_table(final_table, index_start=1)
 
 
 def get_recommendations(
     features_df: pd.DataFrame, movie_to_compare: str, n_recommend: int, model_type: str,
-    model: object, all_ratings: pd.DataFrame, total_movie_array: List[str]
+    model: object, all_ratings: pd.DataFrame, total_movie_array: List[str], neighbors: Optional[NeighborTable] = None,
+    title_search: Optional[TitleSearchIndex] = None, feature_title_search: Optional[TitleSearchIndex] = None,
+    title_resolver: Optional[TitleResolver] = None, db_size: str = ""
 ) -> Tuple[str, pd.DataFrame]:
-    """Returns a message line and a final table of movie recommendations."""
+    """Returns a message line and a final table of movie recommendations.
+    If a precomputed neighbor table is given, it is used for any request it can answer. Title search indexes over
+    'total_movie_array' and over the movies of 'features_df' speed up the suggestions for unknown titles. A title
+    resolver maps normalized titles (other case, no year, article at the front) to the title in the database.
+    The latency of each stage is recorded in the 'movie_recommend_stage_seconds' metric, labeled with 'db_size' and
+    the outcome of the stage ('not_found' for the resolution and the suggestions of a title missing from the model)."""
+    _, first_line, final_table = get_recommendations_many(
+        features_df, [movie_to_compare], n_recommend, model_type, model, all_ratings, total_movie_array, neighbors,
+        title_search, feature_title_search, title_resolver, db_size
+    )[0]
+    return first_line, final_table
+
+
+def get_recommendations_many(
+    features_df: pd.DataFrame, movies_to_compare: List[str], n_recommend: int, model_type: str,
+    model: object, all_ratings: pd.DataFrame, total_movie_array: List[str], neighbors: Optional[NeighborTable] = None,
+    title_search: Optional[TitleSearchIndex] = None, feature_title_search: Optional[TitleSearchIndex] = None,
+    title_resolver: Optional[TitleResolver] = None, db_size: str = ""
+) -> List[Tuple[str, str, pd.DataFrame]]:
+    """Returns a status, a message line and a final table of movie recommendations for each requested movie.
+    Recommendations for all movies of the final dataset are computed in one batch."""
+    labels = dict(model_type=model_type, db_size=db_size)
     model_type_class = get_model_type_class_by_name(model_type)()
 
     # List of movies to work with (with number of ratings more than the threshold)
     movie_array = model_type_class.get_movie_array(features_df)
+    # RatingMatrix keeps a dictionary of title positions
+    final_movies = features_df if isinstance(features_df, RatingMatrix) else movie_array
 
-    # If the specified movie is in the original dataset
-    if movie_to_compare in total_movie_array:
-        # If the specified movie is in the final dataset
-        if movie_to_compare in movie_array:
-            # Call the appropriate recommendation function based on the model type
-            first_line, final_table = model_type_class.get_recommendations(
-                features_df, model, movie_to_compare, n_recommend, all_ratings
-            )
+    results = [None] * len(movies_to_compare)
+    batch_positions, batch_movies = [], []
+    for position, movie_to_compare in enumerate(movies_to_compare):
+        with STAGE_SECONDS.time(stage="resolve_title", **labels) as stage:
+            movie_to_compare, in_total_movies = resolve_movie(movie_to_compare, total_movie_array, title_resolver)
+            if not in_total_movies:
+                stage["outcome"] = OUTCOME_NOT_FOUND
 
-        # If the specified movie is not in the final dataset
+        # If the specified movie is in the original dataset
+        if in_total_movies:
+            # If the specified movie is in the final dataset, it goes to the batch
+            if movie_to_compare in final_movies:
+                batch_positions.append(position)
+                batch_movies.append(movie_to_compare)
+
+            # If the specified movie is not in the final dataset
+            else:
+                first_line = f'Number of ratings for "{movie_to_compare}" is not enough for the analysis. Try another movie.\n'
+                with STAGE_SECONDS.time(stage="rename_movie", outcome=OUTCOME_NOT_FOUND, **labels):
+                    _, final_table = recommendation_rename_movie(
+                        movie_to_compare, movie_array, n_recommend, all_ratings, feature_title_search
+                    )
+                results[position] = (STATUS_NOT_ENOUGH_RATINGS, first_line, final_table)
+        # If the specified movie is not in the original dataset
         else:
-            first_line = f'Number of ratings for "{movie_to_compare}" is not enough for the analysis. Try another movie.\n'
-            _, final_table = recommendation_rename_movie(movie_to_compare, movie_array, n_recommend, all_ratings)
-    # If the specified movie is not in the original dataset
-    else:
-        first_line, final_table = recommendation_rename_movie(movie_to_compare, total_movie_array, n_recommend, all_ratings)
+            with STAGE_SECONDS.time(stage="rename_movie", outcome=OUTCOME_NOT_FOUND, **labels):
+                first_line, final_table = recommendation_rename_movie(
+                    movie_to_compare, total_movie_array, n_recommend, all_ratings, title_search
+                )
+            results[position] = (STATUS_NOT_FOUND, first_line, final_table)
 
-    # Final polishing of the table
-    final_table.index += 1
-    final_table[["mean_rating", "totalRatingCount"]] = final_table[["mean_rating", "totalRatingCount"]].fillna(pd.NA)
-    final_table["totalRatingCount"] = final_table["totalRatingCount"].astype("Int64")
-    final_table = final_table.astype(str).replace({"nan": "--", "<NA>": "--"})
+    # Call the appropriate recommendation function based on the model type
+    if batch_movies:
+        with STAGE_SECONDS.time(stage="similarity", **labels):
+            if len(batch_movies) == 1:
+                recommendations = [model_type_class.get_recommendations(
+                    features_df, model, batch_movies[0], n_recommend, all_ratings, neighbors
+                )]
+            else:
+                recommendations = model_type_class.get_recommendations_many(
+                    features_df, model, batch_movies, n_recommend, all_ratings, neighbors
+                )
+        for position, (first_line, final_table) in zip(batch_positions, recommendations):
+            results[position] = (STATUS_OK, first_line, final_table)
 
-    return first_line, final_table
+    with STAGE_SECONDS.time(stage="format_table", **labels):
+        return [(status, first_line, polish_table(final_table)) for status, first_line, final_table in results]
+
+
+def get_profile_recommendations(
+    features_df: pd.DataFrame, liked: List[str], disliked: List[str], n_recommend: int, model_type: str,
+    model: object, all_ratings: pd.DataFrame, total_movie_array: List[str],
+    title_resolver: Optional[TitleResolver] = None, db_size: str = ""
+) -> Tuple[str, str, pd.DataFrame]:
+    """Returns a status, a message line and a final table of recommendations for a taste profile: movies similar to
+    the 'liked' movies and unlike the 'disliked' ones, all scored together (see 'get_profile_recommendations()' of the
+    model types). Titles that are unknown or without enough ratings are ignored and listed in the message; the status
+    is 'not_found' if none of the liked titles is left."""
+    labels = dict(model_type=model_type, db_size=db_size)
+    model_type_class = get_model_type_class_by_name(model_type)()
+    movie_array = model_type_class.get_movie_array(features_df)
+    final_movies = features_df if isinstance(features_df, RatingMatrix) else movie_array
+
+    # Titles of the final dataset, without duplicates (a title both liked and disliked counts as liked)
+    profile, ignored = {}, []
+    for movies, weight in ((liked, 1), (disliked, -1)):
+        for movie_to_compare in movies:
+            with STAGE_SECONDS.time(stage="resolve_title", **labels) as stage:
+                movie_to_compare, in_total_movies = resolve_movie(movie_to_compare, total_movie_array, title_resolver)
+                if not in_total_movies:
+                    stage["outcome"] = OUTCOME_NOT_FOUND
+            if in_total_movies and movie_to_compare in final_movies:
+                profile.setdefault(movie_to_compare, weight)
+            elif movie_to_compare not in ignored:
+                ignored.append(movie_to_compare)
+    liked = [movie for movie, weight in profile.items() if weight > 0]
+    disliked = [movie for movie, weight in profile.items() if weight < 0]
+    ignored_note = " (ignored titles: " + ", ".join(f'"{movie}"' for movie in ignored) + ")" if ignored else ""
+
+    if not liked:
+        first_line = f"None of the liked movies has enough ratings for the analysis{ignored_note}. Try other movies.\n"
+        final_table = titles_table([], "profile_score", [], all_ratings)
+        status = STATUS_NOT_FOUND
+    else:
+        with STAGE_SECONDS.time(stage="similarity", **labels):
+            final_table = model_type_class.get_profile_recommendations(
+                features_df, model, liked, disliked, n_recommend, all_ratings
+            )
+        first_line = f"Recommendations for {len(liked)} liked and {len(disliked)} disliked movies{ignored_note}:"
+        status = STATUS_OK
+
+    outcome = OUTCOME_NOT_FOUND if status == STATUS_NOT_FOUND else OUTCOME_OK
+    with STAGE_SECONDS.time(stage="format_table", outcome=outcome, **labels):
+        return status, first_line, polish_table(final_table)
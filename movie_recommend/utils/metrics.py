@@ -0,0 +1,208 @@
+"""
+In-process metrics in the Prometheus text format.
+
+Counters, gauges and histograms are kept per set of label values and rendered by MetricsRegistry.render() in the text
+exposition format (version 0.0.4) served by the app's /metrics route. The metrics of the app are defined at the end
+of the module:
+- 'movie_recommend_stage_seconds': latency of the stages of a request (artifact loading, title resolution, fuzzy
+  search of unknown titles, similarity computation, formatting of the final table) by outcome ('ok', 'not_found' for a
+  title missing from the model, 'error' for a stage that raised);
+- 'movie_recommend_launch_seconds': latency of MovieRecommend.launch() by outcome ('hit', 'not_enough_ratings',
+  'renamed'), and 'movie_recommend_recommendations_total': number of recommendations by outcome, batches included;
+- 'movie_recommend_http_request_seconds': latency of the app routes by status code;
+- 'movie_recommend_artifact_bytes': memory size of the loaded artifacts.
+Values are kept per process: with several gunicorn workers, each scrape of /metrics reads the worker serving it.
+"""
+
+import math
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Values of the 'outcome' label of the stage latencies
+OUTCOME_OK = "ok"
+OUTCOME_NOT_FOUND = "not_found"
+OUTCOME_ERROR = "error"
+
+
+def format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    """Label set as '{name="value",...}', with escaped values (empty string without labels)."""
+    pairs = []
+    for name, value in zip(names, values):
+        value = value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """Base class of metrics: values are kept per tuple of label values, in the order of 'labelnames'."""
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric '{self.name}' expects the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"] + self.samples()
+
+
+class Counter(Metric):
+    """Monotonic count, e.g. of requests."""
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}_total{format_labels(self.labelnames, key)} {format_value(value)}"
+                for key, value in values]
+
+
+class Gauge(Metric):
+    """Value that can go up and down, e.g. a memory size."""
+    type_name = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}" for key, value in values]
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets, with their sum and count."""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[bucket] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of a block, in seconds. The block can change the labels of the yielded dictionary;
+        with an 'outcome' label, it defaults to 'ok' and is 'error' if the block raises."""
+        if "outcome" in self.labelnames:
+            labels.setdefault("outcome", OUTCOME_OK)
+        start_time = time.perf_counter()
+        try:
+            yield labels
+        except BaseException:
+            if "outcome" in self.labelnames:
+                labels["outcome"] = OUTCOME_ERROR
+            raise
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(names, key + (format_value(bound),))} {cumulative}")
+            labels = format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Metrics of the process, served by the app
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram(
+    "movie_recommend_stage_seconds", "Latency of the stages of recommendation requests, by outcome.",
+    ("stage", "model_type", "db_size", "outcome")
+)
+LAUNCH_SECONDS = metrics.histogram(
+    "movie_recommend_launch_seconds", "Latency of recommendation requests for one movie, by outcome.",
+    ("model_type", "db_size", "outcome")
+)
+RECOMMENDATIONS = metrics.counter(
+    "movie_recommend_recommendations", "Number of recommendation responses, by outcome.",
+    ("model_type", "db_size", "outcome")
+)
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "movie_recommend_http_request_seconds", "Latency of the app routes.", ("route", "method", "status")
+)
+ARTIFACT_BYTES = metrics.gauge(
+    "movie_recommend_artifact_bytes", "Memory size of the loaded model artifacts (memory-mapped arrays included).",
+    ("model_type", "db_size")
+)
@@ -0,0 +1,139 @@
+"""
+Process-wide registry of loaded recommendation models.
+
+Each artifact produced by pkl_production.py is loaded at most once per process and kept in memory, keyed by
+'(model_type, db_size)'. Requests get the same shared objects back, so they must treat them as read-only.
+Artifact folders (see artifact_store.py) are preferred; legacy pickle files are used if no folder exists.
+
+An artifact rewritten on disk (by pkl_production.py or artifact_update.py) is reloaded by the next 'get': the registry
+compares the modification time, size and inode of the manifest (or pickle file) with those seen at load time, which
+costs one 'stat' call per request.
+"""
+
+import os
+import pickle
+import logging
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+import movie_recommend.constants as c
+from movie_recommend.utils.artifact_store import (
+    ModelArtifact,
+    build_title_resolver,
+    MANIFEST_FILE,
+    get_artifact_dir_name,
+    read_artifact
+)
+from movie_recommend.utils.metrics import ARTIFACT_BYTES, STAGE_SECONDS
+from movie_recommend.utils.rating_matrix import RatingMatrix
+from movie_recommend.utils.recommendation_algorithms import CosineNeighbors
+from movie_recommend.utils.title_search import TitleSearchIndex
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MODEL_TYPES = ("knn", "corr")
+DB_SIZES = ("small", "full")
+
+
+def get_pkl_file_name(model_type: str, db_size: str) -> str:
+    return f"{model_type}_model_{db_size}.pkl"
+
+
+def artifact_signature(model_type: str, db_size: str, pkl_dir: str = c.PKL_DIR) -> Optional[Tuple[int, int, int]]:
+    """Modification time, size and inode of the file identifying an artifact on disk, or None if there is none."""
+    artifact_dir = os.path.join(pkl_dir, get_artifact_dir_name(model_type, db_size))
+    pkl_file = os.path.join(pkl_dir, get_pkl_file_name(model_type, db_size))
+    for path in (os.path.join(artifact_dir, MANIFEST_FILE), pkl_file):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+    return None
+
+
+def load_artifact(model_type: str, db_size: str, pkl_dir: str = c.PKL_DIR) -> ModelArtifact:
+    """Load a model artifact from its folder (memory-mapped) or, if there is none, from its pickle file."""
+    artifact_dir = os.path.join(pkl_dir, get_artifact_dir_name(model_type, db_size))
+    if os.path.isdir(artifact_dir):
+        return read_artifact(artifact_dir)
+
+    pkl_file = os.path.join(pkl_dir, get_pkl_file_name(model_type, db_size))
+    with open(pkl_file, "rb") as f:
+        features_df, model, all_ratings, total_movie_array = pickle.load(f)
+    # Pivot tables are converted once here rather than on every request
+    features = RatingMatrix.from_frame(features_df, titles_on_index=(model_type == "knn"))
+    if model_type == "knn":
+        # The pickled NearestNeighbors model is replaced by the exact cosine search over the same ratings
+        model = CosineNeighbors.build(features.values())
+    return ModelArtifact(
+        features, model, all_ratings, total_movie_array,
+        title_search=TitleSearchIndex.build(total_movie_array),
+        feature_title_search=TitleSearchIndex.build(features.titles),
+        title_resolver=build_title_resolver(total_movie_array, all_ratings),
+    )
+
+
+class ModelRegistry:
+    """Thread-safe cache of model artifacts keyed by '(model_type, db_size)'."""
+
+    def __init__(self, pkl_dir: str = c.PKL_DIR):
+        self.pkl_dir = pkl_dir
+        self._artifacts: Dict[Tuple[str, str], ModelArtifact] = {}
+        self._signatures: Dict[Tuple[str, str], Optional[Tuple[int, int, int]]] = {}
+        self._locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._registry_lock = threading.Lock()
+
+    def _key_lock(self, key: Tuple[str, str]) -> threading.Lock:
+        with self._registry_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get(self, model_type: str, db_size: str) -> ModelArtifact:
+        """Return the artifact for the given model type and dataset size, loading it on first use and reloading it
+        when it changed on disk."""
+        key = (model_type, db_size)
+        artifact = self._artifacts.get(key)
+        signature = artifact_signature(model_type, db_size, self.pkl_dir)
+        # An artifact being replaced (no manifest for a moment) keeps being served until the new one is complete
+        if artifact is not None and (signature is None or signature == self._signatures.get(key)):
+            return artifact
+
+        # Only one thread loads a given artifact, the others wait and reuse it
+        with self._key_lock(key):
+            artifact = self._artifacts.get(key)
+            if artifact is None or signature != self._signatures.get(key):
+                logging.info("%s model artifact '%s' (%s dataset)", "Loading" if artifact is None else "Reloading",
+                             model_type, db_size)
+                with STAGE_SECONDS.time(stage="load_artifact", model_type=model_type, db_size=db_size):
+                    artifact = load_artifact(model_type, db_size, self.pkl_dir)
+                ARTIFACT_BYTES.set(artifact.nbytes, model_type=model_type, db_size=db_size)
+                self._artifacts[key] = artifact
+                self._signatures[key] = signature
+        return artifact
+
+    def warm_up(self, model_types: Iterable[str] = MODEL_TYPES, db_sizes: Iterable[str] = DB_SIZES) -> bool:
+        """Load all requested artifacts. Returns True if every one of them was loaded."""
+        all_loaded = True
+        for db_size in db_sizes:
+            for model_type in model_types:
+                try:
+                    self.get(model_type, db_size)
+                except Exception as e:
+                    logging.error("Error loading model '%s' (%s dataset): %s", model_type, db_size, e)
+                    all_loaded = False
+        return all_loaded
+
+    def is_ready(self, model_types: Iterable[str] = MODEL_TYPES, db_sizes: Iterable[str] = DB_SIZES) -> bool:
+        """Check whether all requested artifacts are already loaded."""
+        return all((model_type, db_size) in self._artifacts for db_size in db_sizes for model_type in model_types)
+
+    def clear(self) -> None:
+        """Drop all loaded artifacts."""
+        with self._registry_lock:
+            self._artifacts.clear()
+            self._signatures.clear()
+
+
+# Registry shared by the whole process
+registry = ModelRegistry()
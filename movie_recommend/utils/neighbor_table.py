@@ -0,0 +1,172 @@
+"""
+Precomputed top-K neighbor tables.
+
+For every movie of a model, the table stores the positions of its K closest movies ('int32') and their scores, in the
+dtype of the live computation so that both render the same numbers: 'float32' cosine distances for the KNN model,
+'float64' Pearson correlations for the correlation model. Tables are built
+offline by pkl_production.py, so that any request for at most K recommendations is answered with an array slice.
+After an incremental update of the ratings, update_neighbor_table() only recomputes the rows that may have changed.
+"""
+
+import time
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+
+from movie_recommend.utils.rating_matrix import RatingMatrix
+from movie_recommend.utils.recommendation_algorithms import CosineNeighbors, pearson_correlations_many
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Dtype of the scores of each model type, as computed by recommendation_knn() and recommendation_corr()
+SCORE_DTYPES = {"knn": np.float32, "corr": np.float64}
+
+
+class NeighborTable:
+    """Top-K neighbors of every movie. Missing neighbors (fewer than K valid ones) have index -1 and score NaN."""
+
+    def __init__(self, indices: np.ndarray, scores: np.ndarray):
+        self.indices = indices
+        self.scores = scores
+
+    @property
+    def k(self) -> int:
+        return self.indices.shape[1]
+
+    def lookup(self, movie_index: int, n_recommend: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Return the positions and scores of the 'n_recommend' closest movies, or None if the table can't answer."""
+        indices = self.indices[movie_index]
+        n_valid = int(np.count_nonzero(indices >= 0))
+
+        # A row with fewer than K valid neighbors holds all of them, otherwise only the first K are known
+        if n_valid == 0 or (n_recommend > self.k and n_valid == self.k):
+            return None
+        n = min(n_recommend, n_valid)
+        return indices[:n], self.scores[movie_index, :n]
+
+
+def _empty_table(n_movies: int, k: int, dtype=np.float32) -> Tuple[np.ndarray, np.ndarray]:
+    return np.full((n_movies, k), -1, dtype=np.int32), np.full((n_movies, k), np.nan, dtype=dtype)
+
+
+def knn_neighbor_table(features: RatingMatrix, k: int, batch_size: int = 256, model=None) -> NeighborTable:
+    """Top-K cosine neighbors of every movie (the movie itself excluded, as in recommendation_knn()).
+    Neighbors are searched with 'model' if given (e.g. an approximate index), else by brute force."""
+    start_time = time.time()
+    logging.info("Computing top-%d k-Nearest Neighbors of every movie...", k)
+
+    n_movies = features.shape[0]
+    n_neighbors = min(k + 1, n_movies)
+    indices, scores = _empty_table(n_movies, k, SCORE_DTYPES["knn"])
+    model = model if model is not None else CosineNeighbors(features.values())
+
+    for start in range(0, n_movies, batch_size):
+        stop = min(start + batch_size, n_movies)
+        distances, neighbors = model.kneighbors(features.values(slice(start, stop)), n_neighbors=n_neighbors)
+        indices[start:stop, :n_neighbors - 1] = neighbors[:, 1:]
+        scores[start:stop, :n_neighbors - 1] = distances[:, 1:]
+
+    logging.info("Done! Time taken to compute the neighbor table: %.2f seconds", time.time() - start_time)
+    return NeighborTable(indices, scores)
+
+
+def corr_neighbor_table(features: RatingMatrix, k: int, min_periods: int, batch_size: int = 32) -> NeighborTable:
+    """Top-K Pearson correlated movies of every movie (the movie itself excluded, as in recommendation_corr()).
+    The correlations of each batch of movies are computed at once (see neighbor_keys())."""
+    start_time = time.time()
+    logging.info("Computing top-%d Pearson correlated movies of every movie...", k)
+
+    n_movies = features.shape[0]
+    indices, scores = _empty_table(n_movies, k, SCORE_DTYPES["corr"])
+    n_top = min(k, n_movies)
+
+    for start in range(0, n_movies, batch_size):
+        rows = np.arange(start, min(start + batch_size, n_movies))
+        keys = neighbor_keys(features, rows, "corr", min_periods)
+
+        # Highest correlations first, ties in title order
+        top = np.argsort(keys, axis=1, kind="stable")[:, :n_top]
+        top_keys = np.take_along_axis(keys, top, axis=1)
+        valid = ~np.isinf(top_keys)
+        indices[rows, :n_top] = np.where(valid, top, -1)
+        scores[rows, :n_top] = np.where(valid, -top_keys, np.nan)
+
+    logging.info("Done! Time taken to compute the neighbor table: %.2f seconds", time.time() - start_time)
+    return NeighborTable(indices, scores)
+
+
+def neighbor_keys(
+    features: RatingMatrix, rows: np.ndarray, model_type: str, min_periods: int = 0,
+    model: Optional[CosineNeighbors] = None
+) -> np.ndarray:
+    """Sort keys of all movies as neighbors of the movies 'rows' ('rows x movies', lower is closer, inf for invalid
+    neighbors and the movie itself): cosine distances for 'knn' (with 'model' if given), negated Pearson correlations
+    for 'corr'."""
+    if model_type == "knn":
+        model = model if model is not None else CosineNeighbors(features.values())
+        keys = model.distances(features.values(rows))
+    else:
+        correlations, _ = pearson_correlations_many(features.matrix, list(rows), min_periods, features.averages)
+        keys = -correlations.T
+        keys[np.isnan(keys)] = np.inf
+    keys[np.arange(len(rows)), rows] = np.inf
+    return keys
+
+
+def update_neighbor_table(
+    neighbors: NeighborTable, features: RatingMatrix, old_to_new: np.ndarray, touched: np.ndarray, model_type: str,
+    min_periods: int = 0, batch_size: int = 256
+) -> NeighborTable:
+    """Update a neighbor table after the ratings of the movies 'touched' (new positions) changed or these movies were
+    added. 'old_to_new' maps the rows of the old table to the rows of 'features'.
+    The rows of the touched movies are recomputed. The other rows only change through their distances (or
+    correlations) to the touched movies, which are the same numbers by symmetry: they are merged into these rows.
+    A full row that could have lost a neighbor ranked beyond K is recomputed too."""
+    start_time = time.time()
+    k = neighbors.k
+    n_movies = features.shape[0]
+    sign = 1.0 if model_type == "knn" else -1.0
+    is_touched = np.zeros(n_movies, dtype=bool)
+    is_touched[touched] = True
+
+    # Old rows at their new positions, as sort keys, without the touched movies
+    indices, _ = _empty_table(n_movies, k)
+    dtype = SCORE_DTYPES[model_type]
+    keys = np.full((n_movies, k), np.inf, dtype=dtype)
+    old_valid = np.asarray(neighbors.indices) >= 0
+    indices[old_to_new] = np.where(old_valid, old_to_new[np.where(old_valid, neighbors.indices, 0)], -1)
+    keys[old_to_new] = np.where(old_valid, sign * np.asarray(neighbors.scores), np.inf)
+    full_rows = np.zeros(n_movies, dtype=bool)
+    full_rows[old_to_new] = old_valid.all(axis=1)
+    worst_keys = keys[:, -1].copy()
+    removed = (indices >= 0) & is_touched[np.maximum(indices, 0)]
+    indices[removed], keys[removed] = -1, np.inf
+    model = CosineNeighbors(features.values()) if model_type == "knn" else None
+
+    # Merge the keys of the touched movies into all rows
+    touched = np.asarray(touched)
+    for start in range(0, len(touched), batch_size):
+        batch = touched[start:start + batch_size]
+        batch_keys = neighbor_keys(features, batch, model_type, min_periods, model).T
+        all_keys = np.hstack([keys, batch_keys])
+        all_indices = np.hstack([indices, np.broadcast_to(batch.astype(np.int32), batch_keys.shape)])
+        order = np.argsort(all_keys, axis=1, kind="stable")[:, :k]
+        keys = np.take_along_axis(all_keys, order, axis=1)
+        indices = np.take_along_axis(all_indices, order, axis=1)
+    indices[np.isinf(keys)] = -1
+
+    # Rows to recompute: the touched movies, and full rows whose K-th neighbor got worse than before
+    recompute = np.flatnonzero(is_touched | (full_rows & (keys[:, -1] > worst_keys)))
+    for start in range(0, len(recompute), batch_size):
+        batch = recompute[start:start + batch_size]
+        batch_keys = neighbor_keys(features, batch, model_type, min_periods, model)
+        order = np.argsort(batch_keys, axis=1, kind="stable")[:, :k]
+        keys[batch] = np.take_along_axis(batch_keys, order, axis=1)
+        indices[batch] = np.where(np.isinf(keys[batch]), -1, order)
+
+    scores = np.where(indices >= 0, sign * keys, np.nan).astype(dtype)
+    logging.info("Neighbor table updated in %.2f seconds (%d touched movies, %d rows recomputed)",
+                 time.time() - start_time, len(touched), len(recompute))
+    return NeighborTable(indices, scores)
@@ -0,0 +1,163 @@
+"""
+Streaming ingestion of the ratings CSV file with bounded memory.
+
+get_db() reads the whole ratings file into a DataFrame, and merged_table() copies it again into a merge with the
+movies, so the peak memory is several times the file size. ingest_ratings() reads the file twice in fixed-size chunks
+instead, mapping movie IDs to title codes with an array lookup:
+- the first pass counts and sums the ratings of every title, which gives 'all_ratings' and the number of ratings of
+  every row of the rating matrix;
+- the second pass writes the user and rating of each entry directly at its place in preallocated CSR arrays.
+The output is the same as mean_rating_table() and sparse_pivot_ratings() on the merged table: the rating matrix of the
+movies above the rating threshold, the matrix of the movies below it, and the mean rating table. The memory used is
+the size of the CSR arrays plus one chunk, which is sized to stay under 'memory_limit_mb' (not counting the interpreter
+and the imported libraries).
+"""
+
+import time
+import logging
+from typing import Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from scipy.sparse import csr_matrix
+
+import movie_recommend.constants as c
+from movie_recommend.utils.rating_matrix import RatingMatrix, multi_counts
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Estimated memory per CSV row of a chunk: parser buffers and the int32/int32/float32 columns with their temporaries
+BYTES_PER_CSV_ROW = 120
+# Memory per rating of the CSR arrays: int32 user and float32 rating, uint8 half stars and sorting buffers at the end
+BYTES_PER_ENTRY = 13
+MIN_CHUNK_ROWS = 10_000
+
+
+def chunk_size(memory_limit_mb: float, reserved_bytes: int = 0) -> int:
+    """Number of CSV rows per chunk fitting in the memory limit, besides 'reserved_bytes' already used."""
+    free_bytes = memory_limit_mb * 1024 ** 2 - reserved_bytes
+    return max(int(free_bytes // BYTES_PER_CSV_ROW), MIN_CHUNK_ROWS)
+
+
+def read_rating_chunks(ratings_path: str, rows: int) -> Iterator[DataFrame]:
+    """Chunks of 'rows' ratings of the ratings CSV file."""
+    return pd.read_csv(ratings_path, usecols=[c.USER_ID, c.MOVIE_ID, c.RATING], chunksize=rows,
+                       dtype={c.USER_ID: "int32", c.MOVIE_ID: "int32", c.RATING: "float32"})
+
+
+def title_lookup(movies_df: DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted unique titles, and an array mapping movie IDs to title codes (-1 for unknown IDs)."""
+    movies_df = movies_df.dropna(subset=[c.TITLE])
+    titles, codes = np.unique(movies_df[c.TITLE].astype(str).to_numpy(dtype=object), return_inverse=True)
+    movie_ids = movies_df[c.MOVIE_ID].to_numpy(dtype=np.int64)
+    lookup = np.full(movie_ids.max() + 1 if len(movie_ids) else 0, -1, dtype=np.int32)
+    lookup[movie_ids] = codes
+    return titles, lookup
+
+
+def chunk_title_codes(lookup: np.ndarray, movie_ids: np.ndarray) -> np.ndarray:
+    """Title codes of the movie IDs of a chunk (-1 for unknown IDs)."""
+    codes = np.full(len(movie_ids), -1, dtype=np.int32)
+    known = (movie_ids >= 0) & (movie_ids < len(lookup))
+    codes[known] = lookup[movie_ids[known]]
+    return codes
+
+
+def rating_block(
+    users: np.ndarray, ratings: np.ndarray, indptr: np.ndarray, titles: np.ndarray, n_users: int
+) -> RatingMatrix:
+    """Rating matrix of a block of rows in CSR layout, with user IDs relabeled by sorted codes and several ratings of a
+    user for the same title averaged (see RatingMatrix.averages), with their numbers of ratings."""
+    present = np.zeros(n_users, dtype=bool)
+    present[users] = True
+    user_codes = (np.cumsum(present) - 1).astype(np.int32)
+    users[:] = user_codes[users]
+
+    matrix = csr_matrix((ratings, users, indptr), shape=(len(titles), int(present.sum())))
+    matrix.sort_indices()
+
+    # Duplicate (title, user) entries only come from movies sharing a title
+    starts = np.ones(matrix.nnz, dtype=bool)
+    starts[1:] = matrix.indices[1:] != matrix.indices[:-1]
+    starts[matrix.indptr[:-1][np.diff(matrix.indptr) > 0]] = True
+    counts = None
+    if not starts.all():
+        groups = np.flatnonzero(starts)
+        group_counts = np.diff(np.append(groups, matrix.nnz))
+        data = np.add.reduceat(matrix.data, groups, dtype=np.float64) / group_counts
+        new_indptr = np.concatenate([[0], np.cumsum(starts)])[matrix.indptr]
+        matrix = csr_matrix((data, matrix.indices[groups], new_indptr), shape=matrix.shape)
+        counts = multi_counts(csr_matrix((group_counts, matrix.indices, matrix.indptr), shape=matrix.shape))
+
+    return RatingMatrix(matrix, titles, np.flatnonzero(present).astype(object), counts)
+
+
+def ingest_ratings(
+    movies_df: DataFrame, ratings_path: str, rating_threshold: int, memory_limit_mb: float = 1024
+) -> Tuple[RatingMatrix, RatingMatrix, DataFrame]:
+    """Read the ratings CSV file in chunks. Returns the rating matrix of the movies with more than 'rating_threshold'
+    ratings, the rating matrix of the other rated movies and the mean rating table (see mean_rating_table()).
+    Raises MemoryError if the rating matrices alone don't fit in 'memory_limit_mb'."""
+    start_time = time.time()
+    titles, lookup = title_lookup(movies_df)
+    n_titles = len(titles)
+
+    # First pass: number and sum of the ratings of every title
+    counts = np.zeros(n_titles, dtype=np.int64)
+    sums = np.zeros(n_titles, dtype=np.float64)
+    n_users = 0
+    for chunk in read_rating_chunks(ratings_path, chunk_size(memory_limit_mb)):
+        codes = chunk_title_codes(lookup, chunk[c.MOVIE_ID].to_numpy())
+        known = codes >= 0
+        counts += np.bincount(codes[known], minlength=n_titles)
+        sums += np.bincount(codes[known], weights=chunk[c.RATING].to_numpy()[known], minlength=n_titles)
+        if len(chunk.index):
+            n_users = max(n_users, int(chunk[c.USER_ID].max()) + 1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = (sums / counts).astype(np.float32)
+    all_ratings = pd.DataFrame({c.TITLE: titles, c.MEAN_RATING: means, c.TOTAL_RATING_COUNT: counts})
+    all_ratings = all_ratings.sort_values(c.MEAN_RATING, ascending=False).reset_index(drop=True)
+
+    # Rows of the movies above the threshold, then of the other rated movies
+    above = np.flatnonzero(counts > rating_threshold)
+    below = np.flatnonzero((counts > 0) & (counts <= rating_threshold))
+    rows = np.full(n_titles, -1, dtype=np.int64)
+    rows[np.concatenate([above, below])] = np.arange(len(above) + len(below))
+    indptr = np.zeros(len(above) + len(below) + 1, dtype=np.int64)
+    np.cumsum(counts[np.concatenate([above, below])], out=indptr[1:])
+
+    nnz = int(indptr[-1])
+    reserved_bytes = nnz * BYTES_PER_ENTRY
+    if reserved_bytes > memory_limit_mb * 1024 ** 2:
+        raise MemoryError(f"{nnz} ratings need {reserved_bytes / 1024 ** 2:.0f} MB, more than the memory limit of "
+                          f"{memory_limit_mb} MB")
+
+    # Second pass: each rating is written at the next free place of its row
+    users = np.empty(nnz, dtype=np.int32)
+    ratings = np.empty(nnz, dtype=np.float32)
+    next_free = indptr[:-1].copy()
+    for chunk in read_rating_chunks(ratings_path, chunk_size(memory_limit_mb, reserved_bytes)):
+        codes = chunk_title_codes(lookup, chunk[c.MOVIE_ID].to_numpy())
+        known = codes >= 0
+        chunk_rows = rows[codes[known]]
+        order = np.argsort(chunk_rows, kind="stable")
+        sorted_rows = chunk_rows[order]
+        # Rank of each rating among the ratings of its row in this chunk
+        group_starts = np.flatnonzero(np.r_[True, sorted_rows[1:] != sorted_rows[:-1]])
+        ranks = np.arange(len(sorted_rows)) - np.repeat(group_starts, np.diff(np.r_[group_starts, len(sorted_rows)]))
+        positions = next_free[sorted_rows] + ranks
+        users[positions] = chunk[c.USER_ID].to_numpy()[known][order]
+        ratings[positions] = chunk[c.RATING].to_numpy()[known][order]
+        next_free += np.bincount(chunk_rows, minlength=len(next_free))
+
+    n_above, nnz_above = len(above), int(indptr[len(above)])
+    features = rating_block(users[:nnz_above], ratings[:nnz_above], indptr[:n_above + 1], titles[above], n_users)
+    pending = rating_block(users[nnz_above:], ratings[nnz_above:], indptr[n_above:] - nnz_above, titles[below],
+                           n_users)
+
+    logging.info("Ratings ingested in %.2f seconds: %d ratings, %d movies above the rating threshold",
+                 time.time() - start_time, nnz, n_above)
+    return features, pending, all_ratings
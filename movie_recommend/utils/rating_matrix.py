@@ -0,0 +1,164 @@
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix, issparse
+
+# Ratings are half stars from 0.5 to 5.0: rating matrices store them as numbers of half stars (rating x 2) in 'uint8'
+HALF_STARS = 2
+RATING_DTYPE = np.uint8
+# Numbers of ratings averaged in the cells of a rating matrix (see RatingMatrix.counts)
+COUNT_DTYPE = np.int32
+
+
+def encode_ratings(ratings: np.ndarray) -> np.ndarray:
+    """Ratings as numbers of half stars. Values between half stars (averages of the ratings of movies sharing a title)
+    are rounded to the nearest half star, their exact values are kept apart (see RatingMatrix.averages)."""
+    return np.rint(np.asarray(ratings, dtype=np.float64) * HALF_STARS).astype(RATING_DTYPE)
+
+
+def as_half_stars(matrix) -> csr_matrix:
+    """CSR matrix of ratings with 'uint8' numbers of half stars (matrices already encoded are returned as is)."""
+    matrix = matrix if issparse(matrix) and matrix.format == "csr" else csr_matrix(matrix)
+    if matrix.dtype == RATING_DTYPE:
+        return matrix
+    return csr_matrix((encode_ratings(matrix.data), matrix.indices, matrix.indptr), shape=matrix.shape)
+
+
+def float_values(matrix, dtype=np.float32) -> csr_matrix:
+    """CSR matrix with the values of 'matrix' as floating-point numbers, sharing its index arrays.
+    Cosine distances and Pearson correlations don't depend on the unit of the ratings, so they are computed on numbers
+    of half stars directly."""
+    matrix = matrix if issparse(matrix) and matrix.format == "csr" else csr_matrix(matrix)
+    if matrix.dtype == dtype:
+        return matrix
+    return csr_matrix((matrix.data.astype(dtype), matrix.indices, matrix.indptr), shape=matrix.shape)
+
+
+def exact_values(matrix, averages: Optional[csr_matrix] = None, dtype=np.float64) -> csr_matrix:
+    """float_values() of a matrix of half stars, with the exact values of the cells of 'averages' (a matrix of the
+    same shape, see RatingMatrix.averages) instead of their rounded ones."""
+    values = float_values(matrix, dtype)
+    if averages is None or not averages.nnz:
+        return values
+    if not values.has_sorted_indices:
+        values = values.sorted_indices()
+    elif values is matrix:
+        values = values.copy()
+    averages = csr_matrix(averages)
+    averages.sort_indices()
+    # Only the few rows with averaged cells are searched for them
+    for row in np.flatnonzero(np.diff(averages.indptr)):
+        start, end = values.indptr[row], values.indptr[row + 1]
+        cells = slice(averages.indptr[row], averages.indptr[row + 1])
+        values.data[start + np.searchsorted(values.indices[start:end], averages.indices[cells])] = averages.data[cells]
+    return values
+
+
+def off_half_stars(matrix) -> Optional[csr_matrix]:
+    """Cells of a matrix of ratings in stars whose values are between half stars, as 'float64' numbers of half stars
+    (None if there are none)."""
+    matrix = matrix if issparse(matrix) and matrix.format == "csr" else csr_matrix(matrix)
+    if matrix.dtype == RATING_DTYPE:
+        return None
+    half_stars = matrix.data.astype(np.float64) * HALF_STARS
+    keep = half_stars != np.rint(half_stars)
+    if not keep.any():
+        return None
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))[keep]
+    return csr_matrix((half_stars[keep], (rows, matrix.indices[keep])), shape=matrix.shape)
+
+
+def multi_counts(counts) -> Optional[csr_matrix]:
+    """Numbers of ratings of the cells that average several ratings, from the numbers of ratings of all cells (None
+    if every cell holds one rating)."""
+    counts = csr_matrix(counts)
+    keep = counts.data > 1
+    if not keep.any():
+        return None
+    rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))[keep]
+    return csr_matrix((counts.data[keep].astype(COUNT_DTYPE), (rows, counts.indices[keep])), shape=counts.shape)
+
+
+class RatingMatrix:
+    """Sparse 'Title vs Users' matrix of ratings with its title and user labels.
+    Ratings are stored as 'uint8' numbers of half stars (see encode_ratings(), other matrices are encoded), and
+    missing ratings as implicit zeros (real ratings are never 0). A user who rated several movies sharing a title has
+    the average of these ratings; 'counts' holds the number of ratings of these cells only (None if there are none),
+    so that incremental updates weight the stored averages. Averages between half stars are stored rounded, and
+    'averages' holds their exact numbers of half stars ('float64', None if there are none): computations take the
+    ratings from values(), never from the rounded 'matrix'."""
+
+    def __init__(self, matrix: csr_matrix, titles: np.ndarray, users: np.ndarray, counts: Optional[csr_matrix] = None,
+                 averages: Optional[csr_matrix] = None):
+        self.averages = averages if averages is not None else off_half_stars(matrix)
+        self.averages = self.averages if self.averages is not None and self.averages.nnz else None
+        self.matrix = as_half_stars(matrix)
+        self.titles = titles
+        self.users = users
+        self.counts = counts if counts is not None and counts.nnz else None
+        self._positions = None
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def positions(self) -> dict:
+        """Title -> row position mapping (built on first use)."""
+        if self._positions is None:
+            self._positions = {title: i for i, title in enumerate(self.titles)}
+        return self._positions
+
+    def get_loc(self, title: str) -> int:
+        return self.positions[title]
+
+    def __contains__(self, title) -> bool:
+        return title in self.positions
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def values(self, rows=None, dtype=np.float32) -> csr_matrix:
+        """Ratings in half stars to compute on, of the rows 'rows' if given: the 'uint8' matrix if no cell averages
+        ratings between half stars, else a 'dtype' copy with the exact averages."""
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        if self.averages is None:
+            return matrix
+        return exact_values(matrix, self.averages if rows is None else self.averages[rows], dtype)
+
+    def ratings(self, dtype=np.float32) -> csr_matrix:
+        """Matrix of the ratings in stars, as floating-point numbers (averages are exact)."""
+        values = exact_values(self.matrix, self.averages, dtype)
+        values.data /= HALF_STARS
+        return values
+
+    def rating_counts(self) -> csr_matrix:
+        """Number of ratings of every stored cell ('float64'; one, except for the cells of 'counts')."""
+        counts = csr_matrix((np.ones(self.matrix.nnz), self.matrix.indices, self.matrix.indptr), shape=self.shape)
+        if self.counts is None:
+            return counts
+        extra = self.counts.astype(np.float64)
+        extra.data -= 1
+        return csr_matrix(counts + extra)
+
+    def take_rows(self, rows: np.ndarray) -> "RatingMatrix":
+        """Rows of the matrix (all users kept)."""
+        return RatingMatrix(csr_matrix(self.matrix[rows]), np.asarray(self.titles, dtype=object)[rows], self.users,
+                            csr_matrix(self.counts[rows]) if self.counts is not None else None,
+                            csr_matrix(self.averages[rows]) if self.averages is not None else None)
+
+    @classmethod
+    def from_frame(cls, features_df: pd.DataFrame, titles_on_index: bool = True) -> "RatingMatrix":
+        """Build from a pivot table: 'Title vs Users' (KNN) if 'titles_on_index', else 'Users vs Title' (Pearson)."""
+        if not titles_on_index:
+            features_df = features_df.T
+        values = np.nan_to_num(features_df.to_numpy(dtype=np.float32), nan=0.0)
+        return cls(csr_matrix(values), features_df.index.to_numpy(), features_df.columns.to_numpy())
+
+
+def as_rating_matrix(features: Union[RatingMatrix, pd.DataFrame], titles_on_index: bool = True) -> RatingMatrix:
+    """Return 'features' as a RatingMatrix, converting a pivot table if needed."""
+    if isinstance(features, RatingMatrix):
+        return features
+    return RatingMatrix.from_frame(features, titles_on_index)
@@ -1,33 +1,52 @@
+import os
 import time
-from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
 
 import logging
+import numpy as np
 import pandas as pd
 from fuzzywuzzy import fuzz
 from sklearn.neighbors import NearestNeighbors
-from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+from scipy.sparse import csr_matrix, vstack
+
+from movie_recommend.utils.rating_matrix import RatingMatrix, as_rating_matrix, exact_values, float_values
+from movie_recommend.utils.result_table import neighbors_table, titles_table
+from movie_recommend.utils.title_search import TitleSearchIndex, strip_year
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Batches of query rows split between threads by CosineNeighbors, from this number of rows
+PARALLEL_ROWS = 64
+MAX_THREADS = 8
+
 
 def recommendation_rename_movie(
-    movie_to_compare: str, movie_array: List[str], n_recommend: int, all_ratings: pd.DataFrame
+    movie_to_compare: str, movie_array: List[str], n_recommend: int, all_ratings: pd.DataFrame,
+    search_index: Optional[TitleSearchIndex] = None
 ) -> Tuple[str, pd.DataFrame]:
-    """Recommends alternative movies based on a given movie title."""
+    """Recommends alternative movies based on a given movie title.
+    With a search index over 'movie_array', only the candidate titles found by the index are scored."""
     message = f'No "{movie_to_compare}" movie in the database. Try the following titles:'
 
-    # Remove the year at the end of the movie title (to improve suggestions of alternatives)
-    movie_to_compare = movie_to_compare.rstrip("(0123456789)").rstrip()
+    if search_index is not None:
+        positions, scores = search_index.search(movie_to_compare, n_recommend)
+        titles = search_index.titles[positions]
+    else:
+        # Remove the year at the end of the movie title (to improve suggestions of alternatives)
+        movie_to_compare = strip_year(movie_to_compare)
 
-    # Get all titles with similarity score and return the top recommendations
-    table_all = pd.DataFrame(data=movie_array, columns=["title"])
-    table_all["similarity_score"] = table_all["title"].apply(
-        lambda x: fuzz.partial_ratio(movie_to_compare, x)
-    )
-    table = table_all.sort_values("similarity_score", ascending=False).reset_index(drop=True).head(n_recommend)
-    table = table.merge(all_ratings, on="title")
-    table = table.reindex(columns=["title", "mean_rating", "totalRatingCount", "similarity_score"])
+        # Get all titles with similarity score and return the top recommendations
+        titles = np.asarray(movie_array, dtype=object)
+        scores = np.fromiter((fuzz.partial_ratio(movie_to_compare, title) for title in titles), dtype=np.int64,
+                             count=len(titles))
+        # Ties are ordered as by pandas' sort (the fuzzy scoring dominates the cost anyway)
+        top = pd.Series(scores).sort_values(ascending=False).index[:n_recommend].to_numpy()
+        titles, scores = titles[top], scores[top]
+    # Only titles with ratings are suggested
+    table = titles_table(titles, "similarity_score", scores, all_ratings, known_only=True)
 
     return message, table
 
@@ -52,69 +71,340 @@ def knn_train(features_df: pd.DataFrame) -> NearestNeighbors:
     return knn_model
 
 
+class CosineNeighbors:
+    """Exact cosine k-Nearest Neighbors over a 'Title vs Users' sparse matrix.
+    The L2-normalized movie rows are computed once, in 'float32' on the numbers of half stars of the matrix, and kept
+    transposed ('vectors': 'users x movies' CSR matrix), so that the similarities of a query row with all movies are
+    one sparse product that only reads the users who rated the query movie. The neighbors and distances are the same
+    as those of NearestNeighbors(metric="cosine", algorithm="brute") on 'float32' ratings, in the same order. Batches
+    of at least PARALLEL_ROWS rows are split between 'n_threads' threads (the sparse products release the GIL)."""
+
+    def __init__(self, matrix: csr_matrix, vectors: Optional[csr_matrix] = None, n_threads: int = 0):
+        self.matrix = matrix
+        self.vectors = vectors if vectors is not None else normalize(float_values(matrix)).T.tocsr()
+        self.n_threads = n_threads or min(os.cpu_count() or 1, MAX_THREADS)
+
+    @classmethod
+    def build(cls, matrix: csr_matrix) -> "CosineNeighbors":
+        return cls(matrix)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """CSR arrays of the normalized vectors, to save with an artifact (see from_arrays())."""
+        return {"data": self.vectors.data, "indices": self.vectors.indices, "indptr": self.vectors.indptr}
+
+    @classmethod
+    def from_arrays(cls, matrix: csr_matrix, arrays: Dict[str, np.ndarray]) -> "CosineNeighbors":
+        vectors = csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]),
+                             shape=(matrix.shape[1], matrix.shape[0]), copy=False)
+        return cls(matrix, vectors)
+
+    def distances(self, X) -> np.ndarray:
+        """Cosine distances between the rows of 'X' and all movies ('rows x movies'), as cosine_distances()."""
+        dist = (normalize(float_values(X)) @ self.vectors).toarray()
+        dist *= -1
+        dist += 1
+        return np.clip(dist, 0, 2, out=dist)
+
+    def kneighbors(self, X, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+        X = csr_matrix(X)
+        n_rows = X.shape[0]
+        if n_rows < PARALLEL_ROWS or self.n_threads < 2:
+            return self._kneighbors(X, n_neighbors)
+
+        bounds = np.linspace(0, n_rows, min(self.n_threads, n_rows) + 1).astype(int)
+        with ThreadPoolExecutor(max_workers=len(bounds) - 1) as executor:
+            parts = list(executor.map(lambda start, stop: self._kneighbors(X[start:stop], n_neighbors),
+                                      bounds[:-1], bounds[1:]))
+        return np.vstack([dist for dist, _ in parts]), np.vstack([ind for _, ind in parts])
+
+    def _kneighbors(self, X: csr_matrix, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+        dist = self.distances(X)
+        sample_range = np.arange(dist.shape[0])[:, None]
+        neigh_ind = np.argpartition(dist, n_neighbors - 1, axis=1)[:, :n_neighbors]
+        # argpartition doesn't guarantee sorted order, so we sort again
+        neigh_ind = neigh_ind[sample_range, np.argsort(dist[sample_range, neigh_ind])]
+        return dist[sample_range, neigh_ind], neigh_ind
+
+
+def knn_recommendation_table(
+    titles: np.ndarray, distances: np.ndarray, indices: np.ndarray, movie_to_compare: str, total_ratings: pd.DataFrame
+) -> Tuple[str, pd.DataFrame]:
+    """Recommendation table from the k-Nearest Neighbors of a movie (the first neighbor, the movie itself, is skipped)."""
+    indices, distances = indices.ravel(), distances.ravel()
+    table = neighbors_table(titles, indices[1:], "distance", distances[1:], total_ratings)
+    message = f'Recommendations for "{movie_to_compare}":'
+    return message, table
+
+
 def recommendation_knn(
-    features_df: pd.DataFrame, model: NearestNeighbors, movie_to_compare: str, n_recommend: int,
-    total_ratings: pd.DataFrame
+    features_df: Union[RatingMatrix, pd.DataFrame], model: Union[NearestNeighbors, CosineNeighbors],
+    movie_to_compare: str, n_recommend: int, total_ratings: pd.DataFrame
 ) -> Tuple[str, pd.DataFrame]:
     """Recommends similar movies to a given movie using k-Nearest Neighbors algorithm."""
+    features = as_rating_matrix(features_df, titles_on_index=True)
+
     # Get the index of the movie to compare
-    movie_index = features_df.index.get_loc(movie_to_compare)
+    movie_index = features.get_loc(movie_to_compare)
 
     # Using 'model', calculate the distances and indices of the k-Nearest Neighbors relative to 'movie_index'
-    distances, indices = model.kneighbors(
-        features_df.iloc[movie_index, :].values.reshape(1, -1),
-        n_neighbors=n_recommend + 1
-    )
+    distances, indices = model.kneighbors(features.values(movie_index), n_neighbors=n_recommend + 1)
 
-    table = pd.DataFrame(columns=["title", "distance"])
-    for i in range(1, len(distances.flatten())):
-        # Add the recommendation to the DataFrame
-        new_row = pd.DataFrame([[features_df.index[indices.flatten()[i]], distances.flatten()[i]]],
-                               columns=["title", "distance"])
-        table = pd.concat([table, new_row], axis=0, ignore_index=True)
-    table = table.join(total_ratings.set_index('title'), on="title")
-    table = table.reindex(columns=["title", "mean_rating", "totalRatingCount", "distance"])
-    message = f'Recommendations for "{movie_to_compare}":'
-    return message, table
+    return knn_recommendation_table(features.titles, distances, indices, movie_to_compare, total_ratings)
 
 
-def recommendation_corr(
-    features_df: pd.DataFrame, movie_to_compare: str, n_recommend: int, total_ratings: pd.DataFrame
-) -> Tuple[str, pd.DataFrame]:
-    """Recommends top movies based on the Pearson correlation between a specified movie and other movies in the dataset."""
+def recommendation_knn_many(
+    features_df: Union[RatingMatrix, pd.DataFrame], model: Union[NearestNeighbors, CosineNeighbors],
+    movies_to_compare: List[str], n_recommend: int, total_ratings: pd.DataFrame, batch_size: int = 256
+) -> List[Tuple[str, pd.DataFrame]]:
+    """recommendation_knn() for several movies, with one kneighbors() call per batch of stacked movie rows."""
+    features = as_rating_matrix(features_df, titles_on_index=True)
 
-    # Set the minimum number of correlating ratings per movie, depending on the size of the dataset
-    min_num_ratings = 20 if len(total_ratings) < 10000 else 150
+    results = []
+    for start in range(0, len(movies_to_compare), batch_size):
+        batch = movies_to_compare[start:start + batch_size]
+        query = features.values([features.get_loc(movie) for movie in batch])
+        distances, indices = model.kneighbors(query, n_neighbors=n_recommend + 1)
+        for movie, movie_distances, movie_neighbors in zip(batch, distances, indices):
+            results.append(
+                knn_recommendation_table(features.titles, movie_distances, movie_neighbors, movie, total_ratings)
+            )
+    return results
 
-    # Drop rows with NaN values in the specified movie column
-    features_df_nonan = features_df.dropna(subset=[movie_to_compare])
 
-    # Calculate Pearson correlations between 'movie_to_compare' and other movies
-    correlations = [
-        features_df_nonan[movie_to_compare].corr(features_df_nonan[col], min_periods=min_num_ratings)
-        for col in features_df_nonan.columns
-    ]
+def _float_rows(matrix: csr_matrix, averages: Optional[csr_matrix], rows) -> csr_matrix:
+    """'float64' ratings of rows of a matrix of half stars, with the exact values of its 'averages' (see
+    RatingMatrix.averages)."""
+    return exact_values(matrix[rows], averages[rows] if averages is not None else None)
+
+
+def _float_columns(matrix: csr_matrix, averages: Optional[csr_matrix], columns: np.ndarray) -> csr_matrix:
+    """_float_rows() for columns."""
+    return exact_values(matrix[:, columns], averages[:, columns] if averages is not None else None)
+
+
+def pearson_correlations(
+    matrix: csr_matrix, movie_index: int, min_periods: int, averages: Optional[csr_matrix] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Pairwise-complete Pearson correlations between one movie and every movie of a 'Title vs Users' matrix.
+    Only the users who rated both movies are taken into account, as in pandas' Series.corr(). Returns the correlations
+    (NaN for less than 'min_periods' common ratings or constant ratings) and the numbers of common ratings.
+    'averages' are the exact values of the averaged cells of the matrix (see RatingMatrix.averages)."""
+    target = _float_rows(matrix, averages, movie_index)
+    # Sums run in float64 on numbers of half stars: they stay exact, and correlations don't depend on the unit
+    return pearson_correlations_with(matrix, target.indices, target.data, min_periods, averages)
+
+
+def pearson_correlations_with(
+    matrix: csr_matrix, users: np.ndarray, x: np.ndarray, min_periods: int, averages: Optional[csr_matrix] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """pearson_correlations() with a vector of ratings 'x' of the given users (column positions) instead of a movie."""
+    # Ratings of all movies by the users of the vector, and the "is rated" indicator of these ratings
+    ratings = _float_columns(matrix, averages, users)
+    rated = ratings.copy()
+    rated.data[:] = 1.0
+
+    # Sums over the common ratings of each movie
+    ones = np.ones_like(x)
+    n, sum_x, sum_x2 = (rated @ np.column_stack([ones, x, x * x])).T
+    sum_y, sum_xy = (ratings @ np.column_stack([ones, x])).T
+    sum_y2 = ratings.multiply(ratings) @ ones
+
+    return _pearson_from_sums(n, sum_x, sum_x2, sum_y, sum_xy, sum_y2, min_periods)
+
+
+def pearson_correlations_many(
+    matrix: csr_matrix, movie_indices: List[int], min_periods: int, averages: Optional[csr_matrix] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """pearson_correlations() for several movies at once, with sparse matrix products over the users who rated any of
+    them. Returns 'movies x movie_indices' arrays of correlations and numbers of common ratings."""
+    targets = _float_rows(matrix, averages, movie_indices)
+    users = np.unique(targets.indices)
+    x = targets[:, users]
+    x_rated = x.copy()
+    x_rated.data[:] = 1.0
+
+    # Ratings of all movies by these users, and the "is rated" indicator of these ratings
+    ratings = _float_columns(matrix, averages, users)
+    rated = ratings.copy()
+    rated.data[:] = 1.0
+
+    # Sums over the common ratings of each pair of movies (exact, as in pearson_correlations())
+    n, sum_x, sum_x2 = np.split((rated @ vstack([x_rated, x, x.multiply(x)]).T).toarray(), 3, axis=1)
+    sum_y, sum_xy = np.split((ratings @ vstack([x_rated, x]).T).toarray(), 2, axis=1)
+    sum_y2 = (ratings.multiply(ratings) @ x_rated.T).toarray()
+
+    return _pearson_from_sums(n, sum_x, sum_x2, sum_y, sum_xy, sum_y2, min_periods)
+
 
-    # Combine correlations with column names and sort by correlation coefficient
-    corr_to_my_movie = pd.DataFrame({"title": features_df_nonan.columns, "correlation": correlations})
-    corr_to_my_movie.sort_values(by="correlation", ascending=False, inplace=True)
+def _pearson_from_sums(n, sum_x, sum_x2, sum_y, sum_xy, sum_y2, min_periods: int) -> Tuple[np.ndarray, np.ndarray]:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlations = (n * sum_xy - sum_x * sum_y) / np.sqrt((n * sum_x2 - sum_x ** 2) * (n * sum_y2 - sum_y ** 2))
+    correlations = np.clip(correlations, -1.0, 1.0)
+    correlations[n < max(min_periods, 1)] = np.nan
 
-    # Set the index of the DataFrame to the title column
-    corr_to_my_movie.set_index("title", inplace=True)
+    return correlations, n.astype(np.int64)
 
-    # Drop the movie being compared from the recommendations and reset the index
-    corr_to_my_movie.drop(movie_to_compare, inplace=True)
-    corr_to_my_movie.reset_index(inplace=True)
 
-    # Join the correlation DataFrame with the total_ratings DataFrame and rearrange the columns
-    table = corr_to_my_movie.iloc[:n_recommend].join(total_ratings.set_index('title'), on="title")
-    table = table.reindex(columns=["title", "mean_rating", "totalRatingCount", "correlation"])
+def corr_min_periods(total_ratings: pd.DataFrame) -> int:
+    """Minimum number of correlating ratings per movie, depending on the size of the dataset."""
+    return 20 if len(total_ratings) < 10000 else 150
+
+
+def recommendation_from_neighbors(
+    titles: np.ndarray, indices: np.ndarray, scores: np.ndarray, score_name: str, movie_to_compare: str,
+    total_ratings: pd.DataFrame
+) -> Tuple[str, pd.DataFrame]:
+    """Recommends precomputed neighbors (positions in 'titles' and their scores) of a given movie. The scores are kept
+    in the dtype of the table, the one of the live computation, so that both render the same numbers."""
+    table = neighbors_table(titles, indices, score_name, np.array(scores), total_ratings)
+    message = f'Recommendations for "{movie_to_compare}":'
+    return message, table
+
+
+def top_positions(scores: np.ndarray, n: int) -> np.ndarray:
+    """Positions of the 'n' highest scores in decreasing order (ties in position order), followed by positions of
+    missing scores if there are fewer than 'n' scores."""
+    valid = np.flatnonzero(~np.isnan(scores))
+    if len(valid) > n:
+        # Scores tied with the n-th one are all kept, so that ties are broken by position
+        threshold = np.partition(scores[valid], len(valid) - n)[len(valid) - n]
+        valid = valid[scores[valid] >= threshold]
+    top = valid[np.argsort(-scores[valid], kind="stable")][:n]
+    if len(top) < n:
+        top = np.concatenate([top, np.flatnonzero(np.isnan(scores))[:n - len(top)]])
+    return top
+
+
+def corr_recommendation_table(
+    titles: np.ndarray, correlations: np.ndarray, movie_to_compare: str, n_recommend: int, total_ratings: pd.DataFrame
+) -> Tuple[str, pd.DataFrame]:
+    """Recommendation table from the Pearson correlations between a movie and all movies of 'titles'."""
+    # Positions of the movies by decreasing correlation (missing correlations last), without the movie itself
+    order = top_positions(correlations, n_recommend + 1)
+    order = order[titles[order] != movie_to_compare][:n_recommend]
+    table = neighbors_table(titles, order, "correlation", correlations[order], total_ratings)
 
     # A header message for the recommendations
     if table["correlation"].isna().all():
         message = f'Not enough ratings for "{movie_to_compare}" to conclude on correlations.\n'
     else:
         message = f'Recommendations for "{movie_to_compare}":'
-        table.dropna(subset=["correlation"], inplace=True)
+        table = table[table["correlation"].notna().to_numpy()]
 
     return message, table
+
+
+def recommendation_corr(
+    features_df: Union[RatingMatrix, pd.DataFrame], movie_to_compare: str, n_recommend: int,
+    total_ratings: pd.DataFrame
+) -> Tuple[str, pd.DataFrame]:
+    """Recommends top movies based on the Pearson correlation between a specified movie and other movies in the dataset."""
+    features = as_rating_matrix(features_df, titles_on_index=False)
+
+    # Set the minimum number of correlating ratings per movie, depending on the size of the dataset
+    min_num_ratings = corr_min_periods(total_ratings)
+
+    # Calculate Pearson correlations between 'movie_to_compare' and other movies
+    correlations, _ = pearson_correlations(
+        features.matrix, features.get_loc(movie_to_compare), min_num_ratings, features.averages
+    )
+
+    return corr_recommendation_table(features.titles, correlations, movie_to_compare, n_recommend, total_ratings)
+
+
+def recommendation_corr_many(
+    features_df: Union[RatingMatrix, pd.DataFrame], movies_to_compare: List[str], n_recommend: int,
+    total_ratings: pd.DataFrame, batch_size: int = 32
+) -> List[Tuple[str, pd.DataFrame]]:
+    """recommendation_corr() for several movies, with the correlations of each batch of movies computed at once."""
+    features = as_rating_matrix(features_df, titles_on_index=False)
+    min_num_ratings = corr_min_periods(total_ratings)
+
+    results = []
+    for start in range(0, len(movies_to_compare), batch_size):
+        batch = movies_to_compare[start:start + batch_size]
+        correlations, _ = pearson_correlations_many(
+            features.matrix, [features.get_loc(movie) for movie in batch], min_num_ratings, features.averages
+        )
+        for movie, movie_correlations in zip(batch, correlations.T):
+            results.append(
+                corr_recommendation_table(features.titles, movie_correlations, movie, n_recommend, total_ratings)
+            )
+    return results
+
+
+def profile_weights(n_liked: int, n_disliked: int) -> np.ndarray:
+    """Weights of the movies of a taste profile: 1 / n_liked for each liked movie, -1 / n_disliked for each disliked
+    one, so that a weighted sum of similarities is the mean similarity with the liked movies minus the mean similarity
+    with the disliked ones."""
+    return np.concatenate([np.full(n_liked, 1.0 / max(n_liked, 1)), np.full(n_disliked, -1.0 / max(n_disliked, 1))])
+
+
+def profile_table(
+    titles: np.ndarray, scores: np.ndarray, profile_positions: List[int], n_recommend: int, total_ratings: pd.DataFrame
+) -> pd.DataFrame:
+    """Recommendation table of the 'n_recommend' movies with the highest profile scores, without the movies of the
+    profile and the movies without a score."""
+    scores = np.array(scores, dtype=np.float64)
+    scores[profile_positions] = np.nan
+    top = top_positions(scores, n_recommend)
+    top = top[~np.isnan(scores[top])]
+    return neighbors_table(titles, top, "profile_score", scores[top], total_ratings)
+
+
+def recommendation_profile_knn(
+    features_df: Union[RatingMatrix, pd.DataFrame], model: CosineNeighbors, liked: List[str], disliked: List[str],
+    n_recommend: int, total_ratings: pd.DataFrame
+) -> pd.DataFrame:
+    """Recommends movies for a taste profile with cosine similarities: the score of a movie is its mean similarity with
+    the 'liked' movies minus its mean similarity with the 'disliked' ones. Similarities are linear in the normalized
+    query rows, so all movies are scored by one sparse product of the weighted sum of the normalized rows of the profile
+    with the vectors of 'model', as for a query of a single movie."""
+    features = as_rating_matrix(features_df, titles_on_index=True)
+    positions = [features.get_loc(movie) for movie in liked + disliked]
+
+    weights = csr_matrix(profile_weights(len(liked), len(disliked)).astype(np.float32))
+    query = weights @ normalize(float_values(features.values(positions)))
+    scores = (query @ model.vectors).toarray().ravel()
+
+    return profile_table(features.titles, scores, positions, n_recommend, total_ratings)
+
+
+def profile_ratings(
+    matrix: csr_matrix, liked: List[int], disliked: List[int], averages: Optional[csr_matrix] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Ratings of a taste profile: for every user who rated a movie of the profile, the mean of their ratings of the
+    'liked' movies and of the opposite of their ratings of the 'disliked' ones, each centered on the movie's mean
+    rating. Returns the users (column positions) and their profile ratings."""
+    rows = _float_rows(matrix, averages, liked + disliked)
+    counts = np.diff(rows.indptr)
+    means = np.asarray(rows.sum(axis=1)).ravel() / np.maximum(counts, 1)
+    signs = np.where(np.arange(rows.shape[0]) < len(liked), 1.0, -1.0)
+    rows.data = (rows.data - np.repeat(means, counts)) * np.repeat(signs, counts)
+
+    rated = rows.copy()
+    rated.data[:] = 1.0
+    n_rated = np.asarray(rated.sum(axis=0)).ravel()
+    users = np.flatnonzero(n_rated)
+    return users, np.asarray(rows.sum(axis=0)).ravel()[users] / n_rated[users]
+
+
+def recommendation_profile_corr(
+    features_df: Union[RatingMatrix, pd.DataFrame], liked: List[str], disliked: List[str], n_recommend: int,
+    total_ratings: pd.DataFrame
+) -> pd.DataFrame:
+    """Recommends movies for a taste profile with Pearson correlations: the score of a movie is its correlation with
+    the ratings of the profile (see profile_ratings()), over the users who rated both, so that all movies are scored in
+    one correlation pass whatever the size of the profile. Movies with too few common ratings are not recommended.
+    With a single liked movie, the scores are the correlations with this movie."""
+    features = as_rating_matrix(features_df, titles_on_index=False)
+    liked_positions = [features.get_loc(movie) for movie in liked]
+    disliked_positions = [features.get_loc(movie) for movie in disliked]
+    positions = liked_positions + disliked_positions
+
+    users, ratings = profile_ratings(features.matrix, liked_positions, disliked_positions, features.averages)
+    scores, _ = pearson_correlations_with(
+        features.matrix, users, ratings, corr_min_periods(total_ratings), features.averages
+    )
+
+    return profile_table(features.titles, scores, positions, n_recommend, total_ratings)
@@ -0,0 +1,97 @@
+"""
+In-process LRU cache of recommendation responses.
+
+Entries are keyed by '(model_type, db_size, title)', where the title is normalized by the artifact's title resolver,
+and taste profiles by '(model_type, db_size, ("profile", liked titles, disliked titles))', with frozensets of
+normalized titles. Responses for unresolved titles are not cached. Entries store the response for the largest
+'n_recommend' requested so far. A request for a smaller 'n_recommend' is served from the first rows of the cached
+table. Entries expire after a time-to-live and are dropped
+as soon as the loaded artifact changes (another version or checksum): the model registry reloads an artifact rewritten
+on disk, so an updated model never serves stale recommendations.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Tuple
+
+import pandas as pd
+
+# Default limits of the process-wide cache
+CACHE_MAX_SIZE = 2048
+CACHE_TTL_SECONDS = 3600.0
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of '(status, message line, table)' responses with size and TTL limits."""
+
+    def __init__(self, max_size: int = CACHE_MAX_SIZE, ttl_seconds: float = CACHE_TTL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, n_recommend: int, version: Hashable) -> Optional[Tuple[str, str, pd.DataFrame]]:
+        """Cached response for at least 'n_recommend' recommendations, cut to 'n_recommend' rows, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_version, created, entry_n, response = entry
+                if entry_version != version or self.clock() - created > self.ttl_seconds:
+                    # Stale entry: another artifact is loaded or the entry is too old
+                    del self._entries[key]
+                    self.invalidations += 1
+                    entry = None
+            if entry is None or entry_n < n_recommend:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        status, first_line, final_table = response
+        return status, first_line, final_table.head(n_recommend).copy()
+
+    def put(self, key: Hashable, n_recommend: int, version: Hashable, response: Tuple[str, str, pd.DataFrame]) -> None:
+        """Store a response, unless a fresh response for more recommendations is already cached."""
+        status, first_line, final_table = response
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is not None and entry[0] == version and entry[2] >= n_recommend
+                    and self.clock() - entry[1] <= self.ttl_seconds):
+                return
+            self._entries[key] = (version, self.clock(), n_recommend, (status, first_line, final_table.copy()))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Counters of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+# Cache shared by the whole process
+response_cache = ResponseCache()
@@ -0,0 +1,133 @@
+"""
+Columnar assembly of recommendation tables.
+
+A recommendation table has the columns 'title', 'mean_rating', 'totalRatingCount' and a score ('distance',
+'correlation' or 'similarity_score'). The rating columns come from the 'all_ratings' table of the artifact, which has a
+row per title of the dataset. Instead of joining every result with 'all_ratings.set_index("title")' (a reindex of the
+whole table on every request), RatingLookup maps titles to row positions once, and the rows of a result are gathered
+from NumPy arrays by integer position:
+- the row of every title of a rating matrix is computed once per titles array and reused for all its neighbors;
+- a table is built with one DataFrame constructor call, and render_table() formats its columns to strings at once.
+"""
+
+import weakref
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+import movie_recommend.constants as c
+
+TABLE_COLUMNS = [c.TITLE, c.MEAN_RATING, c.TOTAL_RATING_COUNT]
+# Rendered value of missing ratings and scores
+MISSING_VALUE = "--"
+
+# Rating lookups of 'all_ratings' tables, keyed by the identity of the table (DataFrames are not hashable) and dropped
+# with their table
+_lookups: Dict[int, tuple] = {}
+
+
+class RatingLookup:
+    """Mean rating and number of ratings of the titles of an 'all_ratings' table, gathered by row position."""
+
+    def __init__(self, titles: np.ndarray, means: np.ndarray, counts: np.ndarray):
+        self.titles = titles
+        self.means = means
+        self.counts = counts
+        self._rows = {title: row for row, title in enumerate(titles)}
+        # Rows of the titles of a rating matrix, keyed by the identity of the titles array
+        self._array_rows: Dict[int, tuple] = {}
+
+    @classmethod
+    def from_frame(cls, all_ratings: pd.DataFrame) -> "RatingLookup":
+        return cls(all_ratings[c.TITLE].to_numpy(dtype=object), all_ratings[c.MEAN_RATING].to_numpy(),
+                   all_ratings[c.TOTAL_RATING_COUNT].to_numpy())
+
+    def rows(self, titles) -> np.ndarray:
+        """Rows of 'titles' in the table (-1 for unknown titles)."""
+        return np.fromiter((self._rows.get(title, -1) for title in titles), dtype=np.int64, count=len(titles))
+
+    def array_rows(self, titles: np.ndarray) -> np.ndarray:
+        """rows() of a titles array shared between requests (the titles of a rating matrix), computed once."""
+        cached = self._array_rows.get(id(titles))
+        if cached is None or cached[0] is not titles:
+            cached = (titles, self.rows(titles))
+            self._array_rows[id(titles)] = cached
+        return cached[1]
+
+    def table(self, titles: np.ndarray, rows: np.ndarray, score_name: str, scores: np.ndarray) -> pd.DataFrame:
+        """Recommendation table of 'titles' with the ratings of 'rows' (-1 for missing ratings) and their scores."""
+        found = rows >= 0
+        if found.all():
+            means, counts = self.means[rows], self.counts[rows]
+        else:
+            safe_rows = np.where(found, rows, 0)
+            means = np.where(found, self.means[safe_rows], np.nan).astype(np.result_type(self.means, np.float32))
+            counts = np.where(found, self.counts[safe_rows], np.nan)
+        return pd.DataFrame({
+            c.TITLE: titles, c.MEAN_RATING: means, c.TOTAL_RATING_COUNT: counts, score_name: scores
+        }, columns=TABLE_COLUMNS + [score_name])
+
+
+def rating_lookup(all_ratings: pd.DataFrame) -> RatingLookup:
+    """Rating lookup of an 'all_ratings' table, built on first use (tables are read-only once loaded)."""
+    key = id(all_ratings)
+    cached = _lookups.get(key)
+    if cached is None or cached[0]() is not all_ratings:
+        cached = (weakref.ref(all_ratings, lambda _: _lookups.pop(key, None)), RatingLookup.from_frame(all_ratings))
+        _lookups[key] = cached
+    return cached[1]
+
+
+def neighbors_table(
+    titles: np.ndarray, positions: np.ndarray, score_name: str, scores: np.ndarray, all_ratings: pd.DataFrame
+) -> pd.DataFrame:
+    """Recommendation table of the movies at 'positions' in 'titles' (the titles of a rating matrix)."""
+    lookup = rating_lookup(all_ratings)
+    positions = np.asarray(positions, dtype=np.int64)
+    return lookup.table(titles[positions], lookup.array_rows(titles)[positions], score_name, scores)
+
+
+def titles_table(
+    titles: np.ndarray, score_name: str, scores: np.ndarray, all_ratings: pd.DataFrame, known_only: bool = False
+) -> pd.DataFrame:
+    """Recommendation table of arbitrary titles; with 'known_only', titles without ratings are dropped."""
+    lookup = rating_lookup(all_ratings)
+    titles = np.asarray(titles, dtype=object)
+    rows = lookup.rows(titles)
+    if known_only:
+        known = rows >= 0
+        titles, rows, scores = titles[known], rows[known], np.asarray(scores)[known]
+    return lookup.table(titles, rows, score_name, scores)
+
+
+def format_column(values: np.ndarray) -> np.ndarray:
+    """Column formatted as strings, as 'astype(str)', with MISSING_VALUE for missing values."""
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        missing = np.isnan(values)
+        strings = values.astype(str).astype(object)
+    else:
+        missing = pd.isna(values)
+        strings = np.array([str(value) for value in values], dtype=object)
+    strings[missing] = MISSING_VALUE
+    return strings
+
+
+def format_counts(values: np.ndarray) -> np.ndarray:
+    """Numbers of ratings formatted as integers, with MISSING_VALUE for missing values."""
+    values = np.asarray(values)
+    missing = pd.isna(values)
+    strings = np.full(len(values), MISSING_VALUE, dtype=object)
+    strings[~missing] = values[~missing].astype(np.int64).astype(str)
+    return strings
+
+
+def render_table(table: pd.DataFrame, index_start: int = 1) -> pd.DataFrame:
+    """Table of strings for display: rows numbered from 'index_start', MISSING_VALUE for missing values."""
+    columns = {}
+    for name in table.columns:
+        values = table[name].to_numpy()
+        columns[name] = format_counts(values) if name == c.TOTAL_RATING_COUNT else format_column(values)
+    index = pd.RangeIndex(index_start, index_start + len(table.index))
+    return pd.DataFrame(columns, index=index, columns=table.columns)
@@ -0,0 +1,61 @@
+"""
+Wall time and peak memory of the stages of a pipeline.
+
+Each stage is recorded with its wall time and the peak resident set size (RSS) of the process at the end of the stage.
+The peak RSS is taken from resource.getrusage(), which is not available on Windows (the peak is then reported as None).
+"""
+
+import os
+import sys
+import time
+import logging
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of the current process in MB, or None if it can't be measured."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+class StageTimer:
+    """Records the wall time and peak RSS of named stages."""
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.records: List[dict] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.records.append({
+                "label": self.label,
+                "stage": name,
+                "seconds": time.perf_counter() - start_time,
+                "peak_rss_mb": peak_rss_mb(),
+                "pid": os.getpid(),
+            })
+
+
+def log_stage_report(records: Iterable[dict]) -> None:
+    """Log a table of stage records."""
+    logging.info("%-24s %-28s %10s %14s %8s", "label", "stage", "seconds", "peak RSS, MB", "pid")
+    for record in records:
+        peak = f"{record['peak_rss_mb']:.0f}" if record["peak_rss_mb"] is not None else "--"
+        logging.info("%-24s %-28s %10.2f %14s %8d", record["label"], record["stage"], record["seconds"], peak,
+                     record["pid"])
@@ -0,0 +1,25 @@
+"""
+Arrays of strings stored as '.npy' files: a UTF-8 buffer ('{name}_bytes.npy') plus offsets ('{name}_offsets.npy').
+"""
+
+import os
+
+import numpy as np
+
+
+def save_strings(dir_path: str, name: str, values) -> None:
+    """Save an array of strings as a UTF-8 buffer and an array of offsets."""
+    encoded = [str(value).encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    np.save(os.path.join(dir_path, f"{name}_bytes.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    np.save(os.path.join(dir_path, f"{name}_offsets.npy"), offsets)
+
+
+def load_strings(dir_path: str, name: str) -> np.ndarray:
+    """Load an array of strings saved by save_strings()."""
+    buffer = np.load(os.path.join(dir_path, f"{name}_bytes.npy")).tobytes()
+    offsets = np.load(os.path.join(dir_path, f"{name}_offsets.npy")).tolist()
+    values = np.empty(len(offsets) - 1, dtype=object)
+    values[:] = [buffer[start:end].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])]
+    return values
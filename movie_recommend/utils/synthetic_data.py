@@ -0,0 +1,185 @@
+"""
+Synthetic MovieLens-shaped datasets of any size.
+
+generate_dataset() writes 'movies.csv' and 'ratings.csv' files with the columns of the MovieLens files read by get_db()
+('movieId,title,genres' and 'userId,movieId,rating,timestamp'), so they can be used in place of a download by the
+benchmark, the tests and the artifact pipeline (e.g. 'fetch_files=lambda db_size: paths'). The data imitates the
+shapes of the real dataset:
+- movie popularity follows a Zipf law, and movie IDs are sparse and not ordered by popularity;
+- the number of ratings of a user follows a Pareto law, with a minimum number of ratings per user and at most
+  half of the movies;
+- ratings are half stars from 0.5 to 5, from a movie quality, a user bias and noise, mostly around 3.5-4;
+- ratings are sorted by user and then by movie ID, each user rates a movie at most once.
+The ratings are generated and written in blocks of users, so the memory used doesn't depend on the size of the dataset.
+The output only depends on the parameters and the seed.
+
+Usage:
+    python -m movie_recommend.utils.synthetic_data raw_data/synthetic --movies 100000 --users 1000000 --ratings 1e8
+"""
+
+import os
+import time
+import logging
+import argparse
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import movie_recommend.constants as c
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+GENRES = ["Action", "Adventure", "Animation", "Children", "Comedy", "Crime", "Documentary", "Drama", "Fantasy",
+          "Film-Noir", "Horror", "IMAX", "Musical", "Mystery", "Romance", "Sci-Fi", "Thriller", "War", "Western"]
+WORDS = ["Love", "Night", "Man", "Day", "Last", "Girl", "House", "Time", "Life", "Dead", "Story", "World", "Black",
+         "City", "Blood", "Home", "King", "Star", "War", "Dark", "Summer", "Red", "Lost", "Secret", "Dream", "Water"]
+FIRST_YEAR, LAST_YEAR = 1920, 2023
+FIRST_TIMESTAMP, LAST_TIMESTAMP = 820454400, 1700000000
+# Ratings per block of users written at once
+BLOCK_ROWS = 1_000_000
+# Users per random stream
+SEED_USERS = 1024
+# Draws of the movies of a block of users, replacing the movies already rated by a user
+MAX_DRAWS = 10
+
+
+def movie_table(n_movies: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Movies table with sparse movie IDs, titles of 1-3 words with a year, and 1-3 pipe-separated genres."""
+    movie_ids = np.cumsum(rng.geometric(0.6, size=n_movies))
+    words = rng.integers(0, len(WORDS), size=(n_movies, 3))
+    n_words = rng.integers(1, 4, size=n_movies)
+    years = rng.integers(FIRST_YEAR, LAST_YEAR + 1, size=n_movies)
+    # The number makes titles unique, as the rating matrix has one row per title
+    titles = [f"{' '.join(WORDS[w] for w in words[i, :n_words[i]])} {i + 1} ({years[i]})" for i in range(n_movies)]
+    genre_sets = rng.integers(0, len(GENRES), size=(n_movies, 3))
+    n_genres = rng.integers(1, 4, size=n_movies)
+    genres = ["|".join(sorted({GENRES[g] for g in genre_sets[i, :n_genres[i]]})) for i in range(n_movies)]
+    return pd.DataFrame({c.MOVIE_ID: movie_ids, c.TITLE: titles, "genres": genres})
+
+
+def popularity_cdf(n_movies: int, exponent: float, rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    """Cumulative Zipf distribution of popularity ranks, and the movie index of every rank."""
+    weights = 1.0 / np.arange(1, n_movies + 1) ** exponent
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1], rng.permutation(n_movies)
+
+
+def activity_scale(mean: float, minimum: int, maximum: int, shape: float) -> float:
+    """Scale of the Pareto (Lomax) tail of user activity, so that 'minimum' plus the tail, capped at 'maximum', has the
+    mean 'mean' (found by bisection, with the closed form of the mean of a capped Lomax variable)."""
+    if mean <= minimum or maximum <= minimum:
+        return 0.0
+
+    def capped_mean(scale: float) -> float:
+        cap = (maximum - minimum) / scale
+        return minimum + scale * (1 - (1 + cap) ** (1 - shape)) / (shape - 1)
+
+    if capped_mean(1e12) <= mean:
+        return 1e12
+    low, high = 0.0, 1.0
+    while capped_mean(high) < mean:
+        low, high = high, 2 * high
+    for _ in range(60):
+        middle = (low + high) / 2
+        low, high = (middle, high) if capped_mean(middle) < mean else (low, middle)
+    return high
+
+
+def user_activity(n_users: int, minimum: int, maximum: int, scale: float, shape: float,
+                  rng: np.random.Generator) -> np.ndarray:
+    """Number of ratings of 'n_users' users: 'minimum' plus a Pareto (Lomax) tail, capped at 'maximum'."""
+    activity = np.round(minimum + rng.pareto(shape, size=n_users) * scale)
+    return np.minimum(activity, maximum).astype(np.int64)
+
+
+def user_ratings(
+    first_user: int, n_users: int, activity: np.ndarray, cdf: np.ndarray, movie_order: np.ndarray,
+    quality: np.ndarray, movie_ids: np.ndarray, rng: np.random.Generator
+) -> pd.DataFrame:
+    """Ratings of users 'first_user' to 'first_user + n_users - 1', with 'activity' ratings each, sorted by user and
+    movie ID."""
+    n_movies = len(movie_ids)
+    # A user rates a movie once: repeated draws are dropped and drawn again, a few times; movies are indexed in ID
+    # order, so the keys sort by user and then by movie ID
+    keys = np.empty(0, dtype=np.int64)
+    missing = activity
+    for _ in range(MAX_DRAWS):
+        users = np.repeat(np.arange(n_users, dtype=np.int64), missing)
+        movies = movie_order[np.searchsorted(cdf, rng.random(len(users)), side="right").clip(max=n_movies - 1)]
+        keys = np.sort(np.concatenate([keys, users * n_movies + movies]))
+        keys = keys[np.r_[True, keys[1:] != keys[:-1]]]
+        missing = activity - np.bincount(keys // n_movies, minlength=n_users)
+        if not missing.any():
+            break
+    users, movies = keys // n_movies, keys % n_movies
+
+    user_bias = rng.normal(0, 0.4, size=n_users)
+    scores = quality[movies] + user_bias[users] + rng.normal(0, 0.8, size=len(keys))
+    ratings = np.clip(np.round(scores * 2) / 2, 0.5, 5.0)
+    return pd.DataFrame({
+        c.USER_ID: users + first_user,
+        c.MOVIE_ID: movie_ids[movies],
+        c.RATING: ratings,
+        "timestamp": rng.integers(FIRST_TIMESTAMP, LAST_TIMESTAMP, size=len(keys)),
+    })
+
+
+def generate_dataset(
+    dir_path: str, n_movies: int, n_users: int, n_ratings: int, seed: int = 0, popularity_exponent: float = 1.0,
+    activity_shape: float = 1.5, min_user_ratings: int = 5, block_rows: int = BLOCK_ROWS
+) -> Tuple[str, str]:
+    """Write synthetic 'movies.csv' and 'ratings.csv' files to 'dir_path', with about 'n_ratings' ratings (fewer if
+    users can't find enough movies to rate). Returns the paths of the files, as fetch_db_files()."""
+    start_time = time.time()
+    os.makedirs(dir_path, exist_ok=True)
+    movies_path, ratings_path = os.path.join(dir_path, c.MOVIES_CSV), os.path.join(dir_path, c.RATINGS_CSV)
+    seeds = np.random.SeedSequence(seed).spawn(2)
+
+    rng = np.random.default_rng(seeds[0])
+    movies_df = movie_table(n_movies, rng)
+    movies_df.to_csv(movies_path, index=False)
+    cdf, movie_order = popularity_cdf(n_movies, popularity_exponent, rng)
+    quality = np.clip(rng.normal(3.5, 0.5, size=n_movies), 1.0, 4.7)
+    movie_ids = movies_df[c.MOVIE_ID].to_numpy()
+
+    max_activity = max(n_movies // 2, 1)
+    scale = activity_scale(n_ratings / n_users, min_user_ratings, max_activity, activity_shape)
+    # One random stream per group of SEED_USERS users, so the output doesn't depend on the block size
+    group_seeds = seeds[1].spawn(-(-n_users // SEED_USERS))
+    written = 0
+    with open(ratings_path, "w", newline="") as f:
+        f.write(f"{c.USER_ID},{c.MOVIE_ID},{c.RATING},timestamp\n")
+        blocks, block_size = [], 0
+        for group, group_seed in enumerate(group_seeds):
+            first_user = group * SEED_USERS
+            n_group = min(SEED_USERS, n_users - first_user)
+            group_rng = np.random.default_rng(group_seed)
+            activity = user_activity(n_group, min_user_ratings, max_activity, scale, activity_shape, group_rng)
+            blocks.append(user_ratings(first_user + 1, n_group, activity, cdf, movie_order, quality, movie_ids,
+                                       group_rng))
+            block_size += len(blocks[-1].index)
+            if block_size >= block_rows or group == len(group_seeds) - 1:
+                pd.concat(blocks).to_csv(f, header=False, index=False)
+                written += block_size
+                blocks, block_size = [], 0
+
+    logging.info("Synthetic dataset generated in %.2f seconds: %d movies, %d users, %d ratings in %s",
+                 time.time() - start_time, n_movies, n_users, written, dir_path)
+    return movies_path, ratings_path
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic MovieLens-shaped dataset.")
+    parser.add_argument("dir_path", help="output folder of movies.csv and ratings.csv")
+    parser.add_argument("--movies", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--ratings", type=float, default=1e7)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    generate_dataset(args.dir_path, args.movies, args.users, int(args.ratings), args.seed)
+
+
+if __name__ == "__main__":
+    main()
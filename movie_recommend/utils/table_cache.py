@@ -0,0 +1,88 @@
+"""
+Columnar on-disk cache of the MovieLens tables.
+
+Parsing 'ratings.csv' from text is the slowest part of get_db(), and every script repeats it. After a download, the
+compact tables (see read_tables()) are saved once as '.npy' columns in a 'cache' folder next to the CSV files:
+- 'movies_movieId.npy', 'movies_title_codes.npy' and 'movies_title_categories_*': movie IDs and categorical titles;
+- 'ratings_userId.npy', 'ratings_movieId.npy', 'ratings_rating.npy': int32 IDs and float32 ratings;
+- 'cache.json': the ETag and Last-Modified values of the downloaded zip file and the number of rows.
+Later reads load only the requested rating columns. The cache is used only while its ETag and Last-Modified values
+match the ones saved by check_file_change(), so a new download of the dataset rebuilds it.
+"""
+
+import os
+import json
+import shutil
+import logging
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+import movie_recommend.constants as c
+from movie_recommend.utils.string_arrays import load_strings, save_strings
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CACHE_DIR = "cache"
+CACHE_MANIFEST = "cache.json"
+RATING_COLUMNS = (c.USER_ID, c.MOVIE_ID, c.RATING)
+
+
+def get_cache_dir(dir_path: str) -> str:
+    return os.path.join(dir_path, CACHE_DIR)
+
+
+def write_table_cache(cache_dir: str, movies_df: DataFrame, rating_df: DataFrame, source: dict) -> None:
+    """Save compact movies and rating tables as '.npy' columns, with the ETag and Last-Modified values ('source') of
+    the files they were read from. The folder is written aside and then swapped in place."""
+    tmp_dir = cache_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    titles = movies_df[c.TITLE].astype("category")
+    np.save(os.path.join(tmp_dir, "movies_movieId.npy"), movies_df[c.MOVIE_ID].to_numpy(dtype=np.int32))
+    np.save(os.path.join(tmp_dir, "movies_title_codes.npy"), titles.cat.codes.to_numpy(dtype=np.int32))
+    save_strings(tmp_dir, "movies_title_categories", titles.cat.categories)
+
+    np.save(os.path.join(tmp_dir, "ratings_userId.npy"), rating_df[c.USER_ID].to_numpy(dtype=np.int32))
+    np.save(os.path.join(tmp_dir, "ratings_movieId.npy"), rating_df[c.MOVIE_ID].to_numpy(dtype=np.int32))
+    np.save(os.path.join(tmp_dir, "ratings_rating.npy"), rating_df[c.RATING].to_numpy(dtype=np.float32))
+
+    with open(os.path.join(tmp_dir, CACHE_MANIFEST), "w") as f:
+        json.dump({"source": source, "movies": len(movies_df.index), "ratings": len(rating_df.index)}, f, indent=2)
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+    logging.info("Columnar cache of the tables saved to: %s", cache_dir)
+
+
+def read_table_cache(
+    cache_dir: str, source: dict, rating_columns: Iterable[str] = RATING_COLUMNS
+) -> Optional[Tuple[DataFrame, DataFrame]]:
+    """Compact movies and rating tables (only 'rating_columns'), or None if the cache is missing or was built from
+    other files than 'source'."""
+    try:
+        with open(os.path.join(cache_dir, CACHE_MANIFEST), "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("source") != source:
+        logging.info("The columnar cache is outdated")
+        return None
+
+    def load_array(name: str) -> np.ndarray:
+        return np.load(os.path.join(cache_dir, f"{name}.npy"))
+
+    categories = pd.Index(load_strings(cache_dir, "movies_title_categories"), dtype=str)
+    titles = pd.Categorical.from_codes(load_array("movies_title_codes"), categories=categories)
+    movies_df = pd.DataFrame({c.MOVIE_ID: load_array("movies_movieId"), c.TITLE: titles})
+
+    rating_df = pd.DataFrame({column: load_array(f"ratings_{column}") for column in rating_columns})
+    if c.USER_ID in rating_df:
+        # Nullable as in read_tables(), since merged_table() adds missing user IDs
+        rating_df[c.USER_ID] = rating_df[c.USER_ID].astype("Int32")
+    logging.info("Tables read from the columnar cache: %s", cache_dir)
+    return movies_df, rating_df
@@ -1,9 +1,12 @@
 import time
 import logging
+import numpy as np
 import pandas as pd
 from pandas import DataFrame
+from scipy.sparse import coo_matrix
 
 import movie_recommend.constants as c
+from movie_recommend.utils.rating_matrix import RatingMatrix, multi_counts
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -16,7 +19,7 @@ def merged_table(movies_df: DataFrame, rating_df: DataFrame) -> DataFrame:
 
     # Number of ratings per movie
     movie_rating_count = (
-        df.groupby(c.TITLE)[c.RATING]
+        df.groupby(c.TITLE, observed=True)[c.RATING]
         .count()
         .reset_index()
         .rename(columns={c.RATING: c.TOTAL_RATING_COUNT})
@@ -29,7 +32,7 @@ def merged_table(movies_df: DataFrame, rating_df: DataFrame) -> DataFrame:
 def mean_rating_table(movie_rating_df: DataFrame) -> DataFrame:
     """Calculates mean rating per movie and merges with the 'totalRatingCount' column"""
     logging.info("Calculating mean rating per movie")
-    mean_ratings = movie_rating_df.groupby(c.TITLE)[c.RATING].mean()
+    mean_ratings = movie_rating_df.groupby(c.TITLE, observed=True)[c.RATING].mean()
 
     mean_ratings_df = mean_ratings.to_frame().join(
         movie_rating_df[[c.TITLE, c.TOTAL_RATING_COUNT]]
@@ -65,3 +68,29 @@ def pivot_ratings(rating_movie_per_user: DataFrame, index: str, columns: str) ->
     logging.info("Done! Time taken to create pivot table: %.2f seconds", elapsed_time)
 
     return pivot_df
+
+
+def sparse_pivot_ratings(rating_movie_per_user: DataFrame) -> RatingMatrix:
+    """Create a sparse "Title vs Users" matrix of movie ratings.
+    Same values as pivot_ratings(index=TITLE, columns=USER_ID) in half stars, but built from integer codes of titles
+    and users, so memory scales with the number of ratings instead of titles x users."""
+    start_time = time.time()
+
+    logging.info("Creating a sparse matrix of movie ratings...")
+    df = rating_movie_per_user.dropna(subset=[c.TITLE, c.USER_ID, c.RATING])
+    title_codes, titles = pd.factorize(df[c.TITLE], sort=True)
+    user_codes, users = pd.factorize(df[c.USER_ID], sort=True)
+    shape = (len(titles), len(users))
+    coords = (title_codes.astype(np.int32), user_codes.astype(np.int32))
+
+    # Several ratings of a user for the same title (movies sharing a title) are averaged, as in pivot_table();
+    # RatingMatrix keeps their exact values and their numbers of ratings
+    sums = coo_matrix((df[c.RATING].to_numpy(dtype=np.float64), coords), shape=shape).tocsr()
+    counts = coo_matrix((np.ones(len(df), dtype=np.float64), coords), shape=shape).tocsr()
+    sums.data /= counts.data
+
+    end_time = time.time()
+    elapsed_time = end_time - start_time
+    logging.info("Done! Time taken to create the sparse matrix: %.2f seconds", elapsed_time)
+
+    return RatingMatrix(sums, np.asarray(titles, dtype=object), np.asarray(users, dtype=object), multi_counts(counts))
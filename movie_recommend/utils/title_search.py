@@ -0,0 +1,171 @@
+"""
+Indexed fuzzy search of movie titles.
+
+A character n-gram inverted index is built once over case-folded titles. A query first collects the titles sharing the
+largest share of n-grams with it (overlap coefficient: shared n-grams over the n-grams of the shorter string, since
+partial_ratio() scores the shorter string against the best matching part of the longer one, so long titles don't win
+on raw counts), and only these candidates are scored with fuzz.partial_ratio(), the same score as the full scan in
+recommendation_rename_movie(). The best titles are then picked with a top-k selection instead of sorting all scores.
+
+TitleResolver resolves exact titles and their usual variants (other case, no year, "Title, The (Year)" written as
+"The Title (Year)") to title positions with a single dictionary lookup, before any fuzzy search.
+"""
+
+import re
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from fuzzywuzzy import fuzz
+
+NGRAM_SIZE = 3
+# Number of candidates scored with fuzz.partial_ratio(), per requested title and at least
+CANDIDATES_PER_TITLE = 20
+MIN_CANDIDATES = 500
+# Articles moved to the end of titles in MovieLens ("Terminator, The (1984)")
+TITLE_ARTICLES = ("the", "a", "an", "les", "la", "le", "il", "das", "der", "die", "el", "los", "las")
+
+_YEAR_PATTERN = re.compile(r"\s*\(\d{4}(?:-\d{4})?\)\s*$")
+_ALTERNATE_TITLE_PATTERN = re.compile(r"\s*\([^()]*\)$")
+_ARTICLE_PATTERN = re.compile(rf"^(.+), ({'|'.join(TITLE_ARTICLES)})$", re.IGNORECASE)
+
+
+def strip_year(title: str) -> str:
+    """Remove the year at the end of a movie title."""
+    return title.rstrip("(0123456789)").rstrip()
+
+
+def title_ngrams(text: str, n: int = NGRAM_SIZE) -> set:
+    """Set of character n-grams of a text, padded with spaces at both ends."""
+    padded = f" {text} "
+    return {padded[i:i + n] for i in range(max(len(padded) - n + 1, 1))}
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the 'k' highest scores, highest first (ties in position order)."""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    # Keep all positions tied with the k-th score, so that ties are broken by position
+    top = np.flatnonzero(scores >= scores[top].min())
+    return top[np.argsort(-scores[top], kind="stable")][:k]
+
+
+class TitleSearchIndex:
+    """Inverted index from character n-grams of case-folded titles to title positions."""
+
+    def __init__(self, titles: np.ndarray, keys: np.ndarray, offsets: np.ndarray, postings: np.ndarray):
+        self.titles = titles
+        self.keys = keys
+        self.offsets = offsets
+        self.postings = postings
+        # Number of n-grams of each title
+        self.sizes = np.bincount(postings, minlength=len(titles))
+        self._key_positions = {key: i for i, key in enumerate(keys)}
+
+    @classmethod
+    def build(cls, titles: Iterable[str]) -> "TitleSearchIndex":
+        titles = np.asarray(list(titles), dtype=object)
+        grams, positions = [], []
+        for position, title in enumerate(titles):
+            title_grams = title_ngrams(title_key(title))
+            grams.extend(title_grams)
+            positions.extend([position] * len(title_grams))
+
+        keys, inverse = np.unique(np.asarray(grams, dtype=object), return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        postings = np.asarray(positions, dtype=np.int32)[order]
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(inverse, minlength=len(keys)), out=offsets[1:])
+        return cls(titles, keys, offsets, postings)
+
+    def candidates(self, query: str, n_candidates: int) -> np.ndarray:
+        """Positions of the titles with the highest overlap coefficient of n-grams with the query."""
+        query_grams = title_ngrams(title_key(query))
+        key_positions = [self._key_positions[gram] for gram in query_grams if gram in self._key_positions]
+        if not key_positions:
+            return np.empty(0, dtype=np.int64)
+        hits = np.concatenate([self.postings[self.offsets[i]:self.offsets[i + 1]] for i in key_positions])
+        counts = np.bincount(hits, minlength=len(self.titles))
+        scores = counts / np.minimum(self.sizes, len(query_grams))
+        return np.sort(top_k(scores, min(n_candidates, np.count_nonzero(counts))))
+
+    def search(self, query: str, n_recommend: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions and partial_ratio() scores of the titles most similar to the query, best first.
+        The year at the end of the query is ignored, as in recommendation_rename_movie()."""
+        query = strip_year(query)
+        n_candidates = max(CANDIDATES_PER_TITLE * n_recommend, MIN_CANDIDATES)
+        positions = self.candidates(query, n_candidates)
+
+        # Too few candidates (very short or unusual query): score all titles
+        if len(positions) < min(n_recommend, len(self.titles)):
+            positions = np.arange(len(self.titles))
+
+        scores = np.array([fuzz.partial_ratio(query, title) for title in self.titles[positions]], dtype=np.int64)
+        best = top_k(scores, n_recommend)
+        return positions[best], scores[best]
+
+
+def title_key(title: str) -> str:
+    """Case-folded title with collapsed whitespace."""
+    return " ".join(title.split()).casefold()
+
+
+def title_variants(title: str) -> set:
+    """Lookup keys of a title: the title itself, without the year, without the alternate title in parentheses, and
+    with the article moved back to the front or dropped."""
+    key = title_key(title)
+    year_match = _YEAR_PATTERN.search(key)
+    year = year_match.group(0).strip() if year_match else ""
+    base = key[:year_match.start()] if year_match else key
+
+    bases = {base, _ALTERNATE_TITLE_PATTERN.sub("", base) or base}
+    for variant in list(bases):
+        article_match = _ARTICLE_PATTERN.match(variant)
+        if article_match:
+            bases.add(f"{article_match.group(2)} {article_match.group(1)}")
+            bases.add(article_match.group(1))
+
+    variants = {key}
+    for variant in bases:
+        variants.add(variant)
+        if year:
+            variants.add(f"{variant} {year}")
+    return variants
+
+
+class TitleResolver:
+    """Hash map from titles and their normalized variants to title positions."""
+
+    def __init__(self, titles: np.ndarray, exact: Dict[str, int], variants: Dict[str, int]):
+        self.titles = titles
+        self.exact = exact
+        self.variants = variants
+
+    @classmethod
+    def build(cls, titles: Iterable[str], rating_counts: Optional[Dict[str, int]] = None) -> "TitleResolver":
+        """Build the resolver. A variant shared by several titles resolves to the most rated one (the first one if
+        'rating_counts' is not given)."""
+        titles = np.asarray(list(titles), dtype=object)
+        rating_counts = rating_counts or {}
+        exact, variants, best_counts = {}, {}, {}
+        for position, title in enumerate(titles):
+            exact.setdefault(title, position)
+            count = rating_counts.get(title, 0)
+            for variant in title_variants(title):
+                if variant not in variants or count > best_counts[variant]:
+                    variants[variant] = position
+                    best_counts[variant] = count
+        return cls(titles, exact, variants)
+
+    def resolve(self, query: str) -> Optional[int]:
+        """Position of the title matching the query, or None."""
+        position = self.exact.get(query)
+        if position is None:
+            position = self.variants.get(title_key(query))
+        return position
+
+    def resolve_title(self, query: str) -> Optional[str]:
+        """Title matching the query, or None."""
+        position = self.resolve(query)
+        return None if position is None else self.titles[position]
@@ -0,0 +1,16 @@
+"""
+Shared pytest fixtures.
+
+The synthetic_dataset fixture writes a small synthetic MovieLens-shaped dataset once per test session and returns the
+paths of its 'movies.csv' and 'ratings.csv' files, as fetch_db_files().
+"""
+
+import pytest
+
+from movie_recommend.utils.synthetic_data import generate_dataset
+
+
+@pytest.fixture(scope="session")
+def synthetic_dataset(tmp_path_factory):
+    """Paths of the movies and ratings CSV files of a synthetic dataset: 300 movies, 1000 users, ~20000 ratings."""
+    return generate_dataset(str(tmp_path_factory.mktemp("synthetic")), 300, 1000, 20_000, seed=1)
@@ -0,0 +1,73 @@
+"""
+This script contains unit tests for the ann_index module. The IvfCosineNeighbors class is an approximate k-Nearest
+Neighbors index (truncated SVD embeddings grouped by spherical k-means, with an exact rerank of the best candidates)
+that can replace the brute-force cosine search of the KNN model.
+
+The script defines a fixture that creates a sample sparse rating matrix with groups of similar movies. The tests assert
+that an exhaustive index returns exactly the brute-force neighbors, that the default index keeps a high recall@k in
+knn_recall_report, and that the index is saved with a model artifact and used by the loaded artifact.
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.sparse import csr_matrix
+
+from movie_recommend.model_types import ModelTypeKnn
+from movie_recommend.utils.ann_index import IvfCosineNeighbors, knn_recall_report
+from movie_recommend.utils.artifact_store import read_artifact, write_artifact
+from movie_recommend.utils.rating_matrix import RatingMatrix
+from movie_recommend.utils.recommendation_algorithms import CosineNeighbors
+
+
+@pytest.fixture
+def matrix():
+    # 10 groups of 40 movies, each group mostly rated by its own users
+    rng = np.random.default_rng(41)
+    n_movies, n_users, n_groups = 400, 1000, 10
+    movie_groups = np.arange(n_movies) % n_groups
+    user_groups = rng.integers(0, n_groups, size=n_users)
+    probability = np.where(movie_groups[:, None] == user_groups[None, :], 0.3, 0.02)
+    ratings = np.ceil(rng.random((n_movies, n_users)) * 10) / 2
+    return csr_matrix(np.where(rng.random((n_movies, n_users)) < probability, ratings, 0.0))
+
+
+def test_exhaustive_index_matches_brute_force(matrix):
+    index = ModelTypeKnn.build_model(matrix, "ivf", n_components=16, n_lists=8, n_probes=8, n_candidates=400)
+    assert isinstance(index, IvfCosineNeighbors)
+
+    distances, indices = index.kneighbors(matrix[[0, 17, 399]], n_neighbors=11)
+    expected_distances, expected_indices = CosineNeighbors(matrix).kneighbors(matrix[[0, 17, 399]], n_neighbors=11)
+
+    np.testing.assert_allclose(distances, expected_distances)
+    np.testing.assert_array_equal(np.sort(indices, axis=1), np.sort(expected_indices, axis=1))
+
+
+def test_knn_recall_report(matrix):
+    index = IvfCosineNeighbors.build(matrix, n_components=16, n_probes=4, n_candidates=100)
+    report = knn_recall_report(index, matrix, k=10, n_queries=50)
+
+    assert report["n_queries"] == 50
+    assert report["recall_at_k"] > 0.8
+    assert report["approx_query_ms"] > 0 and report["exact_query_ms"] > 0
+
+
+def test_ivf_index_in_artifact(matrix, tmp_path):
+    titles = np.array([f"Movie {i}" for i in range(matrix.shape[0])], dtype=object)
+    features = RatingMatrix(matrix, titles, np.arange(matrix.shape[1]).astype(str))
+    all_ratings = pd.DataFrame({"title": titles, "mean_rating": 3.0, "totalRatingCount": matrix.getnnz(axis=1)})
+    index = IvfCosineNeighbors.build(matrix, n_components=16, n_probes=4, n_candidates=100)
+    recall = knn_recall_report(index, matrix, k=10, n_queries=20)
+
+    manifest = write_artifact(str(tmp_path / "knn_model_small"), "knn", "small", features, all_ratings, titles, 10,
+                              knn_index=index, knn_recall=recall)
+    artifact = read_artifact(str(tmp_path / "knn_model_small"))
+
+    assert manifest["knn_backend"] == "ivf" and manifest["knn_recall"] == recall
+    assert isinstance(artifact.model, IvfCosineNeighbors)
+    assert artifact.model.params == index.params
+    np.testing.assert_array_equal(
+        artifact.model.kneighbors(matrix[:5], 6)[1], index.kneighbors(matrix[:5], 6)[1]
+    )
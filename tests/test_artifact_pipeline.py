@@ -0,0 +1,57 @@
+"""
+This script contains unit tests for the artifact_pipeline module. The produce_artifacts function runs the stages shared
+by all models of a dataset once, then builds the artifacts of the k-Nearest Neighbors and Pearson correlation models,
+in worker processes if requested, and reports the wall time and peak memory of every stage.
+
+The script defines a function that returns small sample movie and rating tables in place of get_db. The test asserts
+that the artifacts of both datasets, built in the calling process or in a process pool, can be opened with
+read_artifact, and that every stage is reported.
+
+To run the test, execute the test_produce_artifacts function.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from movie_recommend.utils.artifact_pipeline import produce_artifacts
+from movie_recommend.utils.artifact_store import read_artifact
+
+
+def sample_db(dataset_size, compact=False):
+    """Sample movie and rating tables, with more movies and users for the "full" dataset."""
+    n_movies, n_users = (30, 60) if dataset_size == "small" else (50, 100)
+    rng = np.random.default_rng(41)
+    movies_df = pd.DataFrame({"movieId": np.arange(n_movies), "title": [f"Movie {i} (2000)" for i in range(n_movies)]})
+    rating_df = pd.DataFrame({
+        "userId": rng.integers(0, n_users, size=20 * n_movies),
+        "movieId": rng.integers(0, n_movies, size=20 * n_movies),
+        "rating": np.ceil(rng.random(20 * n_movies) * 10) / 2,
+    }).drop_duplicates(["userId", "movieId"])
+    return movies_df, rating_df
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_produce_artifacts(tmp_path, n_workers):
+    datasets = {"small": 5, "full": 5}
+    records = produce_artifacts(datasets, ("knn", "corr"), str(tmp_path), n_workers=n_workers, n_neighbors=5,
+                                load_db=sample_db)
+
+    assert sorted(os.listdir(tmp_path)) == ["corr_model_full", "corr_model_small", "knn_model_full", "knn_model_small"]
+    for db_size in datasets:
+        knn = read_artifact(str(tmp_path / f"knn_model_{db_size}"))
+        corr = read_artifact(str(tmp_path / f"corr_model_{db_size}"))
+        assert knn.manifest["db_size"] == db_size and knn.manifest["neighbors_k"] == 5
+        assert knn.features_df.shape == corr.features_df.shape
+        assert knn.model is not None and corr.model is None
+
+    stages = {(record["label"], record["stage"]) for record in records}
+    assert ("small dataset", "sparse_pivot_ratings") in stages
+    assert ("knn full", "knn neighbor table") in stages
+    assert ("corr small", "corr neighbor table") in stages
+    assert all(record["seconds"] >= 0 for record in records)
+    if n_workers > 1:
+        # Models were built in worker processes
+        assert all(record["pid"] != os.getpid() for record in records)
@@ -0,0 +1,93 @@
+"""
+This script contains unit tests for the artifact_store module, which saves model artifacts as folders of raw '.npy'
+arrays plus a 'manifest.json' file, and opens them memory-mapped.
+
+The script defines a fixture that creates a small sparse rating matrix, a ratings table and a list of titles. The tests
+assert that an artifact written to a temporary folder is read back with the same content, that the rating matrix is
+memory-mapped rather than copied, and that the KNN model rebuilt from the artifact returns the same neighbors as a
+NearestNeighbors model trained on the original matrix. Neighbor tables keep the dtype of their scores, and correlation
+tables of former artifacts, saved in 'float32', are not used.
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from scipy.sparse import random as sparse_random
+from sklearn.neighbors import NearestNeighbors
+
+from movie_recommend.utils.artifact_store import MANIFEST_FILE, read_artifact, write_artifact
+from movie_recommend.utils.neighbor_table import corr_neighbor_table
+from movie_recommend.utils.rating_matrix import RatingMatrix
+
+
+@pytest.fixture
+def sample_artifact():
+    np.random.seed(41)
+    matrix = sparse_random(30, 200, density=0.2, format="csr", random_state=41)
+    matrix.data = np.ceil(matrix.data * 10) / 2
+    titles = np.array([f"Movie {i} ({1990 + i})" for i in range(30)], dtype=object)
+    titles[3] = "Amélie (Fabuleux destin d'Amélie Poulain, Le) (2001)"
+    users = np.array([str(i) for i in range(1, 201)], dtype=object)
+    all_ratings = pd.DataFrame({
+        "title": np.append(titles, "Unrated (1999)"),
+        "mean_rating": np.append(np.random.rand(30) * 5, np.nan),
+        "totalRatingCount": np.append(np.random.randint(1, 100, 30), 0),
+    })
+    total_movie_array = all_ratings["title"].values
+    return RatingMatrix(matrix, titles, users), all_ratings, total_movie_array
+
+
+def test_write_and_read_artifact(sample_artifact, tmp_path):
+    features, all_ratings, total_movie_array = sample_artifact
+    dir_path = str(tmp_path / "knn_model_small")
+
+    manifest = write_artifact(dir_path, "knn", "small", features, all_ratings, total_movie_array, 10)
+    assert os.path.exists(os.path.join(dir_path, MANIFEST_FILE))
+    assert manifest["shape"] == [30, 200]
+
+    artifact = read_artifact(dir_path)
+
+    # The rating matrix is memory-mapped (read-only views of the '.npy' files)
+    assert not artifact.features_df.matrix.data.flags.writeable
+    assert not artifact.features_df.matrix.data.flags.owndata
+    assert (artifact.features_df.matrix != features.matrix).nnz == 0
+    assert list(artifact.features_df.titles) == list(features.titles)
+    assert list(artifact.features_df.users) == list(features.users)
+    assert list(artifact.total_movie_array) == list(total_movie_array)
+    assert_frame_equal(artifact.all_ratings, all_ratings, check_dtype=False)
+    assert artifact.manifest["checksum"] == manifest["checksum"]
+
+
+def test_knn_model_from_artifact(sample_artifact, tmp_path):
+    features, all_ratings, total_movie_array = sample_artifact
+    dir_path = str(tmp_path / "knn_model_small")
+    write_artifact(dir_path, "knn", "small", features, all_ratings, total_movie_array, 10)
+    artifact = read_artifact(dir_path)
+
+    reference = NearestNeighbors(metric="cosine", algorithm="brute").fit(features.matrix)
+    for movie_index in (0, 3, 17):
+        expected_distances, expected_indices = reference.kneighbors(features.matrix[movie_index], n_neighbors=8)
+        distances, indices = artifact.model.kneighbors(artifact.features_df.matrix[movie_index], n_neighbors=8)
+        np.testing.assert_array_equal(indices, expected_indices)
+        np.testing.assert_allclose(distances, expected_distances)
+
+
+def test_neighbor_scores_dtype(sample_artifact, tmp_path):
+    features, all_ratings, total_movie_array = sample_artifact
+    dir_path = str(tmp_path / "corr_model_small")
+    neighbors = corr_neighbor_table(features, k=5, min_periods=5)
+    write_artifact(dir_path, "corr", "small", features, all_ratings, total_movie_array, 10, neighbors)
+
+    # Correlations are saved in 'float64', as computed by recommendation_corr()
+    artifact = read_artifact(dir_path)
+    assert artifact.neighbors.scores.dtype == np.float64
+    np.testing.assert_array_equal(artifact.neighbors.scores, neighbors.scores)
+
+    # 'float32' correlations of former artifacts are not used for lookups
+    np.save(os.path.join(dir_path, "neighbor_scores.npy"), neighbors.scores.astype(np.float32))
+    assert read_artifact(dir_path).neighbors is None
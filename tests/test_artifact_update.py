@@ -0,0 +1,126 @@
+"""
+This script contains unit tests for the artifact_update module. The update_artifact function adds a delta of new
+ratings to a model artifact: it patches the rating matrix, the mean ratings and the neighbor table, and moves the
+movies that cross the rating threshold into the model.
+
+The script defines sample movie and rating tables, split into base ratings and a delta of new ratings (with new users
+and ratings of movies below the threshold). The tests assert that an artifact built from the base ratings and updated
+with the delta matches an artifact built from all the ratings, for both models. Another test checks movies sharing a
+title, whose stored average ratings are merged with the delta using the number of ratings they hold.
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from movie_recommend.utils.artifact_pipeline import produce_artifacts
+from movie_recommend.utils.artifact_store import read_artifact
+from movie_recommend.utils.artifact_update import update_artifact
+
+RATING_THRESHOLD = 12
+
+
+@pytest.fixture
+def sample_ratings():
+    """Sample movies and ratings, with the last ratings as a delta."""
+    n_movies, n_users = 40, 80
+    rng = np.random.default_rng(7)
+    movies_df = pd.DataFrame({"movieId": np.arange(n_movies), "title": [f"Movie {i} (2000)" for i in range(n_movies)]})
+    rating_df = pd.DataFrame({
+        "userId": rng.integers(0, n_users, size=16 * n_movies),
+        # Some movies are rarely rated, to cross the rating threshold with the delta
+        "movieId": np.minimum(rng.geometric(0.05, size=16 * n_movies), n_movies) - 1,
+        "rating": np.ceil(rng.random(16 * n_movies) * 10) / 2,
+    }).drop_duplicates(["userId", "movieId"]).reset_index(drop=True)
+    # New users only rate in the delta
+    n_delta = len(rating_df) // 10
+    rating_df.loc[len(rating_df) - n_delta // 2:, "userId"] += n_users
+    rating_df["userId"] = rating_df["userId"].astype("Int32")
+    rating_df["rating"] = rating_df["rating"].astype(np.float32)
+    return movies_df, rating_df.iloc[:-n_delta], rating_df.iloc[-n_delta:]
+
+
+@pytest.mark.parametrize("model_type", ["knn", "corr"])
+def test_update_matches_full_build(tmp_path, sample_ratings, model_type):
+    movies_df, base_df, delta_df = sample_ratings
+    full_df = pd.concat([base_df, delta_df])
+    base_dir, full_dir = tmp_path / "base", tmp_path / "full"
+    produce_artifacts({"small": RATING_THRESHOLD}, [model_type], str(base_dir), n_neighbors=8,
+                      load_db=lambda db_size, compact: (movies_df, base_df))
+    produce_artifacts({"small": RATING_THRESHOLD}, [model_type], str(full_dir), n_neighbors=8,
+                      load_db=lambda db_size, compact: (movies_df, full_df))
+
+    dir_path = str(base_dir / f"{model_type}_model_small")
+    old = read_artifact(dir_path)
+    manifest = update_artifact(dir_path, delta_df.astype({"userId": str, "movieId": str}))
+    updated = read_artifact(dir_path)
+    expected = read_artifact(str(full_dir / f"{model_type}_model_small"))
+
+    assert manifest["version"] == 2 and manifest["update"]["parent_checksum"] == old.manifest["checksum"]
+    assert manifest["update"]["admitted_movies"] > 0
+    assert list(updated.features_df.titles) == list(expected.features_df.titles)
+
+    # Same ratings, whatever the order of the users
+    def dense(features):
+        return pd.DataFrame(features.matrix.toarray(), index=features.titles, columns=features.users)
+    pd.testing.assert_frame_equal(dense(updated.features_df), dense(expected.features_df)[updated.features_df.users])
+
+    all_ratings = updated.all_ratings.set_index("title").sort_index()
+    expected_ratings = expected.all_ratings.set_index("title").sort_index()
+    np.testing.assert_array_equal(all_ratings["totalRatingCount"], expected_ratings["totalRatingCount"])
+    np.testing.assert_allclose(all_ratings["mean_rating"], expected_ratings["mean_rating"], rtol=1e-5)
+
+    # Same neighbor scores (ties may be ordered differently)
+    np.testing.assert_allclose(updated.neighbors.scores, expected.neighbors.scores, rtol=1e-5, atol=1e-6)
+
+
+def test_update_weights_stored_averages(tmp_path):
+    """Movies sharing a title: the stored average of a user's ratings is merged with the number of ratings it holds."""
+    rng = np.random.default_rng(3)
+    titles = [f"Movie {i} (2000)" for i in range(30)] + ["Twin (2000)"] * 3 + ["Pair (2001)"] * 3
+    movies_df = pd.DataFrame({"movieId": np.arange(len(titles)), "title": titles})
+    common = pd.DataFrame({
+        "userId": rng.integers(0, 60, size=900), "movieId": rng.integers(0, 30, size=900),
+        "rating": np.ceil(rng.random(900) * 10) / 2,
+    }).drop_duplicates(["userId", "movieId"])
+
+    def ratings(users, movie_id, rating):
+        return pd.DataFrame({"userId": users, "movieId": movie_id, "rating": rating})
+
+    # "Twin" is above the rating threshold and "Pair" below it; users 0-2 rated two movies of each title
+    base_df = pd.concat([common, ratings(range(20), 30, 4.0), ratings(range(3), 31, 5.0),
+                         ratings(range(5), 33, 4.0), ratings(range(3), 34, 5.0)])
+    # A third rating of the same users for each title: "Pair" crosses the rating threshold
+    delta_df = pd.concat([ratings(range(3), 32, 1.0), ratings(range(5), 35, 1.0), ratings(range(20, 25), 35, 3.0)])
+    base_df, delta_df = (df.astype({"userId": "Int32", "rating": np.float32}).reset_index(drop=True)
+                         for df in (base_df, delta_df))
+    full_df = pd.concat([base_df, delta_df])
+
+    base_dir, full_dir = tmp_path / "base", tmp_path / "full"
+    for out_dir, df in ((base_dir, base_df), (full_dir, full_df)):
+        produce_artifacts({"small": RATING_THRESHOLD}, ["corr"], str(out_dir), n_neighbors=8,
+                          load_db=lambda db_size, compact, df=df: (movies_df, df))
+    dir_path = str(base_dir / "corr_model_small")
+    assert read_artifact(dir_path).features_df.counts.nnz == 3
+    update_artifact(dir_path, delta_df.astype({"userId": str, "movieId": str}))
+    updated = read_artifact(dir_path).features_df
+    expected = read_artifact(str(full_dir / "corr_model_small")).features_df
+
+    # (4 + 5 + 1) / 3 kept exact (stored rounded to 3.5 stars); averaging the stored 4.5 with 1 as two ratings would
+    # give 3.0
+    for title in ("Twin (2000)", "Pair (2001)"):
+        row = updated.get_loc(title)
+        users = np.asarray(updated.users).astype(str)
+        for user in ("0", "1", "2"):
+            column = int(np.flatnonzero(users == user)[0])
+            assert updated.matrix[row, column] == 7
+            assert updated.ratings(np.float64)[row, column] == pytest.approx(10 / 3)
+            assert updated.counts[row, column] == 3
+
+    def dense(features):
+        return pd.DataFrame(features.ratings(np.float64).toarray(), index=features.titles,
+                            columns=np.asarray(features.users).astype(str))
+    expected_dense = dense(expected)
+    pd.testing.assert_frame_equal(dense(updated), expected_dense[dense(updated).columns])
@@ -0,0 +1,156 @@
+"""
+This script contains unit tests for the ASGI app. Request parsing, cache lookups and response rendering run on the
+event loop, and recommendations missing from the cache are computed in a bounded pool of workers.
+
+The script uses the synthetic_dataset fixture of conftest.py to produce KNN and correlation artifacts, and defines a
+fixture that creates an app with a small thread pool over them. Requests are sent by calling the ASGI app directly.
+The tests assert that the routes answer as in the Flask app (with a 400 response for invalid requests, such as a form
+with a blank field), that a cached response is served while all workers are busy, that computations beyond the
+waiting limit are rejected with a 503 response, and that reloading an artifact doesn't block the other requests.
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import json
+import asyncio
+import threading
+
+import pytest
+
+import movie_recommend.asgi_app as asgi_app
+from movie_recommend.utils.artifact_pipeline import produce_artifacts
+from movie_recommend.utils.model_registry import ModelRegistry
+from movie_recommend.utils.response_cache import ResponseCache
+
+
+async def call(app, method: str, path: str, body: bytes = b""):
+    """Status, headers and body of the response of the ASGI app to a request."""
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app({"type": "http", "method": method, "path": path, "headers": []}, receive, send)
+    return sent[0]["status"], dict(sent[0]["headers"]), sent[1]["body"]
+
+
+def request_body(titles, model_type="knn", n_recommend=5) -> bytes:
+    return json.dumps({"data": {"titles": titles, "n_recommend": n_recommend, "model_type": model_type}}).encode()
+
+
+@pytest.fixture
+def app(tmp_path_factory, synthetic_dataset, monkeypatch):
+    """ASGI app with 2 worker threads over artifacts of the synthetic dataset, and an empty response cache."""
+    pkl_dir = tmp_path_factory.mktemp("asgi")
+    produce_artifacts({"small": 20}, ["knn", "corr"], str(pkl_dir), n_neighbors=5, memory_limit_mb=64,
+                      fetch_files=lambda db_size: synthetic_dataset)
+    monkeypatch.setattr(asgi_app, "registry", ModelRegistry(str(pkl_dir)))
+    monkeypatch.setattr("movie_recommend.movie_recommendations.response_cache", ResponseCache())
+    app = asgi_app.RecommendApp(db_size="small", workers=2, waiting=1, warm_up=True)
+    app.start()
+    yield app
+    app.stop()
+
+
+def test_routes(app):
+    titles = list(asgi_app.registry.get("knn", "small").features_df.titles[:2])
+
+    async def requests():
+        ready = await call(app, "GET", "/ready")
+        single = await call(app, "POST", "/recommend_api", json.dumps(
+            {"data": {"movie": titles[0], "n_recommend": 3, "model_type": "corr"}}
+        ).encode())
+        batch = await call(app, "POST", "/recommend_batch", request_body(titles + ["Unknown movie"]))
+        form = await call(app, "POST", "/recommend", f"movie={titles[1]}&n=4&model=knn".replace(" ", "+").encode())
+        invalid = await call(app, "POST", "/recommend_batch", b"not json")
+        # JSON bodies or 'data' fields that are not objects
+        not_objects = [await call(app, "POST", route, body) for route in ("/recommend_api", "/recommend_batch")
+                       for body in (b'["a"]', b'3', b'{"data": ["a"]}')]
+        blank = await call(app, "POST", "/recommend", f"movie={titles[1]}&n=&model=knn".replace(" ", "+").encode())
+        missing = await call(app, "GET", "/missing")
+        metrics = await call(app, "GET", "/metrics")
+        return ready, single, batch, form, invalid, not_objects, blank, missing, metrics
+
+    ready, single, batch, form, invalid, not_objects, blank, missing, metrics = asyncio.run(requests())
+    assert ready[0] == 200 and json.loads(ready[2]) == {"status": "ready"}
+
+    assert single[0] == 200
+    assert len(json.loads(json.loads(single[2])["json_table"])["data"]) == 3
+
+    assert batch[0] == 200
+    results = json.loads(batch[2])["results"]
+    assert [result["status"] for result in results] == ["ok", "ok", "not_found"]
+    assert "error" in results[2] and "message" in results[0]
+
+    assert form[0] == 200 and form[1][b"content-type"].startswith(b"text/html")
+    assert b"<table" in form[2]
+    assert invalid[0] == 400 and missing[0] == 404
+    assert all(response[0] == 400 and json.loads(response[2]) == {"message": "Invalid request"}
+               for response in not_objects)
+    # A blank field is kept and rejected, instead of shifting the other fields
+    assert blank[0] == 400 and json.loads(blank[2]) == {"message": "Invalid request"}
+    assert b'movie_recommend_http_request_seconds_count{route="/recommend_batch",method="POST",status="200"}' in metrics[2]
+
+
+def test_cache_hits_while_workers_are_busy(app, monkeypatch):
+    title = asgi_app.registry.get("knn", "small").features_df.titles[0]
+    release = threading.Event()
+    compute = asgi_app.compute_recommendations
+
+    def slow_compute(model_type, db_size, n_recommend, movies_to_compare):
+        if movies_to_compare != [title]:
+            release.wait(10)
+        return compute(model_type, db_size, n_recommend, movies_to_compare)
+
+    monkeypatch.setattr(asgi_app, "compute_recommendations", slow_compute)
+
+    async def requests():
+        # Cached response
+        assert (await call(app, "POST", "/recommend_batch", request_body([title])))[0] == 200
+
+        # Both workers are busy and one computation waits
+        slow = [asyncio.create_task(call(app, "POST", "/recommend_batch", request_body([f"Slow {i}"])))
+                for i in range(3)]
+        await asyncio.sleep(0.2)
+        rejected = await call(app, "POST", "/recommend_batch", request_body(["Slow 3"]))
+        cached = await asyncio.wait_for(call(app, "POST", "/recommend_batch", request_body([title])), 2)
+        assert not any(task.done() for task in slow)
+
+        release.set()
+        return rejected, cached, await asyncio.gather(*slow)
+
+    rejected, cached, slow = asyncio.run(requests())
+    assert rejected[0] == 503
+    assert cached[0] == 200 and json.loads(cached[2])["results"][0]["status"] == "ok"
+    assert [response[0] for response in slow] == [200, 200, 200]
+
+
+def test_artifact_reload_off_event_loop(app, monkeypatch):
+    title = asgi_app.registry.get("knn", "small").features_df.titles[0]
+    release = threading.Event()
+    released = []
+    get = asgi_app.registry.get
+
+    def slow_get(model_type, db_size):
+        # An artifact rewritten on disk is reloaded by the registry (on the event loop, the wait would time out)
+        released.append(release.wait(5))
+        return get(model_type, db_size)
+
+    monkeypatch.setattr(asgi_app.registry, "get", slow_get)
+
+    async def requests():
+        reloading = asyncio.create_task(call(app, "POST", "/recommend_batch", request_body([title])))
+        await asyncio.sleep(0.1)
+        # Other requests are served while the artifact is reloaded
+        metrics = await asyncio.wait_for(call(app, "GET", "/metrics"), 2)
+        assert not reloading.done()
+        release.set()
+        return metrics, await reloading
+
+    metrics, reloaded = asyncio.run(requests())
+    assert metrics[0] == 200 and reloaded[0] == 200
+    assert released == [True]
@@ -0,0 +1,76 @@
+"""
+This script contains unit tests for the benchmark script. The benchmark times every pipeline stage and both
+recommendation engines on synthetic data, records latency percentiles and peak memory, and compares them with a stored
+baseline.
+
+The script defines a tiny data scale. The tests assert that every stage is measured with consistent percentiles, that
+the results are written to JSON and saved as a baseline, that a missing baseline fails the run, and that only
+regressions beyond the tolerance are reported.
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import json
+
+import pytest
+
+import movie_recommend.benchmark as benchmark
+
+STAGES = ["merged_table", "mean_rating_table", "filter_movies_by_rating_count", "sparse_pivot_ratings",
+          "pivot_ratings", "knn_train", "recommendation_knn", "recommendation_corr", "recommendation_rename_movie",
+          "launch_knn", "launch_corr"]
+
+
+@pytest.fixture
+def tiny_scale(monkeypatch):
+    """Tiny data scale 'tiny'."""
+    monkeypatch.setitem(benchmark.SCALES, "tiny",
+                        {"n_movies": 60, "n_users": 200, "n_ratings": 3000, "rating_threshold": 5})
+    return "tiny"
+
+
+def test_benchmark_scale(tiny_scale):
+    results = benchmark.benchmark_scale(tiny_scale, benchmark.SCALES[tiny_scale], repeats=2, n_queries=5)
+    assert sorted(results) == sorted(STAGES)
+    for measurement in results.values():
+        assert 0 <= measurement["p50_ms"] <= measurement["p95_ms"] <= measurement["p99_ms"]
+        assert measurement["peak_mb"] >= 0
+    assert results["launch_knn"]["n"] == 5
+
+
+def test_dense_stages_skipped(tiny_scale, monkeypatch):
+    monkeypatch.setattr(benchmark, "DENSE_MAX_CELLS", 10)
+    results = benchmark.benchmark_scale(tiny_scale, benchmark.SCALES[tiny_scale], repeats=1, n_queries=2)
+    assert "pivot_ratings" not in results and "knn_train" not in results
+
+
+def test_main_with_baseline(tiny_scale, tmp_path, monkeypatch):
+    output, baseline = tmp_path / "results.json", tmp_path / "baseline.json"
+    args = ["--scales", tiny_scale, "--repeats", "1", "--queries", "2", "--output", str(output),
+            "--baseline", str(baseline)]
+    # A missing baseline fails the run, unless it is the run storing the baseline
+    assert benchmark.main(args) == 2
+    assert benchmark.main(args + ["--update-baseline"]) == 0
+    assert json.loads(baseline.read_text())["results"].keys() == {f"tiny/{stage}" for stage in STAGES}
+
+    # Any result is slower than a zero baseline
+    monkeypatch.setattr(benchmark, "MIN_SLACK_MS", 0)
+    data = json.loads(baseline.read_text())
+    for measurement in data["results"].values():
+        measurement["p50_ms"] = 0
+    baseline.write_text(json.dumps(data))
+    assert benchmark.main(args) == 1
+
+
+def test_compare_with_baseline():
+    baseline = {"results": {"s/a": {"p50_ms": 10.0, "peak_mb": 100.0}, "s/b": {"p50_ms": 10.0, "peak_mb": None}}}
+    results = {"results": {
+        "s/a": {"p50_ms": 12.0, "peak_mb": 110.0},
+        "s/b": {"p50_ms": 20.0, "peak_mb": 5.0},
+        "s/c": {"p50_ms": 1000.0, "peak_mb": 1000.0},
+    }}
+    regressions = benchmark.compare_with_baseline(results, baseline, tolerance=0.25)
+    assert len(regressions) == 1 and regressions[0].startswith("s/b: median latency")
+
+    results["results"]["s/a"]["peak_mb"] = 200.0
+    assert len(benchmark.compare_with_baseline(results, baseline, tolerance=0.25)) == 2
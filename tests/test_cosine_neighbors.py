@@ -0,0 +1,108 @@
+"""
+This script contains unit tests for the CosineNeighbors class of the recommendation_algorithms module. CosineNeighbors
+is the exact cosine k-Nearest Neighbors search of the KNN model: it keeps the L2-normalized movie rows, transposed, and
+answers queries with one sparse matrix product and a top-k selection, with batches split between threads.
+
+The script uses the synthetic_dataset fixture of conftest.py. The tests assert that the neighbors are the same as those
+of a NearestNeighbors model with the cosine metric, that neighbors and distances are identical to the former search
+with cosine_distances(), for single and batched queries with and without threads, and that the normalized vectors are
+saved with KNN artifacts and memory-mapped when they are opened.
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import os
+
+import numpy as np
+import pytest
+from sklearn.metrics.pairwise import cosine_distances
+from sklearn.neighbors import NearestNeighbors
+
+from movie_recommend.utils.artifact_pipeline import prepare_dataset
+from movie_recommend.utils.artifact_store import data_nbytes, load_dataset, read_artifact, write_artifact
+from movie_recommend.utils.rating_matrix import float_values
+from movie_recommend.utils.recommendation_algorithms import CosineNeighbors, recommendation_knn
+
+
+@pytest.fixture(scope="module")
+def features(synthetic_dataset, tmp_path_factory):
+    shared_dir = str(tmp_path_factory.mktemp("shared"))
+    prepare_dataset("small", 10, shared_dir, memory_limit_mb=64, fetch_files=lambda db_size: synthetic_dataset)
+    features, all_ratings, total_movie_array = load_dataset(shared_dir)
+    return features, all_ratings, total_movie_array
+
+
+def test_same_neighbors_as_nearest_neighbors(features):
+    features, _, _ = features
+    reference = NearestNeighbors(metric="cosine", algorithm="brute").fit(float_values(features.matrix))
+    model = CosineNeighbors(features.matrix)
+
+    for movie_index in range(0, len(features), 11):
+        expected_distances, expected_indices = reference.kneighbors(features.matrix[movie_index], n_neighbors=21)
+        distances, indices = model.kneighbors(features.matrix[movie_index], n_neighbors=21)
+        np.testing.assert_array_equal(indices, expected_indices)
+        np.testing.assert_allclose(distances, expected_distances, atol=1e-6)
+
+
+def cosine_distances_kneighbors(matrix, X, n_neighbors):
+    """Former CosineNeighbors.kneighbors(): cosine_distances() with all movies, then the same top-k selection."""
+    dist = cosine_distances(float_values(X), float_values(matrix))
+    sample_range = np.arange(dist.shape[0])[:, None]
+    neigh_ind = np.argpartition(dist, n_neighbors - 1, axis=1)[:, :n_neighbors]
+    neigh_ind = neigh_ind[sample_range, np.argsort(dist[sample_range, neigh_ind])]
+    return dist[sample_range, neigh_ind], neigh_ind
+
+
+def test_same_results_as_cosine_distances(features):
+    features, _, _ = features
+    model = CosineNeighbors(features.matrix)
+
+    # The same distances to the bit, so the same order, ties included
+    distances, indices = model.kneighbors(features.matrix[:50], n_neighbors=30)
+    expected_distances, expected_indices = cosine_distances_kneighbors(features.matrix, features.matrix[:50], 30)
+    np.testing.assert_array_equal(distances, expected_distances)
+    np.testing.assert_array_equal(indices, expected_indices)
+
+
+@pytest.mark.parametrize("n_threads", [1, 4])
+def test_batched_queries(features, n_threads):
+    features, _, _ = features
+    model = CosineNeighbors(features.matrix, n_threads=n_threads)
+    single = [model.kneighbors(features.matrix[movie_index], n_neighbors=8) for movie_index in range(100)]
+
+    # 100 rows: split between threads when there are several
+    distances, indices = model.kneighbors(features.matrix[:100], n_neighbors=8)
+    np.testing.assert_array_equal(distances, np.vstack([dist for dist, _ in single]))
+    np.testing.assert_array_equal(indices, np.vstack([ind for _, ind in single]))
+
+
+def test_recommendation_knn_order(features):
+    features, all_ratings, _ = features
+    model = CosineNeighbors(features.matrix)
+    reference = NearestNeighbors(metric="cosine", algorithm="brute").fit(float_values(features.matrix))
+
+    movie = features.titles[5]
+    _, table = recommendation_knn(features, model, movie, 15, all_ratings)
+    _, expected = recommendation_knn(features, reference, movie, 15, all_ratings)
+    assert list(table["title"]) == list(expected["title"])
+
+
+def test_vectors_saved_with_artifact(features, tmp_path):
+    features, all_ratings, total_movie_array = features
+    dir_path = str(tmp_path / "knn_model_small")
+    write_artifact(dir_path, "knn", "small", features, all_ratings, total_movie_array, 10)
+    assert os.path.exists(os.path.join(dir_path, "cosine_data.npy"))
+
+    artifact = read_artifact(dir_path)
+    vectors = artifact.model.vectors
+    assert vectors.shape == (features.shape[1], features.shape[0])
+    assert not vectors.data.flags.owndata and not vectors.data.flags.writeable
+    assert data_nbytes(artifact.model) == vectors.data.nbytes + vectors.indices.nbytes + vectors.indptr.nbytes
+
+    expected = CosineNeighbors(features.matrix)
+    np.testing.assert_array_equal(vectors.toarray(), expected.vectors.toarray())
+
+    # Correlation artifacts don't need the vectors
+    corr_path = str(tmp_path / "corr_model_small")
+    write_artifact(corr_path, "corr", "small", features, all_ratings, total_movie_array, 10)
+    assert not os.path.exists(os.path.join(corr_path, "cosine_data.npy"))
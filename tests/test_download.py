@@ -0,0 +1,187 @@
+"""
+This script contains unit tests for the download functions of the get_databases module. The download_and_extract_zip
+function streams a dataset archive to a spill file in the dataset folder, resumes an interrupted download with an HTTP
+Range request, and extracts only the CSV files used by the application, checking their CRC. The fetch_db_files function
+skips the network within a freshness window and otherwise makes a single conditional GET request.
+
+The script defines a fixture that serves a sample MovieLens-like archive from a local HTTP server supporting Range and
+conditional requests, which can drop the connection in the middle of the first response. The tests assert that only
+the selected files are extracted, that an interrupted download is resumed from where it stopped, that a corrupted
+archive is rejected and deleted, that the dataset is downloaded again only when its ETag changed, and that the local
+files are kept when the source page can't be reached or serves a corrupted archive.
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import io
+import os
+import logging
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import movie_recommend.constants as c
+from movie_recommend.utils.get_databases import SPILL_SUFFIX, download_and_extract_zip, fetch_db_files
+
+MOVIES = b"movieId,title,genres\n1,Toy Story (1995),Animation\n"
+RATINGS = b"userId,movieId,rating,timestamp\n" + b"".join(b"%d,%d,4.0,0\n" % (i, i % 7) for i in range(50000))
+
+
+def make_archive() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr("ml-latest-small/movies.csv", MOVIES)
+        zip_file.writestr("ml-latest-small/ratings.csv", RATINGS, zipfile.ZIP_STORED)
+        zip_file.writestr("ml-latest-small/tags.csv", b"userId,movieId,tag,timestamp\n")
+    return buffer.getvalue()
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """Serves 'server.body' with the ETag 'server.etag' and Range support; drops the connection after 'server.cut' bytes
+    of the next response."""
+
+    def do_GET(self):
+        body, start = self.server.body, 0
+        self.server.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == self.server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range", self.server.etag) == self.server.etag:
+            start = int(range_header.split("=")[1].split("-")[0])
+            if start >= len(body):
+                self.send_response(416)
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header("ETag", self.server.etag)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+
+        cut, self.server.cut = self.server.cut, None
+        self.wfile.write(body[start:start + cut] if cut else body[start:])
+        if cut:
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    """Local HTTP server with a sample archive."""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ArchiveHandler)
+    httpd.body, httpd.etag, httpd.cut, httpd.requests = make_archive(), '"v1"', None, []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/ml-latest-small.zip"
+    yield httpd
+    httpd.shutdown()
+
+
+def test_download_extracts_selected_members(tmp_path, server):
+    download_and_extract_zip(server.url, str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == ["movies.csv", "ratings.csv"]
+    assert (tmp_path / "ratings.csv").read_bytes() == RATINGS
+    assert (tmp_path / "movies.csv").read_bytes() == MOVIES
+
+
+def test_download_resumes_with_range(tmp_path, server):
+    server.cut = len(server.body) // 2
+    download_and_extract_zip(server.url, str(tmp_path), members=["ratings.csv"])
+
+    # The dropped connection was resumed from the chunks already received
+    assert len(server.requests) == 2
+    offset = int(server.requests[1]["Range"].split("=")[1].rstrip("-"))
+    assert 0 < offset <= len(server.body) // 2
+    assert server.requests[1]["If-Range"] == '"v1"'
+    assert sorted(os.listdir(tmp_path)) == ["ratings.csv"]
+    assert (tmp_path / "ratings.csv").read_bytes() == RATINGS
+
+
+def test_partial_download_of_another_version(tmp_path, server):
+    # A partial file of an older version of the archive is downloaded again
+    spill_path = tmp_path / ("ml-latest-small.zip" + SPILL_SUFFIX)
+    spill_path.write_bytes(b"old partial file")
+    (tmp_path / ("ml-latest-small.zip" + SPILL_SUFFIX + ".etag")).write_text('"v0"')
+    download_and_extract_zip(server.url, str(tmp_path))
+    assert (tmp_path / "ratings.csv").read_bytes() == RATINGS
+    assert sorted(os.listdir(tmp_path)) == ["movies.csv", "ratings.csv"]
+
+
+def test_corrupted_archive_is_deleted(tmp_path, server):
+    body = bytearray(server.body)
+    position = body.index(b"ratings.csv") + 200
+    body[position:position + 8] = b"\x00" * 8
+    server.body = bytes(body)
+
+    with pytest.raises(zipfile.BadZipFile):
+        download_and_extract_zip(server.url, str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.fixture
+def dataset_dir(tmp_path, server, monkeypatch):
+    """Dataset folder of get_db("small"), downloaded from the local server."""
+    monkeypatch.setattr(c, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(c, "DATA_SMALL_DIR", str(tmp_path / "ml-latest-small"))
+    monkeypatch.setattr(c, "ZIP_LINK_SMALL", server.url)
+    return tmp_path / "ml-latest-small"
+
+
+def test_fetch_db_files_conditional_get(dataset_dir, server):
+    movies_path, ratings_path = fetch_db_files("small", freshness_hours=0)
+    assert open(ratings_path, "rb").read() == RATINGS
+    assert (dataset_dir / c.LAST_ETAG_FILE).read_text() == '"v1"'
+
+    # Not modified: a single request, nothing downloaded
+    (dataset_dir / "ratings.csv").write_bytes(b"local")
+    fetch_db_files("small", freshness_hours=0)
+    assert len(server.requests) == 2 and server.requests[1]["If-None-Match"] == '"v1"'
+    assert (dataset_dir / "ratings.csv").read_bytes() == b"local"
+
+    # Modified: downloaded again with the same request
+    server.etag = '"v2"'
+    fetch_db_files("small", freshness_hours=0)
+    assert len(server.requests) == 3
+    assert (dataset_dir / "ratings.csv").read_bytes() == RATINGS
+    assert (dataset_dir / c.LAST_ETAG_FILE).read_text() == '"v2"'
+
+
+def test_fetch_db_files_without_network(dataset_dir, server, monkeypatch):
+    with pytest.raises(FileNotFoundError):
+        fetch_db_files("small", offline=True)
+    fetch_db_files("small")
+
+    # Within the freshness window or offline, no request is made
+    server.etag = '"v2"'
+    fetch_db_files("small")
+    fetch_db_files("small", freshness_hours=0, offline=True)
+    assert len(server.requests) == 1
+
+    # If the source page can't be reached, the local files are used
+    monkeypatch.setattr(c, "ZIP_LINK_SMALL", "http://127.0.0.1:9/ml-latest-small.zip")
+    movies_path, _ = fetch_db_files("small", freshness_hours=0)
+    assert os.path.exists(movies_path)
+
+
+def test_fetch_db_files_corrupted_update(dataset_dir, server, caplog):
+    fetch_db_files("small")
+
+    # A corrupted new version of the archive keeps the local files
+    server.etag = '"v2"'
+    body = bytearray(server.body)
+    position = body.index(b"ratings.csv") + 200
+    body[position:position + 8] = b"\x00" * 8
+    server.body = bytes(body)
+    with caplog.at_level(logging.WARNING):
+        fetch_db_files("small", freshness_hours=0)
+    assert (dataset_dir / "ratings.csv").read_bytes() == RATINGS
+    assert "BadZipFile" in caplog.text
+    assert (dataset_dir / c.LAST_ETAG_FILE).read_text() == '"v1"'
@@ -0,0 +1,81 @@
+"""
+This script contains unit tests for the get_recommendations_many function in the get_recommendations module. The
+get_recommendations_many function returns recommendations for a list of movies, computing the recommendations for all
+known movies in one batch: a single kneighbors call on the stacked movie rows for the k-Nearest Neighbors model and
+sparse matrix products over all requested movies for the Pearson correlation model.
+
+The script defines a fixture that creates a sample sparse rating matrix, a ratings table and a list of all titles,
+including a title without enough ratings for the models. The tests assert that the batch correlations match the ones
+of pearson_correlations, and that every batch result matches the result of get_recommendations for the same title,
+with a status telling known titles from unknown ones.
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from scipy.sparse import random as sparse_random
+
+from movie_recommend.utils.get_recommendations import (
+    STATUS_NOT_ENOUGH_RATINGS,
+    STATUS_NOT_FOUND,
+    STATUS_OK,
+    get_recommendations,
+    get_recommendations_many
+)
+from movie_recommend.utils.rating_matrix import RatingMatrix
+from movie_recommend.utils.recommendation_algorithms import (
+    CosineNeighbors,
+    pearson_correlations,
+    pearson_correlations_many
+)
+
+
+@pytest.fixture
+def sample_data():
+    matrix = sparse_random(40, 300, density=0.3, format="csr", random_state=41)
+    matrix.data = np.ceil(matrix.data * 10) / 2
+    titles = np.array([f"Movie {i} (2000)" for i in range(40)], dtype=object)
+    features = RatingMatrix(matrix, titles, np.arange(300).astype(str))
+
+    total_movie_array = np.append(titles, "Rare Movie (1990)")
+    total_ratings = pd.DataFrame({
+        "title": total_movie_array,
+        "mean_rating": np.append(np.asarray(matrix.sum(axis=1)).ravel() / matrix.getnnz(axis=1), 3.0),
+        "totalRatingCount": np.append(matrix.getnnz(axis=1), 1),
+    })
+    return features, total_ratings, total_movie_array
+
+
+def test_pearson_correlations_many(sample_data):
+    features, _, _ = sample_data
+    movie_indices = [0, 17, 39, 17]
+
+    correlations, counts = pearson_correlations_many(features.matrix, movie_indices, 20)
+
+    assert correlations.shape == (40, 4)
+    for column, movie_index in enumerate(movie_indices):
+        expected_correlations, expected_counts = pearson_correlations(features.matrix, movie_index, 20)
+        np.testing.assert_array_equal(correlations[:, column], expected_correlations)
+        np.testing.assert_array_equal(counts[:, column], expected_counts)
+
+
+@pytest.mark.parametrize("model_type", ["knn", "corr"])
+def test_get_recommendations_many(sample_data, model_type):
+    features, total_ratings, total_movie_array = sample_data
+    model = CosineNeighbors(features.matrix) if model_type == "knn" else None
+    movies = ["Movie 0 (2000)", "Movie 17 (2000)", "Unknown Movie", "Rare Movie (1990)", "Movie 39 (2000)"]
+
+    results = get_recommendations_many(features, movies, 5, model_type, model, total_ratings, total_movie_array)
+
+    assert [status for status, _, _ in results] == [
+        STATUS_OK, STATUS_OK, STATUS_NOT_FOUND, STATUS_NOT_ENOUGH_RATINGS, STATUS_OK
+    ]
+    for movie, (_, first_line, final_table) in zip(movies, results):
+        expected_line, expected_table = get_recommendations(
+            features, movie, 5, model_type, model, total_ratings, total_movie_array
+        )
+        assert first_line == expected_line
+        assert_frame_equal(final_table, expected_table)
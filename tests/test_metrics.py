@@ -0,0 +1,94 @@
+"""
+This script contains unit tests for the metrics module and the instrumentation of recommendation requests. Metrics
+are kept per set of label values and rendered in the Prometheus text format served by the app's /metrics route.
+
+The script uses the synthetic_dataset fixture of conftest.py to produce a KNN artifact. The tests assert that
+histograms, counters and gauges are rendered in the text format with cumulative buckets and escaped labels, and that
+MovieRecommend records the latency and outcome of each stage, the outcome of each request and the memory size of the
+artifact, and that a stage that raises is recorded with the 'error' outcome.
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import re
+
+import pytest
+
+from movie_recommend.movie_recommendations import MovieRecommend
+from movie_recommend.utils.artifact_pipeline import produce_artifacts
+from movie_recommend.utils.metrics import MetricsRegistry, metrics
+from movie_recommend.utils.model_registry import ModelRegistry
+
+
+def sample_value(text: str, name: str, **labels) -> float:
+    """Value of the sample 'name' with the given labels in a rendered text (0 if there is none)."""
+    for line in text.splitlines():
+        match = re.fullmatch(r"(\w+)(?:\{(.*)\})? (\S+)", line)
+        if match and match.group(1) == name:
+            sample_labels = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(2) or ""))
+            if all(sample_labels.get(key) == value for key, value in labels.items()):
+                return float(match.group(3))
+    return 0
+
+
+def test_render_text_format():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    counter = registry.counter("requests", "Requests.", ("route",))
+    gauge = registry.gauge("size_bytes", "Size.")
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, route="/a")
+    counter.inc(route='say "hi"\n')
+    gauge.set(1024)
+
+    text = registry.render()
+    assert "# TYPE latency_seconds histogram" in text and "# HELP requests Requests." in text
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 2' in text
+    assert 'latency_seconds_bucket{route="/a",le="1"} 3' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{route="/a"} 4' in text
+    assert sample_value(text, "latency_seconds_sum", route="/a") == pytest.approx(3.65)
+    assert 'requests_total{route="say \\"hi\\"\\n"} 1' in text
+    assert "size_bytes 1024" in text
+
+    with pytest.raises(ValueError):
+        histogram.observe(1.0, model="knn")
+    with pytest.raises(ValueError):
+        registry.gauge("size_bytes", "Size.")
+
+
+def test_movie_recommend_metrics(tmp_path, synthetic_dataset):
+    produce_artifacts({"small": 20}, ["knn"], str(tmp_path), n_neighbors=5, memory_limit_mb=64,
+                      fetch_files=lambda db_size: synthetic_dataset)
+    model_registry = ModelRegistry(str(tmp_path))
+    movie_recommend = MovieRecommend("knn", "small", 10, model_registry=model_registry, cache=None)
+    labels = dict(model_type="knn", db_size="small")
+
+    before = metrics.render()
+    artifact = model_registry.get("knn", "small")
+    movie_recommend.launch(artifact.features_df.titles[0])
+    movie_recommend.launch("Unknown title that is not in the dataset")
+    text = metrics.render()
+
+    def increase(name: str, **sample_labels) -> float:
+        return sample_value(text, name, **sample_labels) - sample_value(before, name, **sample_labels)
+
+    assert increase("movie_recommend_launch_seconds_count", outcome="hit", **labels) == 1
+    assert increase("movie_recommend_launch_seconds_count", outcome="renamed", **labels) == 1
+    assert increase("movie_recommend_recommendations_total", outcome="hit", **labels) == 1
+    for stage, outcome, count in [("resolve_title", "ok", 1), ("resolve_title", "not_found", 1), ("similarity", "ok", 1),
+                                  ("rename_movie", "not_found", 1), ("format_table", "ok", 2)]:
+        assert increase("movie_recommend_stage_seconds_count", stage=stage, outcome=outcome, **labels) == count
+    assert increase("movie_recommend_stage_seconds_count", stage="load_artifact", outcome="ok", **labels) == 1
+    assert sample_value(text, "movie_recommend_artifact_bytes", **labels) >= artifact.features_df.matrix.data.nbytes
+
+
+def test_stage_outcome_error(tmp_path):
+    before = metrics.render()
+    with pytest.raises(FileNotFoundError):
+        ModelRegistry(str(tmp_path)).get("corr", "small")
+    text = metrics.render()
+
+    labels = dict(stage="load_artifact", model_type="corr", db_size="small", outcome="error")
+    assert (sample_value(text, "movie_recommend_stage_seconds_count", **labels)
+            - sample_value(before, "movie_recommend_stage_seconds_count", **labels)) == 1
@@ -0,0 +1,65 @@
+"""
+This script contains unit tests for the ModelRegistry class in the model_registry module. The registry keeps model
+artifacts in memory, keyed by model type and dataset size, so that each pickle file is loaded only once per process.
+
+The script defines a fixture that writes small sample pickle files to a temporary folder. The tests assert that the
+registry loads every artifact only once, returns the same shared objects to all callers, warms up all requested models
+and reports its readiness correctly.
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import pickle
+
+import pandas as pd
+import pytest
+
+import movie_recommend.utils.model_registry as model_registry
+from movie_recommend.utils.model_registry import ModelRegistry
+
+
+@pytest.fixture
+def pkl_dir(tmp_path):
+    features_df = pd.DataFrame({"1": [4.0, 0.0], "2": [3.5, 5.0]}, index=["Toy Story", "Heat"])
+    all_ratings = pd.DataFrame({"title": ["Toy Story", "Heat"], "mean_rating": [3.75, 5.0],
+                                "totalRatingCount": [2, 1]})
+    total_movie_array = features_df.index.values
+    for model_type in ("knn", "corr"):
+        with open(tmp_path / f"{model_type}_model_small.pkl", "wb") as f:
+            pickle.dump((features_df, None, all_ratings, total_movie_array), f)
+    return str(tmp_path)
+
+
+def test_registry_loads_once(pkl_dir, monkeypatch):
+    calls = []
+    load_artifact = model_registry.load_artifact
+
+    def counting_load(*args, **kwargs):
+        calls.append(args)
+        return load_artifact(*args, **kwargs)
+
+    monkeypatch.setattr(model_registry, "load_artifact", counting_load)
+    registry = ModelRegistry(pkl_dir)
+
+    first = registry.get("knn", "small")
+    second = registry.get("knn", "small")
+
+    assert first is second
+    assert first.features_df is second.features_df
+    assert len(calls) == 1
+    assert list(first.features_df.titles) == ["Toy Story", "Heat"]
+
+
+def test_registry_warm_up_and_readiness(pkl_dir):
+    registry = ModelRegistry(pkl_dir)
+    assert not registry.is_ready(db_sizes=("small",))
+
+    assert registry.warm_up(db_sizes=("small",))
+    assert registry.is_ready(db_sizes=("small",))
+
+    # The "full" dataset is missing in the folder
+    assert not registry.warm_up(db_sizes=("full",))
+    assert not registry.is_ready(db_sizes=("small", "full"))
+
+    registry.clear()
+    assert not registry.is_ready(db_sizes=("small",))
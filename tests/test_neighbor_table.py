@@ -0,0 +1,109 @@
+"""
+This script contains unit tests for the neighbor_table module. The knn_neighbor_table and corr_neighbor_table functions
+precompute the top-K neighbors of every movie for the k-Nearest Neighbors and Pearson correlation models, and the
+NeighborTable class answers requests for at most K recommendations with an array slice.
+
+The script defines a fixture that creates a sample sparse rating matrix and a ratings table. The tests assert that the
+recommendations served from the neighbor tables match the ones computed on the fly by recommendation_knn and
+recommendation_corr, with the same scores and the same rendered strings, and that the tables refuse requests they can't
+answer, so that the caller falls back to the live computation.
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from scipy.sparse import random as sparse_random
+
+from movie_recommend.model_types import ModelTypeCorr, ModelTypeKnn
+from movie_recommend.utils.get_recommendations import get_recommendations
+from movie_recommend.utils.neighbor_table import corr_neighbor_table, knn_neighbor_table
+from movie_recommend.utils.rating_matrix import RatingMatrix
+from movie_recommend.utils.recommendation_algorithms import (
+    CosineNeighbors,
+    recommendation_corr,
+    recommendation_knn
+)
+
+
+@pytest.fixture
+def sample_data():
+    matrix = sparse_random(40, 300, density=0.3, format="csr", random_state=41)
+    matrix.data = np.ceil(matrix.data * 10) / 2
+    titles = np.array([f"Movie {i}" for i in range(40)], dtype=object)
+    users = np.arange(300).astype(str)
+    features = RatingMatrix(matrix, titles, users)
+
+    total_ratings = pd.DataFrame({
+        "title": titles,
+        "mean_rating": np.asarray(matrix.sum(axis=1)).ravel() / matrix.getnnz(axis=1),
+        "totalRatingCount": matrix.getnnz(axis=1),
+    })
+    return features, total_ratings
+
+
+def test_knn_neighbor_table(sample_data):
+    features, total_ratings = sample_data
+    model = CosineNeighbors(features.matrix)
+    neighbors = knn_neighbor_table(features, k=10, batch_size=16)
+    assert neighbors.indices.dtype == np.int32 and neighbors.scores.dtype == np.float32
+
+    for movie in ("Movie 0", "Movie 17", "Movie 39"):
+        _, expected = recommendation_knn(features, model, movie, 10, total_ratings)
+        message, table = ModelTypeKnn().get_recommendations(features, model, movie, 10, total_ratings, neighbors)
+        assert message == f'Recommendations for "{movie}":'
+        assert_frame_equal(table, expected, check_dtype=False, rtol=1e-6)
+
+    # More recommendations than precomputed neighbors: not answered by the table
+    assert neighbors.lookup(features.get_loc("Movie 0"), 11) is None
+
+
+def test_corr_neighbor_table(sample_data):
+    features, total_ratings = sample_data
+    neighbors = corr_neighbor_table(features, k=10, min_periods=20)
+
+    for movie in ("Movie 0", "Movie 17", "Movie 39"):
+        _, expected = recommendation_corr(features, movie, 5, total_ratings)
+        message, table = ModelTypeCorr().get_recommendations(features, None, movie, 5, total_ratings, neighbors)
+        assert message == f'Recommendations for "{movie}":'
+        assert_frame_equal(table, expected, check_dtype=False, rtol=1e-6)
+
+    # Rows don't depend on the batches they are computed in
+    batched = corr_neighbor_table(features, k=10, min_periods=20, batch_size=7)
+    np.testing.assert_array_equal(batched.indices, neighbors.indices)
+    np.testing.assert_array_equal(batched.scores, neighbors.scores)
+
+    # Movies without any correlation above 'min_periods' common ratings are left to recommendation_corr()
+    strict = corr_neighbor_table(features, k=10, min_periods=1000)
+    assert strict.lookup(0, 5) is None
+    assert (strict.indices == -1).all()
+
+
+@pytest.mark.parametrize("model_type", ["knn", "ivf", "corr"])
+def test_lookup_same_as_live(sample_data, model_type):
+    features, total_ratings = sample_data
+    total_movie_array = features.titles
+    if model_type == "corr":
+        model = None
+        neighbors = corr_neighbor_table(features, k=10, min_periods=20)
+    else:
+        model = ModelTypeKnn.build_model(features.matrix, "brute" if model_type == "knn" else "ivf")
+        neighbors = knn_neighbor_table(features, k=10, model=model)
+        model_type = "knn"
+
+    # Requests for at most K recommendations are served by the table: same table, same rendered strings
+    for movie in ("Movie 0", "Movie 17", "Movie 39"):
+        for n_recommend in (5, 10):
+            expected_line, expected = get_recommendations(
+                features, movie, n_recommend, model_type, model, total_ratings, total_movie_array
+            )
+            first_line, table = get_recommendations(
+                features, movie, n_recommend, model_type, model, total_ratings, total_movie_array, neighbors
+            )
+            assert first_line == expected_line
+            assert_frame_equal(table, expected, check_exact=True)
+
+    # The scores keep the dtype of the live computation
+    assert neighbors.scores.dtype == (np.float64 if model is None else np.float32)
@@ -0,0 +1,50 @@
+"""
+This script contains a unit test function to test the pearson_correlations function. The pearson_correlations function
+computes, in a few sparse matrix operations, the pairwise-complete Pearson correlations between one movie and all
+movies of a sparse "Title vs Users" rating matrix, together with the numbers of common ratings.
+
+The script defines a fixture that creates a sample "Users vs Title" pivot table with NaNs, including a movie with
+constant ratings and a movie with few common ratings. The test function computes the expected correlations with
+pandas' Series.corr() column by column (the reference implementation) and asserts that both results match.
+
+To run the test, execute the test_pearson_correlations function.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from movie_recommend.utils.rating_matrix import RatingMatrix
+from movie_recommend.utils.recommendation_algorithms import pearson_correlations
+
+
+@pytest.fixture
+def sample_pivot():
+    np.random.seed(41)
+    num_rows, num_cols = 300, 12
+    values = np.random.randint(1, 11, size=(num_rows, num_cols)) / 2
+    values[np.random.rand(num_rows, num_cols) < 0.4] = np.nan
+
+    # A movie with constant ratings and a movie with only a few ratings
+    values[:, 5] = np.where(np.isnan(values[:, 5]), np.nan, 4.0)
+    values[20:, 7] = np.nan
+
+    return pd.DataFrame(values, columns=[f"Movie {i}" for i in range(num_cols)])
+
+
+def test_pearson_correlations(sample_pivot):
+    features = RatingMatrix.from_frame(sample_pivot, titles_on_index=False)
+    min_periods = 20
+
+    for movie in sample_pivot.columns:
+        features_df_nonan = sample_pivot.dropna(subset=[movie])
+        expected = np.array([
+            features_df_nonan[movie].corr(features_df_nonan[col], min_periods=min_periods)
+            for col in sample_pivot.columns
+        ])
+        expected_counts = sample_pivot.notna().mul(sample_pivot[movie].notna(), axis=0).sum().to_numpy()
+
+        correlations, counts = pearson_correlations(features.matrix, features.get_loc(movie), min_periods)
+
+        np.testing.assert_allclose(correlations, expected, rtol=1e-12, atol=1e-12)
+        np.testing.assert_array_equal(counts, expected_counts)
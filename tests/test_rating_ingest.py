@@ -0,0 +1,93 @@
+"""
+This script contains unit tests for the rating_ingest module. The ingest_ratings function reads the ratings CSV file in
+chunks under a memory limit and builds the rating matrices and the mean rating table without loading the whole file.
+
+The script defines a fixture that writes sample movies and ratings CSV files, with two movies sharing a title, a movie
+without ratings and ratings of an unknown movie. The tests assert that the streamed ingestion, with chunks of a few
+rows, gives the same rating matrices and mean ratings as merged_table(), mean_rating_table() and
+sparse_pivot_ratings(), that the artifacts built with streaming ingestion are the same, and that a memory limit below the size of the rating matrix raises a MemoryError.
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import movie_recommend.utils.rating_ingest as rating_ingest
+from movie_recommend.utils.artifact_pipeline import produce_artifacts
+from movie_recommend.utils.artifact_store import read_artifact
+from movie_recommend.utils.get_databases import read_tables
+from movie_recommend.utils.rating_ingest import ingest_ratings
+from movie_recommend.utils.table_formatting import (
+    filter_movies_by_rating_count,
+    mean_rating_table,
+    merged_table,
+    sparse_pivot_ratings
+)
+
+RATING_THRESHOLD = 10
+
+
+@pytest.fixture
+def csv_files(tmp_path):
+    """Paths of sample movies and ratings CSV files."""
+    rng = np.random.default_rng(3)
+    titles = [f"Movie {i} (2000)" for i in range(30)]
+    # Movies 30 and 31 share a title, movie 32 has no ratings
+    movies_df = pd.DataFrame({"movieId": np.arange(33), "title": titles + ["Twin (1990)", "Twin (1990)", "Unrated"]})
+    rating_df = pd.DataFrame({
+        "userId": rng.integers(1, 50, size=600),
+        "movieId": np.append(np.minimum(rng.geometric(0.08, size=598), 32) - 1, [99, 99]),
+        "rating": np.ceil(rng.random(600) * 10) / 2,
+        "timestamp": 0,
+    }).drop_duplicates(["userId", "movieId"])
+    movies_path, ratings_path = tmp_path / "movies.csv", tmp_path / "ratings.csv"
+    movies_df.to_csv(movies_path, index=False)
+    rating_df.to_csv(ratings_path, index=False)
+    return str(movies_path), str(ratings_path)
+
+
+def test_ingest_ratings_matches_merged_table(csv_files, monkeypatch):
+    monkeypatch.setattr(rating_ingest, "BYTES_PER_CSV_ROW", 10 ** 6)
+    monkeypatch.setattr(rating_ingest, "MIN_CHUNK_ROWS", 7)
+    movies_df, rating_df = read_tables(*csv_files, compact=True)
+    features, pending, all_ratings = ingest_ratings(movies_df, csv_files[1], RATING_THRESHOLD, memory_limit_mb=1)
+
+    movie_rating_df = merged_table(movies_df, rating_df)
+    expected_ratings = mean_rating_table(movie_rating_df)
+    expected_features = sparse_pivot_ratings(filter_movies_by_rating_count(movie_rating_df, RATING_THRESHOLD))
+    expected_pending = sparse_pivot_ratings(
+        movie_rating_df[movie_rating_df["totalRatingCount"].values <= RATING_THRESHOLD]
+    )
+
+    for matrix, expected in [(features, expected_features), (pending, expected_pending)]:
+        assert list(matrix.titles) == list(expected.titles)
+        assert list(matrix.users) == list(expected.users)
+        np.testing.assert_array_equal(matrix.matrix.toarray(), expected.matrix.toarray())
+    assert "Twin (1990)" in features
+
+    actual = all_ratings.set_index("title").sort_index()
+    expected = expected_ratings.set_index("title").sort_index()
+    assert list(actual.index) == list(expected.index)
+    np.testing.assert_array_equal(actual["totalRatingCount"], expected["totalRatingCount"])
+    np.testing.assert_allclose(actual["mean_rating"], expected["mean_rating"], rtol=1e-6)
+
+
+def test_produce_artifacts_streaming(tmp_path, csv_files):
+    produce_artifacts({"small": RATING_THRESHOLD}, ["corr"], str(tmp_path / "loaded"), n_neighbors=5,
+                      load_db=lambda db_size, compact: read_tables(*csv_files, compact))
+    produce_artifacts({"small": RATING_THRESHOLD}, ["corr"], str(tmp_path / "streamed"), n_neighbors=5,
+                      memory_limit_mb=64, fetch_files=lambda db_size: csv_files)
+
+    loaded = read_artifact(str(tmp_path / "loaded" / "corr_model_small"))
+    streamed = read_artifact(str(tmp_path / "streamed" / "corr_model_small"))
+    assert list(streamed.features_df.titles) == list(loaded.features_df.titles)
+    np.testing.assert_array_equal(streamed.features_df.matrix.toarray(), loaded.features_df.matrix.toarray())
+    np.testing.assert_array_equal(streamed.neighbors.indices, loaded.neighbors.indices)
+
+
+def test_ingest_ratings_memory_limit(csv_files):
+    movies_df, _ = read_tables(*csv_files, compact=True)
+    with pytest.raises(MemoryError):
+        ingest_ratings(movies_df, csv_files[1], RATING_THRESHOLD, memory_limit_mb=0.001)
@@ -0,0 +1,122 @@
+"""
+This script contains unit tests for the compact storage of ratings in the rating_matrix module. Rating matrices store
+ratings as 'uint8' numbers of half stars (rating x 2), and the KNN and Pearson correlation engines compute on these
+numbers directly ('float32' cosine distances, exact float64 sums for the correlations).
+
+The script uses the synthetic_dataset fixture of conftest.py. The tests check the equivalence with the former float64
+rating matrix: same ratings, same Pearson correlations, and the same nearest neighbors with cosine distances within the
+'float32' precision. They also assert that averages between half stars are stored rounded with their exact values
+kept apart, and that artifacts store one byte per rating, while artifacts of the former format are still opened.
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import os
+import json
+
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from sklearn.neighbors import NearestNeighbors
+
+import movie_recommend.constants as c
+from movie_recommend.utils.artifact_pipeline import produce_artifacts
+from movie_recommend.utils.artifact_store import MANIFEST_FILE, load_rating_matrix, read_artifact, save_rating_matrix
+from movie_recommend.utils.get_databases import read_tables
+from movie_recommend.utils.rating_matrix import RatingMatrix, encode_ratings
+from movie_recommend.utils.recommendation_algorithms import CosineNeighbors, pearson_correlations
+from movie_recommend.utils.table_formatting import merged_table, sparse_pivot_ratings
+
+
+@pytest.fixture(scope="module")
+def rating_matrices(synthetic_dataset):
+    """Rating matrix of the synthetic dataset, and the float64 matrix of its ratings as stored before."""
+    movies_df, rating_df = read_tables(*synthetic_dataset, compact=True)
+    rating_movie_per_user = merged_table(movies_df, rating_df)
+    features = sparse_pivot_ratings(rating_movie_per_user)
+
+    df = rating_movie_per_user.dropna(subset=[c.RATING])
+    rows = features.titles.searchsorted(df[c.TITLE].to_numpy(dtype=object))
+    columns = features.users.searchsorted(df[c.USER_ID].to_numpy(dtype=object))
+    reference = csr_matrix((df[c.RATING].to_numpy(dtype=np.float64), (rows, columns)), shape=features.shape)
+    return features, reference
+
+
+def test_encode_ratings():
+    ratings = np.array([0.5, 1.0, 3.5, 5.0, 3.75, 10 / 3])
+    np.testing.assert_array_equal(encode_ratings(ratings), [1, 2, 7, 10, 8, 7])
+    assert encode_ratings(ratings).dtype == np.uint8
+
+    features = RatingMatrix(csr_matrix(np.array([[0.0, 4.5], [2.0, 0.0]])), np.array(["a", "b"]), np.array(["1", "2"]))
+    assert features.matrix.dtype == np.uint8
+    np.testing.assert_array_equal(features.ratings().toarray(), [[0.0, 4.5], [2.0, 0.0]])
+
+
+def test_exact_averages(tmp_path):
+    values = np.array([[3.75, 4.5, 0.0, 2.0], [10 / 3, 1.0, 3.0, 4.0], [5.0, 0.5, 4.25, 3.5]])
+    features = RatingMatrix(csr_matrix(values), np.array(["a", "b", "c"]), np.array(["1", "2", "3", "4"]))
+    np.testing.assert_array_equal(features.matrix.toarray(), np.rint(values * 2))
+    assert features.averages.nnz == 3
+
+    # Averages are exact wherever ratings are computed on, also after saving and taking rows
+    save_rating_matrix(str(tmp_path), features)
+    loaded = load_rating_matrix(str(tmp_path))
+    for matrix in (features, loaded):
+        np.testing.assert_array_equal(matrix.ratings(np.float64).toarray(), values)
+        np.testing.assert_array_equal(matrix.values(dtype=np.float64).toarray(), values * 2)
+        np.testing.assert_array_equal(matrix.values([2, 1], np.float64).toarray(), values[[2, 1]] * 2)
+        np.testing.assert_array_equal(matrix.take_rows([1]).ratings(np.float64).toarray(), values[[1]])
+        correlations, _ = pearson_correlations(matrix.matrix, 0, 2, matrix.averages)
+        np.testing.assert_allclose(correlations, pearson_correlations(csr_matrix(values), 0, 2)[0])
+
+
+def test_same_ratings(rating_matrices):
+    features, reference = rating_matrices
+    assert features.matrix.dtype == np.uint8
+    assert features.matrix.data.nbytes * 8 == reference.data.nbytes
+    np.testing.assert_array_equal(features.ratings(np.float64).toarray(), reference.toarray())
+
+
+def test_same_correlations(rating_matrices):
+    features, reference = rating_matrices
+    for movie_index in range(0, len(features), 37):
+        correlations, counts = pearson_correlations(features.matrix, movie_index, 5)
+        expected_correlations, expected_counts = pearson_correlations(reference, movie_index, 5)
+        # Sums are exact in both units, and scaling by 2 doesn't change the rounding
+        np.testing.assert_array_equal(correlations, expected_correlations)
+        np.testing.assert_array_equal(counts, expected_counts)
+
+
+def test_same_neighbors(rating_matrices):
+    features, reference = rating_matrices
+    expected_model = NearestNeighbors(metric="cosine", algorithm="brute").fit(reference)
+    model = CosineNeighbors(features.matrix)
+
+    for movie_index in range(0, len(features), 37):
+        expected_distances, expected_indices = expected_model.kneighbors(reference[movie_index], n_neighbors=20)
+        distances, indices = model.kneighbors(features.matrix[movie_index], n_neighbors=20)
+        np.testing.assert_allclose(distances, expected_distances, atol=1e-6)
+        # Neighbors may only differ between movies at the same distance
+        all_distances = expected_model.kneighbors(reference[movie_index], n_neighbors=len(features))
+        exact = dict(zip(all_distances[1][0], all_distances[0][0]))
+        np.testing.assert_allclose([exact[i] for i in indices[0]], expected_distances[0], atol=1e-6)
+
+
+def test_artifact_size(synthetic_dataset, tmp_path):
+    produce_artifacts({"small": 10}, ["knn"], str(tmp_path), n_neighbors=8, memory_limit_mb=64,
+                      fetch_files=lambda db_size: synthetic_dataset)
+    dir_path = str(tmp_path / "knn_model_small")
+    artifact = read_artifact(dir_path)
+
+    data = np.load(os.path.join(dir_path, "data.npy"))
+    assert data.dtype == np.uint8 and len(data) == artifact.manifest["nnz"]
+    assert artifact.manifest["format_version"] == 2
+    assert artifact.features_df.matrix.dtype == np.uint8
+
+    # Artifacts of the first format, with float64 ratings, are still opened
+    np.save(os.path.join(dir_path, "data.npy"), data.astype(np.float64) / 2)
+    with open(os.path.join(dir_path, MANIFEST_FILE), "w") as f:
+        json.dump({**artifact.manifest, "format_version": 1}, f)
+    legacy = read_artifact(dir_path)
+    assert legacy.features_df.matrix.dtype == np.uint8
+    np.testing.assert_array_equal(legacy.features_df.matrix.data, data)
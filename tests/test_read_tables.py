@@ -0,0 +1,58 @@
+"""
+This script contains a unit test function to test the read_tables function in the get_databases module. The read_tables
+function reads the movies and rating CSV files of the MovieLens dataset, either with string IDs or, in the compact mode,
+with integer IDs, float32 ratings and categorical titles.
+
+The script defines a fixture that writes small sample CSV files in the MovieLens format to a temporary folder. The test
+function asserts that the compact mode returns the expected data types and that the tables computed from it by the
+merged_table and mean_rating_table functions contain the same values as with the default mode.
+
+To run the test, execute the test_read_tables_compact function.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from movie_recommend.utils.get_databases import read_tables
+from movie_recommend.utils.table_formatting import mean_rating_table, merged_table
+
+
+@pytest.fixture
+def csv_files(tmp_path):
+    movies_path = tmp_path / "movies.csv"
+    ratings_path = tmp_path / "ratings.csv"
+    pd.DataFrame(
+        {
+            "movieId": [1, 2, 3, 4],
+            "title": ["Toy Story (1995)", "Heat (1995)", "Emma (1996)", "Unrated (2001)"],
+            "genres": ["Animation", "Action", "Drama", "Drama"],
+        }
+    ).to_csv(movies_path, index=False)
+    pd.DataFrame(
+        {
+            "userId": [1, 1, 2, 3, 3, 10],
+            "movieId": [1, 2, 1, 2, 3, 1],
+            "rating": [4.0, 3.5, 5.0, 2.0, 0.5, 3.0],
+            "timestamp": [0, 0, 0, 0, 0, 0],
+        }
+    ).to_csv(ratings_path, index=False)
+    return str(movies_path), str(ratings_path)
+
+
+def test_read_tables_compact(csv_files):
+    movies_df, rating_df = read_tables(*csv_files)
+    movies_compact, rating_compact = read_tables(*csv_files, compact=True)
+
+    assert movies_compact["movieId"].dtype == np.int32
+    assert isinstance(movies_compact["title"].dtype, pd.CategoricalDtype)
+    assert rating_compact["userId"].dtype == "Int32"
+    assert rating_compact["movieId"].dtype == np.int32
+    assert rating_compact["rating"].dtype == np.float32
+
+    expected = mean_rating_table(merged_table(movies_df, rating_df))
+    all_ratings = mean_rating_table(merged_table(movies_compact, rating_compact))
+
+    assert list(all_ratings["title"].astype(str)) == list(expected["title"])
+    np.testing.assert_allclose(all_ratings["mean_rating"], expected["mean_rating"])
+    np.testing.assert_array_equal(all_ratings["totalRatingCount"], expected["totalRatingCount"])
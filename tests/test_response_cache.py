@@ -0,0 +1,163 @@
+"""
+This script contains unit tests for the ResponseCache class in the response_cache module. The cache keeps recent
+recommendation responses in an LRU order, with size and time-to-live limits, and serves requests for fewer
+recommendations from a cached larger response.
+
+The script defines a fixture that creates a fake clock and a sample response. The tests assert that the cache counts
+hits and misses, serves smaller requests from larger responses, evicts the least recently used entries, expires old
+entries and drops entries of another artifact version, and that MovieRecommend serves repeated requests from the cache.
+They also check that responses for unresolved titles are not cached, and that an artifact updated on disk is reloaded
+by the registry and drops the cached responses of the previous version.
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import movie_recommend.movie_recommendations as movie_recommendations
+from movie_recommend.movie_recommendations import MovieRecommend
+from movie_recommend.utils.artifact_pipeline import produce_artifacts
+from movie_recommend.utils.artifact_update import update_artifact
+from movie_recommend.utils.model_registry import ModelRegistry
+from movie_recommend.utils.response_cache import ResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def response():
+    table = pd.DataFrame({"title": [f"Movie {i}" for i in range(10)], "distance": [str(i / 10) for i in range(10)]})
+    table.index += 1
+    return "ok", 'Recommendations for "Star Wars":', table
+
+
+def test_cache_hits_and_smaller_requests(clock, response):
+    cache = ResponseCache(max_size=10, ttl_seconds=60, clock=clock)
+    key = ("knn", "small", "Star Wars")
+
+    assert cache.get(key, 10, "v1") is None
+    cache.put(key, 10, "v1", response)
+
+    status, first_line, table = cache.get(key, 4, "v1")
+    assert (status, first_line) == response[:2]
+    assert_frame_equal(table, response[2].head(4))
+    # More recommendations than cached: computed again
+    assert cache.get(key, 11, "v1") is None
+    # A smaller response doesn't replace a larger one
+    cache.put(key, 3, "v1", (response[0], response[1], response[2].head(3)))
+    assert len(cache.get(key, 10, "v1")[2]) == 10
+
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 2
+
+
+def test_cache_eviction_expiry_and_invalidation(clock, response):
+    cache = ResponseCache(max_size=2, ttl_seconds=60, clock=clock)
+    for title in ("A", "B"):
+        cache.put(("corr", "small", title), 10, "v1", response)
+    cache.get(("corr", "small", "A"), 10, "v1")
+    cache.put(("corr", "small", "C"), 10, "v1", response)
+
+    # "B" is the least recently used entry
+    assert cache.get(("corr", "small", "B"), 10, "v1") is None
+    assert cache.get(("corr", "small", "A"), 10, "v1") is not None
+    assert cache.stats()["evictions"] == 1
+
+    # Another artifact version
+    assert cache.get(("corr", "small", "A"), 10, "v2") is None
+    assert cache.get(("corr", "small", "A"), 10, "v1") is None
+
+    clock.now = 61.0
+    assert cache.get(("corr", "small", "C"), 10, "v1") is None
+    assert len(cache) == 0 and cache.stats()["invalidations"] == 2
+
+
+def test_movie_recommend_uses_cache(tmp_path, monkeypatch):
+    features_df = pd.DataFrame({"1": [4.0, 1.0, 2.0], "2": [3.5, 5.0, 2.0], "3": [1.0, 4.5, 5.0]},
+                               index=["Terminator, The (1984)", "Heat (1995)", "Toy Story (1995)"]).T
+    all_ratings = pd.DataFrame({"title": features_df.columns, "mean_rating": [2.8, 3.5, 3.0],
+                                "totalRatingCount": [3, 3, 3]})
+    with open(tmp_path / "corr_model_small.pkl", "wb") as f:
+        pickle.dump((features_df, None, all_ratings, features_df.columns.values), f)
+
+    calls = []
+    get_recommendations_many = movie_recommendations.get_recommendations_many
+
+    def counting_get_recommendations_many(*args, **kwargs):
+        calls.append(args[1])
+        return get_recommendations_many(*args, **kwargs)
+
+    monkeypatch.setattr(movie_recommendations, "get_recommendations_many", counting_get_recommendations_many)
+    registry = ModelRegistry(str(tmp_path))
+    cache = ResponseCache()
+
+    first = MovieRecommend("corr", "small", 2, registry, cache).launch("Terminator, The (1984)")
+    second = MovieRecommend("corr", "small", 1, registry, cache).launch("the terminator")
+
+    assert len(calls) == 1
+    assert second[0] == first[0]
+    assert_frame_equal(second[1], first[1].head(1))
+
+    # A reloaded artifact is another version
+    registry.clear()
+    MovieRecommend("corr", "small", 1, registry, cache).launch("Terminator, The (1984)")
+    assert len(calls) == 2
+
+
+def test_unresolved_titles_not_cached(tmp_path):
+    features_df = pd.DataFrame({"1": [4.0, 1.0], "2": [3.5, 5.0]}, index=["Terminator, The (1984)", "Heat (1995)"]).T
+    all_ratings = pd.DataFrame({"title": features_df.columns, "mean_rating": [3.75, 3.0], "totalRatingCount": [2, 2]})
+    with open(tmp_path / "corr_model_small.pkl", "wb") as f:
+        pickle.dump((features_df, None, all_ratings, features_df.columns.values), f)
+    cache = ResponseCache()
+    movie_recommend = MovieRecommend("corr", "small", 2, ModelRegistry(str(tmp_path)), cache)
+
+    first_line, _ = movie_recommend.launch("Terminater")
+    assert movie_recommend.launch("TERMINATER")[0] != first_line
+    assert len(cache) == 0
+    assert movie_recommend.launch_profile(["Heat (1995)", "Terminater"])[0] == "ok"
+    assert len(cache) == 0
+
+
+def test_updated_artifact_is_reloaded(tmp_path, synthetic_dataset):
+    produce_artifacts({"small": 20}, ["corr"], str(tmp_path), n_neighbors=5, memory_limit_mb=64,
+                      fetch_files=lambda db_size: synthetic_dataset)
+    registry = ModelRegistry(str(tmp_path))
+    cache = ResponseCache()
+    features = registry.get("corr", "small").features_df
+    movie = features.titles[0]
+
+    first = MovieRecommend("corr", "small", 5, registry, cache).launch(movie)
+    assert MovieRecommend("corr", "small", 5, registry, cache).launch(movie)[1].equals(first[1])
+    assert cache.hits == 1
+
+    # New users love the movie and the last movies of the model: its correlations change
+    movies_df = pd.read_csv(synthetic_dataset[0])
+    movie_ids = movies_df.set_index("title").loc[[movie, *features.titles[-3:]], "movieId"]
+    delta = pd.DataFrame({
+        "userId": np.repeat([f"new{i}" for i in range(30)], len(movie_ids)),
+        "movieId": np.tile(movie_ids.astype(str), 30),
+        "rating": np.tile([5.0, 4.5, 5.0, 4.0], 30).astype(np.float32),
+    })
+    update_artifact(str(tmp_path / "corr_model_small"), delta)
+
+    updated = MovieRecommend("corr", "small", 5, registry, cache).launch(movie)
+    fresh = MovieRecommend("corr", "small", 5, ModelRegistry(str(tmp_path)), None).launch(movie)
+    assert cache.invalidations == 1
+    assert_frame_equal(updated[1], fresh[1])
+    assert not updated[1].equals(first[1])
@@ -0,0 +1,80 @@
+"""
+This script contains unit tests for the result_table module. Recommendation tables are assembled by gathering the
+ratings of their titles from arrays by row position instead of joining with the whole ratings table, and are formatted
+to strings column by column.
+
+The script defines a fixture that creates a sample ratings table with float32 mean ratings and a titles array of a
+rating matrix, including a title without ratings. The tests assert that the tables are equal to the ones built with
+a join on the ratings table, that the rendered tables have the string of every value and '--' for missing values, and that
+top_positions orders scores as a descending sort with missing scores last.
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from movie_recommend.utils.recommendation_algorithms import top_positions
+from movie_recommend.utils.result_table import neighbors_table, rating_lookup, render_table, titles_table
+
+
+@pytest.fixture
+def sample_ratings():
+    rng = np.random.default_rng(5)
+    all_ratings = pd.DataFrame({
+        "title": [f"Movie {i}" for i in range(50)],
+        "mean_rating": (rng.integers(1, 11, size=50) / 2 + rng.random(50)).astype(np.float32),
+        "totalRatingCount": rng.integers(1, 500, size=50),
+    })
+    titles = np.array([f"Movie {i}" for i in range(0, 50, 2)] + ["No ratings"], dtype=object)
+    return all_ratings, titles
+
+
+def joined_table(titles, score_name, scores, all_ratings):
+    table = pd.DataFrame({"title": titles, score_name: scores})
+    table = table.join(all_ratings.set_index("title"), on="title")
+    return table.reindex(columns=["title", "mean_rating", "totalRatingCount", score_name])
+
+
+def rendered(table):
+    """Table formatted value by value: 'str()' of the values, integer counts, '--' for missing values."""
+    strings = pd.DataFrame(index=range(1, len(table.index) + 1))
+    for name in table.columns:
+        values = table[name].to_numpy()
+        if name == "totalRatingCount":
+            strings[name] = ["--" if pd.isna(value) else str(int(value)) for value in values]
+        else:
+            strings[name] = ["--" if pd.isna(value) else str(value) for value in values]
+    return strings
+
+
+@pytest.mark.parametrize("positions", [[3, 0, 7], [25, 1, 25, 4]])
+def test_neighbors_table(sample_ratings, positions):
+    all_ratings, titles = sample_ratings
+    scores = np.linspace(0.1, 0.9, len(positions))
+    scores[-1] = np.nan
+    table = neighbors_table(titles, np.array(positions), "distance", scores, all_ratings)
+    expected = joined_table(titles[positions], "distance", scores, all_ratings)
+    assert_frame_equal(table, expected)
+    assert_frame_equal(render_table(table), rendered(expected), check_dtype=False, check_index_type=False)
+    # The rows of the titles array are computed once
+    assert rating_lookup(all_ratings) is rating_lookup(all_ratings)
+
+
+def test_titles_table(sample_ratings):
+    all_ratings, _ = sample_ratings
+    titles = ["Movie 9", "Unknown", "Movie 1"]
+    table = titles_table(titles, "similarity_score", np.array([90, 80, 70]), all_ratings, known_only=True)
+    expected = pd.DataFrame({"title": titles, "similarity_score": [90, 80, 70]}).merge(all_ratings, on="title")
+    assert_frame_equal(table, expected.reindex(columns=table.columns))
+    assert list(render_table(table).index) == [1, 2]
+
+
+def test_top_positions():
+    scores = np.array([0.5, np.nan, 0.9, 0.5, -0.2, np.nan, 0.9, 0.1])
+    assert list(top_positions(scores, 3)) == [2, 6, 0]
+    assert list(top_positions(scores, 4)) == [2, 6, 0, 3]
+    assert list(top_positions(scores, 8)) == [2, 6, 0, 3, 7, 4, 1, 5]
+    assert list(top_positions(np.full(4, np.nan), 2)) == [0, 1]
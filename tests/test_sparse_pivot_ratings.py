@@ -0,0 +1,47 @@
+"""
+This script contains a unit test function to test the sparse_pivot_ratings function in the table_formatting module.
+The sparse_pivot_ratings function builds the "Title vs Users" matrix of ratings directly as a sparse CSR matrix from
+integer codes of titles and users, instead of a dense pivot table.
+
+The script defines a fixture that creates a sample table of ratings per user, including a movie without ratings and two
+movies sharing the same title. The test function asserts that the sparse matrix, its titles and its users match the
+pivot table created by the pivot_ratings function.
+
+To run the test, execute the test_sparse_pivot_ratings function.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import movie_recommend.constants as c
+from movie_recommend.utils.table_formatting import pivot_ratings, sparse_pivot_ratings
+
+
+@pytest.fixture
+def rating_movie_per_user():
+    return pd.DataFrame(
+        {
+            "movieId": ["1", "1", "2", "2", "3", "4", "5", "6", "6"],
+            "title": [
+                "Toy Story", "Toy Story", "Heat", "Heat", "Emma (1996)", "Unrated",
+                "Emma (1996)", "Jumanji", "Jumanji",
+            ],
+            "userId": ["1", "10", "2", "10", "1", np.nan, "1", "2", "3"],
+            "rating": [4.0, 3.5, 5.0, 2.0, 3.0, np.nan, 4.5, 1.0, 0.5],
+        }
+    )
+
+
+def test_sparse_pivot_ratings(rating_movie_per_user):
+    expected = pivot_ratings(rating_movie_per_user.copy(), index=c.TITLE, columns=c.USER_ID)
+
+    features = sparse_pivot_ratings(rating_movie_per_user)
+
+    assert list(features.titles) == list(expected.index)
+    assert list(features.users) == list(expected.columns)
+    # Ratings are stored in half stars
+    assert features.matrix.dtype == np.uint8
+    np.testing.assert_array_equal(features.ratings(np.float64).toarray(), expected.fillna(0).to_numpy())
+    # The duplicated title is averaged
+    assert features.ratings()[features.get_loc("Emma (1996)"), 0] == 3.75
@@ -0,0 +1,60 @@
+"""
+This script contains unit tests for the synthetic_data module. The generate_dataset function writes MovieLens-shaped
+movies and ratings CSV files of any size, in blocks of users, with power-law movie popularity and user activity.
+
+The script uses the synthetic_dataset fixture of conftest.py. The tests assert that the files have the schema read by
+get_db, that the output depends only on the seed and not on the block size, that the distributions have the expected
+shapes, and that the files can be used in place of a download by the artifact pipeline.
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import numpy as np
+import pandas as pd
+
+from movie_recommend.utils.artifact_pipeline import produce_artifacts
+from movie_recommend.utils.artifact_store import read_artifact
+from movie_recommend.utils.get_databases import read_tables
+from movie_recommend.utils.synthetic_data import generate_dataset
+
+
+def test_schema(synthetic_dataset):
+    movies_path, ratings_path = synthetic_dataset
+    assert open(movies_path).readline().strip() == "movieId,title,genres"
+    assert open(ratings_path).readline().strip() == "userId,movieId,rating,timestamp"
+
+    movies_df, rating_df = read_tables(movies_path, ratings_path, compact=True)
+    assert len(movies_df.index) == 300 and movies_df["title"].is_unique
+    assert set(rating_df["movieId"]) <= set(movies_df["movieId"])
+    assert set(rating_df["rating"]) <= set(np.arange(1, 11) / 2)
+    assert not rating_df.duplicated(["userId", "movieId"]).any()
+    assert rating_df["userId"].is_monotonic_increasing and rating_df["userId"].nunique() == 1000
+
+
+def test_deterministic(tmp_path, synthetic_dataset):
+    # Same seed, smaller blocks: the same files
+    generate_dataset(str(tmp_path / "a"), 300, 1000, 20_000, seed=1, block_rows=2000)
+    for name, path in zip(["movies.csv", "ratings.csv"], synthetic_dataset):
+        assert (tmp_path / "a" / name).read_bytes() == open(path, "rb").read()
+
+    generate_dataset(str(tmp_path / "b"), 300, 1000, 20_000, seed=2)
+    assert (tmp_path / "b" / "ratings.csv").read_bytes() != open(synthetic_dataset[1], "rb").read()
+
+
+def test_distributions(synthetic_dataset):
+    rating_df = pd.read_csv(synthetic_dataset[1])
+    assert 0.9 * 20_000 <= len(rating_df.index) <= 1.1 * 20_000
+
+    # A few movies get most ratings, and a few users rate much more than the others
+    movie_counts = rating_df.groupby("movieId").size().sort_values(ascending=False)
+    assert movie_counts.iloc[:30].sum() > 0.4 * len(rating_df.index)
+    user_counts = rating_df.groupby("userId").size()
+    assert user_counts.min() >= 5 and user_counts.max() > 5 * user_counts.median()
+    assert 3.0 < rating_df["rating"].mean() < 4.0
+
+
+def test_produce_artifacts_from_synthetic_files(tmp_path, synthetic_dataset):
+    produce_artifacts({"small": 20}, ["knn"], str(tmp_path), n_neighbors=5, memory_limit_mb=64,
+                      fetch_files=lambda db_size: synthetic_dataset)
+    artifact = read_artifact(str(tmp_path / "knn_model_small"))
+    assert 0 < len(artifact.features_df) < 300
@@ -0,0 +1,76 @@
+"""
+This script contains unit tests for the table_cache module and its use by get_db. The compact movies and rating tables
+are saved once as '.npy' columns next to the CSV files, and later calls of get_db read them from this cache, which is
+rebuilt when the ETag or Last-Modified value of the dataset changes.
+
+The script defines a fixture that writes small sample CSV files in the MovieLens format to a temporary dataset folder,
+with saved ETag and Last-Modified values and a recent check time, so that get_db doesn't check the source page. The tests assert that the cached
+tables are equal to the tables read from the CSV files, that only the requested rating columns are read, and that a
+new ETag invalidates the cache.
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+import movie_recommend.utils.get_databases as get_databases
+from movie_recommend.utils.get_databases import get_db, read_tables, save_check_time, save_current_values
+from movie_recommend.utils.table_cache import get_cache_dir, read_table_cache
+
+
+@pytest.fixture
+def dataset_dir(tmp_path, monkeypatch):
+    """Sample dataset folder used by get_db("small"), with saved ETag and Last-Modified values."""
+    dir_path = tmp_path / "ml-latest-small"
+    dir_path.mkdir()
+    pd.DataFrame({
+        "movieId": [1, 2, 3, 4],
+        "title": ["Toy Story (1995)", "Heat (1995)", "Emma (1996)", "Unrated (2001)"],
+        "genres": ["Animation", "Action", "Drama", "Drama"],
+    }).to_csv(dir_path / "movies.csv", index=False)
+    pd.DataFrame({
+        "userId": [1, 1, 2, 3, 3, 10],
+        "movieId": [1, 2, 1, 2, 3, 1],
+        "rating": [4.0, 3.5, 5.0, 2.0, 0.5, 3.0],
+        "timestamp": [0, 0, 0, 0, 0, 0],
+    }).to_csv(dir_path / "ratings.csv", index=False)
+    save_current_values(str(dir_path / "last_etag.txt"), str(dir_path / "last_modified.txt"), '"v1"', "Mon")
+
+    monkeypatch.setattr(get_databases.c, "DATA_SMALL_DIR", str(dir_path))
+    monkeypatch.setattr(get_databases.c, "DATA_DIR", str(tmp_path))
+    # The dataset was just checked at the source page
+    save_check_time(str(dir_path))
+    return dir_path
+
+
+def test_get_db_uses_cache(dataset_dir):
+    movies_csv, ratings_csv = read_tables(str(dataset_dir / "movies.csv"), str(dataset_dir / "ratings.csv"), True)
+    movies_df, rating_df = get_db("small", compact=True)
+    assert os.path.exists(get_cache_dir(str(dataset_dir)))
+
+    # The CSV files aren't parsed anymore
+    os.remove(dataset_dir / "ratings.csv")
+    (dataset_dir / "ratings.csv").write_text("")
+    movies_cached, rating_cached = get_db("small", compact=True)
+    for cached, expected in [(movies_cached, movies_csv), (rating_cached, ratings_csv), (movies_df, movies_csv)]:
+        pd.testing.assert_frame_equal(cached, expected)
+
+    _, ratings_projected = get_db("small", compact=True, rating_columns=["movieId", "rating"])
+    assert list(ratings_projected.columns) == ["movieId", "rating"]
+
+
+def test_cache_invalidated_by_etag(dataset_dir):
+    get_db("small", compact=True)
+    cache_dir = get_cache_dir(str(dataset_dir))
+    assert read_table_cache(cache_dir, {"etag": '"v1"', "last_modified": "Mon"}) is not None
+    assert read_table_cache(cache_dir, {"etag": '"v2"', "last_modified": "Mon"}) is None
+
+    # A new ETag rebuilds the cache from the CSV files
+    save_current_values(str(dataset_dir / "last_etag.txt"), str(dataset_dir / "last_modified.txt"), '"v2"', "Mon")
+    pd.DataFrame({"userId": [5], "movieId": [4], "rating": [1.0]}).to_csv(dataset_dir / "ratings.csv", index=False)
+    _, rating_df = get_db("small", compact=True)
+    assert rating_df["movieId"].tolist() == [4]
+    assert read_table_cache(cache_dir, {"etag": '"v2"', "last_modified": "Mon"}) is not None
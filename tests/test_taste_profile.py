@@ -0,0 +1,234 @@
+"""
+This script contains unit tests for the taste profile recommendations: movies recommended for a list of liked movies
+(and optionally disliked ones), all scored at once. With the KNN model, the score of a movie is its mean cosine
+similarity with the liked movies minus its mean similarity with the disliked ones, computed with one sparse product;
+with the Pearson correlation model, it is its correlation with the centered ratings of the profile movies, computed in
+one correlation pass.
+
+The script uses the synthetic_dataset fixture of conftest.py. The tests compare the scores with the similarities
+computed movie by movie and the correlations computed by pandas, and assert that a profile of one liked movie gives the
+recommendations of this movie. They also check the messages for ignored titles, the exclusion of the profile movies, the cache of the
+responses, the exact search built once for profiles without a KNN model and the /recommend_profile route of the ASGI app
+(invalid bodies answered with a 400 status).
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import json
+import asyncio
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import movie_recommend.asgi_app as asgi_app
+from movie_recommend.model_types import ModelTypeKnn
+from movie_recommend.movie_recommendations import MovieRecommend
+from movie_recommend.utils.artifact_pipeline import prepare_dataset, produce_artifacts
+from movie_recommend.utils.artifact_store import load_dataset
+from movie_recommend.utils.get_recommendations import STATUS_NOT_FOUND, STATUS_OK, get_profile_recommendations
+from movie_recommend.utils.model_registry import ModelRegistry
+from movie_recommend.utils.recommendation_algorithms import (
+    CosineNeighbors,
+    corr_min_periods,
+    pearson_correlations,
+    recommendation_knn,
+    recommendation_profile_corr,
+    recommendation_profile_knn
+)
+from movie_recommend.utils.response_cache import ResponseCache
+
+
+async def call(app, method: str, path: str, body: bytes = b""):
+    """Status, headers and body of the response of the ASGI app to a request."""
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app({"type": "http", "method": method, "path": path, "headers": []}, receive, send)
+    return sent[0]["status"], dict(sent[0]["headers"]), sent[1]["body"]
+
+
+@pytest.fixture(scope="module")
+def features(synthetic_dataset, tmp_path_factory):
+    shared_dir = str(tmp_path_factory.mktemp("shared"))
+    prepare_dataset("small", 10, shared_dir, memory_limit_mb=64, fetch_files=lambda db_size: synthetic_dataset)
+    return load_dataset(shared_dir)
+
+
+def expected_scores(similarities, n_liked):
+    """Mean similarity with the liked movies minus mean similarity with the disliked ones ('movies x profile')."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        liked = np.nanmean(similarities[:, :n_liked], axis=1)
+        disliked = np.nanmean(similarities[:, n_liked:], axis=1) if similarities.shape[1] > n_liked else 0.0
+    return liked - np.nan_to_num(disliked)
+
+
+def test_knn_single_liked_movie(features):
+    features, all_ratings, _ = features
+    model = CosineNeighbors(features.matrix)
+    movie = features.titles[3]
+
+    table = recommendation_profile_knn(features, model, [movie], [], 10, all_ratings)
+    _, expected = recommendation_knn(features, model, movie, 10, all_ratings)
+    assert list(table["title"]) == list(expected["title"])
+    np.testing.assert_allclose(table["profile_score"], 1 - expected["distance"], atol=1e-6)
+
+
+def test_knn_profile_scores(features):
+    features, all_ratings, _ = features
+    model = CosineNeighbors(features.matrix)
+    positions = [0, 7, 21, 40]
+    titles = list(features.titles[positions])
+
+    table = recommendation_profile_knn(features, model, titles[:3], titles[3:], 15, all_ratings)
+
+    scores = expected_scores(1 - model.distances(features.matrix[positions]).T, 3)
+    scores[positions] = -np.inf
+    top = np.argsort(-scores, kind="stable")[:15]
+    assert list(table["title"]) == list(features.titles[top])
+    np.testing.assert_allclose(table["profile_score"], scores[top], atol=1e-6)
+    assert not set(titles) & set(table["title"])
+
+
+def expected_corr_table(features, scores, positions, n_recommend):
+    """Titles and scores of the movies with the highest correlations, without the profile movies."""
+    scores = np.array(scores, dtype=np.float64)
+    scores[positions] = np.nan
+    top = np.argsort(-np.nan_to_num(scores, nan=-np.inf), kind="stable")[:n_recommend]
+    top = top[~np.isnan(scores[top])]
+    assert len(top) > 0
+    return list(features.titles[top]), scores[top]
+
+
+def test_corr_single_liked_movie(features):
+    features, all_ratings, _ = features
+    table = recommendation_profile_corr(features, [features.titles[4]], [], 15, all_ratings)
+
+    correlations, _ = pearson_correlations(features.matrix, 4, corr_min_periods(all_ratings))
+    titles, scores = expected_corr_table(features, correlations, [4], 15)
+    assert list(table["title"]) == titles
+    np.testing.assert_allclose(table["profile_score"], scores, atol=1e-9)
+
+
+def test_corr_profile_scores(features):
+    features, all_ratings, _ = features
+    positions = [2, 5, 30]
+    titles = list(features.titles[positions])
+
+    table = recommendation_profile_corr(features, titles[:2], titles[2:], 15, all_ratings)
+
+    # Profile rating of a user: mean of their centered ratings of the liked movies and opposite centered ratings of
+    # the disliked one; scores are the pairwise-complete correlations with it
+    ratings = pd.DataFrame(features.matrix.toarray(), index=features.titles).replace(0, np.nan).T
+    centered = ratings.iloc[:, positions] - ratings.iloc[:, positions].mean()
+    profile = (centered * [1, 1, -1]).mean(axis=1)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        correlations = ratings.corrwith(profile)
+    common = ratings.notna().astype(int).T @ profile.notna().astype(int)
+    correlations[common.values < corr_min_periods(all_ratings)] = np.nan
+
+    expected_titles, scores = expected_corr_table(features, correlations.values, positions, 15)
+    assert list(table["title"]) == expected_titles
+    np.testing.assert_allclose(table["profile_score"], scores, atol=1e-9)
+
+
+@pytest.mark.parametrize("model_type", ["knn", "corr"])
+def test_ignored_titles(features, model_type):
+    features, all_ratings, total_movie_array = features
+    model = CosineNeighbors(features.matrix) if model_type == "knn" else None
+    liked = [features.titles[0], "Unknown movie", features.titles[0]]
+
+    status, first_line, table = get_profile_recommendations(
+        features, liked, [features.titles[1]], 5, model_type, model, all_ratings, total_movie_array
+    )
+    assert status == STATUS_OK
+    assert first_line == 'Recommendations for 1 liked and 1 disliked movies (ignored titles: "Unknown movie"):'
+    assert list(table.index) == [1, 2, 3, 4, 5]
+    assert not {features.titles[0], features.titles[1]} & set(table["title"])
+
+    status, first_line, table = get_profile_recommendations(
+        features, ["Unknown movie"], [], 5, model_type, model, all_ratings, total_movie_array
+    )
+    assert status == STATUS_NOT_FOUND and '"Unknown movie"' in first_line
+    assert table.empty and list(table.columns)[-1] == "profile_score"
+
+
+def test_exact_model_built_once(features):
+    features, _, _ = features
+    model = CosineNeighbors(features.matrix)
+    assert ModelTypeKnn.exact_model(features, model) is model
+    # Without a KNN model, the exact search of the rating matrix is built on the first profile request only
+    exact = ModelTypeKnn.exact_model(features, None)
+    assert ModelTypeKnn.exact_model(features, None) is exact
+
+
+@pytest.fixture
+def registry(tmp_path_factory, synthetic_dataset, monkeypatch):
+    """Registry of KNN and correlation artifacts of the synthetic dataset, with an empty response cache."""
+    pkl_dir = tmp_path_factory.mktemp("profile")
+    produce_artifacts({"small": 20}, ["knn", "corr"], str(pkl_dir), n_neighbors=5, memory_limit_mb=64,
+                      fetch_files=lambda db_size: synthetic_dataset)
+    registry = ModelRegistry(str(pkl_dir))
+    monkeypatch.setattr(asgi_app, "registry", registry)
+    monkeypatch.setattr("movie_recommend.movie_recommendations.response_cache", ResponseCache())
+    return registry
+
+
+def test_launch_profile_cache(registry):
+    titles = list(registry.get("knn", "small").features_df.titles[:3])
+    cache = ResponseCache()
+    movie_recommend = MovieRecommend("knn", "small", n_recommend=8, model_registry=registry, cache=cache)
+
+    status, first_line, table = movie_recommend.launch_profile(titles[:2], titles[2:])
+    assert status == STATUS_OK and len(table) == 8
+
+    # The order of the titles doesn't matter, and fewer recommendations come from the cached table
+    smaller = MovieRecommend("knn", "small", n_recommend=4, model_registry=registry, cache=cache)
+    assert smaller.launch_profile(titles[1::-1], titles[2:])[2].equals(table.head(4))
+    assert cache.hits == 1
+
+
+def test_profile_route(registry):
+    titles = list(registry.get("corr", "small").features_df.titles[:3])
+    app = asgi_app.RecommendApp(db_size="small", workers=1, warm_up=False)
+
+    def body(data):
+        return json.dumps({"data": data}).encode()
+
+    async def requests():
+        profile = await call(app, "POST", "/recommend_profile", body(
+            {"liked": titles[:2], "disliked": titles[2:], "n_recommend": 6, "model_type": "corr"}
+        ))
+        liked_only = await call(app, "POST", "/recommend_profile", body(
+            {"liked": titles[:1], "n_recommend": 3, "model_type": "knn"}
+        ))
+        invalid = await call(app, "POST", "/recommend_profile", body(
+            {"liked": [], "n_recommend": 3, "model_type": "knn"}
+        ))
+        not_objects = [await call(app, "POST", "/recommend_profile", data) for data in (b'["a"]', body(titles))]
+        return profile, liked_only, invalid, not_objects
+
+    try:
+        profile, liked_only, invalid, not_objects = asyncio.run(requests())
+    finally:
+        app.stop()
+
+    assert profile[0] == 200
+    response = json.loads(profile[2])
+    assert response["status"] == "ok"
+    assert json.loads(response["json_string"])["message"].startswith("Recommendations for 2 liked and 1 disliked")
+    assert len(json.loads(response["json_table"])["data"]) <= 6
+
+    assert liked_only[0] == 200 and len(json.loads(json.loads(liked_only[2])["json_table"])["data"]) == 3
+    assert invalid[0] == 400
+    assert all(response[0] == 400 and json.loads(response[2]) == {"message": "Invalid request"}
+               for response in not_objects)
@@ -0,0 +1,139 @@
+"""
+This script contains unit tests for the title_search module. The TitleSearchIndex class is a character n-gram inverted
+index over normalized movie titles, used by recommendation_rename_movie to score only a small set of candidate titles
+with fuzz.partial_ratio instead of all titles. The TitleResolver class maps titles and their normalized variants to
+title positions with a dictionary lookup.
+
+The script defines a fixture that creates a sample list of movie titles. The tests assert that the indexed search
+returns the same top titles and similarity scores as a full scan of all titles (with ties in title order), including
+for misspelled and very short queries, that the indexed search finds the best similarity scores of a full scan of
+synthetic titles, and that recommendation_rename_movie returns the same scores with and without the index. The resolver tests assert that case-folded titles, titles without the year and MovieLens article-inversion
+forms resolve to the right (most rated) title, and that get_recommendations uses the resolved title.
+
+To run the tests, execute the test functions with pytest.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.sparse import csr_matrix
+from fuzzywuzzy import fuzz
+
+from movie_recommend.utils.get_recommendations import get_recommendations
+from movie_recommend.utils.rating_matrix import RatingMatrix
+from movie_recommend.utils.recommendation_algorithms import CosineNeighbors, recommendation_rename_movie
+from movie_recommend.utils.synthetic_data import generate_dataset
+from movie_recommend.utils.title_search import TitleResolver, TitleSearchIndex, strip_year
+
+
+@pytest.fixture
+def titles():
+    words = ["Star", "Wars", "Trek", "Terminator", "Rambo", "First", "Blood", "Brother", "Avatar", "Puss", "Boots",
+             "Night", "Day", "Return", "Jedi", "Empire", "Strikes", "Back", "Dark", "Knight", "Rises", "Toy", "Story"]
+    rng = np.random.default_rng(41)
+    titles = [
+        f"{' '.join(rng.choice(words, size=rng.integers(1, 5)))} ({rng.integers(1950, 2023)})" for _ in range(2000)
+    ]
+    titles += [
+        "Terminator, The (1984)", "Terminator 2: Judgment Day (1991)", "Star Wars: Episode IV - A New Hope (1977)",
+        "Robot Chicken: Star Wars (2007)", "Brother (Brat) (1997)", "Rambo: First Blood Part II (1985)",
+    ]
+    return list(dict.fromkeys(titles))
+
+
+def full_scan(query, titles, n_recommend):
+    query = strip_year(query)
+    scores = np.array([fuzz.partial_ratio(query, title) for title in titles])
+    best = np.argsort(-scores, kind="stable")[:n_recommend]
+    return [titles[i] for i in best], list(scores[best])
+
+
+def test_title_search_matches_full_scan(titles):
+    index = TitleSearchIndex.build(titles)
+
+    for query in ("Star Wars", "Terminater", "Rambo: First Blod (1982)", "Brat", "Puss in Boots (2011)", "Dy", "X"):
+        for n_recommend in (1, 5, 20):
+            positions, scores = index.search(query, n_recommend)
+            expected_titles, expected_scores = full_scan(query, titles, n_recommend)
+            assert list(scores) == expected_scores, query
+            assert list(index.titles[positions]) == expected_titles, query
+
+
+def test_title_search_matches_full_scan_synthetic(tmp_path):
+    movies_file, _ = generate_dataset(str(tmp_path), 3000, 100, 500, seed=5)
+    titles = list(pd.read_csv(movies_file)["title"])
+    index = TitleSearchIndex.build(titles)
+    rng = np.random.default_rng(1)
+    first, second = (rng.choice(len(titles), size=8, replace=False) for _ in range(2))
+
+    for i, j in zip(first, second):
+        title = strip_year(titles[i])
+        # Misspelled, partial and combined titles: long titles sharing many n-grams don't crowd out the best matches
+        queries = [title, title.replace("a", "e", 1)[:-1], " ".join(title.split()[:-1]),
+                   f"{title} and {strip_year(titles[j])}"]
+        for query in queries:
+            expected_scores = full_scan(query, titles, 10)[1]
+            for n_recommend in (1, 5, 10):
+                _, scores = index.search(query, n_recommend)
+                assert list(scores) == expected_scores[:n_recommend], query
+
+
+def test_recommendation_rename_movie_with_index(titles):
+    all_ratings = pd.DataFrame({
+        "title": titles,
+        "mean_rating": np.linspace(0.5, 5.0, len(titles)),
+        "totalRatingCount": np.arange(len(titles)),
+    })
+    index = TitleSearchIndex.build(titles)
+
+    message, table = recommendation_rename_movie("Terminater (1984)", titles, 10, all_ratings, index)
+    expected_message, expected_table = recommendation_rename_movie("Terminater (1984)", titles, 10, all_ratings)
+
+    assert message == expected_message
+    # Titles with equal scores may come in another order than with the full scan
+    assert list(table.columns) == list(expected_table.columns)
+    assert list(table["similarity_score"]) == list(expected_table["similarity_score"])
+
+
+def test_title_resolver():
+    titles = [
+        "Terminator, The (1984)", "Terminator 2: Judgment Day (1991)", "The Terminators (2009)", "Shining, The (1980)",
+        "Shining, The (1997)", "City of Lost Children, The (Cité des enfants perdus, La) (1995)", "Heat (1995)",
+    ]
+    resolver = TitleResolver.build(titles, {"Shining, The (1980)": 50, "Shining, The (1997)": 5})
+
+    expected = {
+        "Heat (1995)": "Heat (1995)",
+        "heat": "Heat (1995)",
+        "Terminator": "Terminator, The (1984)",
+        "The  Terminator (1984)": "Terminator, The (1984)",
+        "terminator, the": "Terminator, The (1984)",
+        "TERMINATOR 2: JUDGMENT DAY": "Terminator 2: Judgment Day (1991)",
+        "The Shining": "Shining, The (1980)",
+        "Shining, The (1997)": "Shining, The (1997)",
+        "The City of Lost Children": "City of Lost Children, The (Cité des enfants perdus, La) (1995)",
+        # Wrong year or partial titles are left to the fuzzy search
+        "Terminator (1991)": None,
+        "Terminators": None,
+    }
+    for query, title in expected.items():
+        assert resolver.resolve_title(query) == title, query
+
+
+def test_get_recommendations_with_title_resolver():
+    titles = np.array(["Terminator, The (1984)", "Heat (1995)", "Toy Story (1995)"], dtype=object)
+    matrix = csr_matrix(np.array([[4.0, 3.0, 5.0, 1.0], [3.5, 3.0, 4.0, 2.0], [1.0, 5.0, 0.5, 4.0]]))
+    features = RatingMatrix(matrix, titles, np.array(["1", "2", "3", "4"], dtype=object))
+    all_ratings = pd.DataFrame({"title": titles, "mean_rating": [3.25, 3.125, 2.625], "totalRatingCount": [4, 4, 4]})
+    model = CosineNeighbors(features.matrix)
+    resolver = TitleResolver.build(titles)
+
+    first_line, final_table = get_recommendations(
+        features, "the terminator", 2, "knn", model, all_ratings, titles, title_resolver=resolver
+    )
+    first_line_exact, final_table_exact = get_recommendations(
+        features, "Terminator, The (1984)", 2, "knn", model, all_ratings, titles, title_resolver=resolver
+    )
+
+    assert first_line == first_line_exact == 'Recommendations for "Terminator, The (1984)":'
+    assert final_table.equals(final_table_exact)